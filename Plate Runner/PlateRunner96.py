@@ -33,23 +33,47 @@ import tkMessageBox
 import tkFont
 import ttk
 import re
-alph="ABCDEFGHIJKLMNOP"
+import os
+import sys
+import argparse
+
+#the plates are laid out as in meltdown's reports, so the well names match
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "source"))
+from plateFormats import plateLayout, plateWellNames, rowName
+
+#the number of wells on the plate when none is given
+DEFAULT_WELLS = 96
+#widest the plate is drawn (pixels), wells are drawn smaller on plates with more columns
+MAX_PLATE_WIDTH = 600
+#wells smaller than this (pixels) only have every COLUMN_LABEL_STEP-th column numbered
+MIN_LABELLED_WELL_SIZE = 20
+COLUMN_LABEL_STEP = 4
+#characters of condition variable 1 shown in a well of the full size (50 pixels)
+WELL_LABEL_LENGTH = 6
 
 class PlateRunner:
-	def __init__(self, master):
+	def __init__(self, master, numWells=DEFAULT_WELLS):
 		self.master = master
-		master.title("PlateRunner386")
+		master.title("PlateRunner" + str(numWells))
 
 		self.wells = {}
 		self.wells_chem = {}
+		self.well_names = {}
+		self.well_labels = {}
 		self.scale = 50
 		self.species = []
 
+		#wells are drawn at the full scale unless the plate would be too wide
+		self.num_wells = numWells
+		self.rows, self.columns = plateLayout(numWells)
+		self.well_size = min(self.scale, MAX_PLATE_WIDTH/float(self.columns))
+		self.label_length = max(1, int(WELL_LABEL_LENGTH*self.well_size/self.scale))
+
 		#plate related things
 		#self.mainplate = Frame(master)
-		self.plate = Canvas(master, width=self.scale*12, height=self.scale*8, bd=0, highlightthickness=0)
-		self.platerefalph = Canvas(master, width=self.scale/2, height=self.scale*8, bd=0, highlightthickness=0)
-		self.platerefnum=Canvas(master, width=self.scale*12, height=self.scale/2, bd=0, highlightthickness=0)
+		self.plate = Canvas(master, width=self.well_size*self.columns, height=self.well_size*self.rows, bd=0, highlightthickness=0)
+		self.platerefalph = Canvas(master, width=self.scale/2, height=self.well_size*self.rows, bd=0, highlightthickness=0)
+		self.platerefnum=Canvas(master, width=self.well_size*self.columns, height=self.scale/2, bd=0, highlightthickness=0)
 
 		self.plate.xd=0
 		self.plate.yd=0
@@ -207,16 +231,23 @@ class PlateRunner:
 				return ""
 
 	def plate_create(self):
-		for c in range(12):
-			self.platerefnum.create_text(self.scale*(2*c+1)/2.0, self.scale/4, text=str(c+1))
-			for r in range(8):
-				x=self.plate.create_rectangle(self.scale*c+1, self.scale*r+1, self.scale*(c+1)-1, self.scale*(r+1)-1, fill="lightblue")
-				z=self.plate.create_text(self.scale*(2*c+1)/2.0, self.scale*(2*r+1)/2.0, text="", fill="black")
-				self.wells[8*c+r]=x
-				self.wells_chem[x]=""
-
-		for r in range(8):
-			self.platerefalph.create_text(self.scale/4, self.scale*(2*r+1)/2.0, text=alph[r])
+		size = self.well_size
+		#wells are numbered row by row, as their names from plateWellNames
+		for i, name in enumerate(plateWellNames(self.num_wells)):
+			r, c = divmod(i, self.columns)
+			x=self.plate.create_rectangle(size*c+1, size*r+1, size*(c+1)-1, size*(r+1)-1, fill="lightblue")
+			z=self.plate.create_text(size*(2*c+1)/2.0, size*(2*r+1)/2.0, text="", fill="black")
+			self.wells[i]=x
+			self.wells_chem[x]=""
+			self.well_names[x]=name
+			self.well_labels[x]=z
+
+		for c in range(self.columns):
+			if size >= MIN_LABELLED_WELL_SIZE or c == 0 or (c+1)%COLUMN_LABEL_STEP == 0:
+				self.platerefnum.create_text(size*(2*c+1)/2.0, self.scale/4, text=str(c+1))
+
+		for r in range(self.rows):
+			self.platerefalph.create_text(self.scale/4, size*(2*r+1)/2.0, text=rowName(r))
 
 	"""
 	def quadrant_create(self, wellno):
@@ -234,7 +265,7 @@ class PlateRunner:
 
 	#changing well colours
 	def filling(self, canvas):
-		for i in range(96):
+		for i in range(self.num_wells):
 			if self.wells[i] in canvas.dragged or self.wells[i] in canvas.selected:
 				canvas.itemconfig(self.wells[i], fill="red")
 			else:
@@ -307,18 +338,18 @@ class PlateRunner:
 			else:
 				x=""
 			for k in self.plate.selected:
-				if k%2==1:
+				if k in self.well_labels:
 					a = self.readvar(1) if self.readvar(1) != "*No Variable 1*" else ""
 					aa = self.readvar(1) if self.readvar(1) != "*No Variable 1*" else "EMPTY"
 					b = self.readvar(2) if self.readvar(2) != "*No Variable 2*" else ""
-					self.plate.itemconfig(k+1, text = a[:6])
+					self.plate.itemconfig(self.well_labels[k], text = a[:self.label_length])
 					self.wells_chem[k]=[aa, b, self.pH_input.get(), self.dpH_input.get(), x]
 
 	def unassign(self):
 		for k in self.plate.selected:
-			if k%2==1:
-				self.plate.itemconfig(k+1, text="")
-				self.wells_chem[(k+1)/2]=""
+			if k in self.well_labels:
+				self.plate.itemconfig(self.well_labels[k], text="")
+				self.wells_chem[k]=""
 
 	def enter(self, event):
 		self.assign()
@@ -329,14 +360,12 @@ class PlateRunner:
 	#create map
 	def create_map(self):
 		content_str = "Well	Condition Variable 1	Condition Variable 2	pH	d(pH)/dT	Control\n"
-		for i in self.wells_chem:
-			abc=alph[(i-1)%16/2]
-			xyz=str(int(i/16)+1)
-			content_str+=abc
-			content_str+=xyz
+		for i in range(self.num_wells):
+			x=self.wells[i]
+			content_str+=self.well_names[x]
 			content_str+="\t"
-			if self.wells_chem[i]!="":
-				for j in self.wells_chem[i]:
+			if self.wells_chem[x]!="":
+				for j in self.wells_chem[x]:
 					content_str+=j+"\t"
 			else:
 				content_str+="EMPTY\t\t\t\t\t"
@@ -353,8 +382,19 @@ class PlateRunner:
 		else:
 			tkMessageBox.showwarning("Error", "Failed to save content map.")
 
-root = Tk()
+def main():
+	parser = argparse.ArgumentParser(description="Creates meltdown contents maps for plates of any size")
+	parser.add_argument("--wells", type=int, default=DEFAULT_WELLS, help="number of wells on the plate (e.g. 96, 384 or 1536)")
+	args = parser.parse_args()
+	if args.wells < 1:
+		parser.error("a plate needs at least one well")
+
+	root = Tk()
+
+	main_gui = PlateRunner(root, args.wells)
 
-main_gui = PlateRunner(root)
+	root.mainloop()
 
-root.mainloop()
\ No newline at end of file
+#excecutes main() on file run
+if __name__ == "__main__":
+	sys.exit(main())
\ No newline at end of file
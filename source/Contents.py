@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
-import Tkinter, tkMessageBox
 
-class Contents:
+class Contents(object):
+    __slots__ = ('cv1', 'cv2', 'ph', 'dphdt', 'isControl')
+
     def __init__(self, cv1, cv2, ph, dphdt, isControl):
         #stores the contents of a well
         self.cv1 = cv1
@@ -14,6 +15,8 @@ class Contents:
 
 
 def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
     root = Tkinter.Tk()
     root.withdraw()
     tkMessageBox.showwarning("Inncorrect Usage", "Please run the 'RunMeltdown.bat' file from the same directory")
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+import os
+import colorsys
+
+from Contents import Contents
+from MeltdownException import MeltdownException
+
+#control names that we recognise in contents map (lower cased)
+LYSOZYME = 'lysozyme'
+NO_DYE = 'no dye'
+PROTEIN_AS_SUPPLIED = 'protein as supplied'
+NO_PROTEIN = 'no protein'
+
+#possible colours of plots
+COLOURS = ["Blue","DarkOrange","Green","Magenta","Cyan","Red",
+            "DarkSlateGray","Olive","LightSeaGreen","DarkMagenta","Gold","Navy",
+            "DarkRed","Lime","Indigo","MediumSpringGreen","DeepPink","Salmon",
+            "Teal","DeepSkyBlue","DarkOliveGreen","Maroon","GoldenRod","MediumVioletRed"]
+#condition variable 2's beyond the named colours get colours spread around the colour wheel, each hue this far
+#round from the last (the golden ratio, so hues next to each other in the list are never close), and cycling
+#through these (saturation, value) shades so that colours of similar hue can still be told apart
+HUE_STEP = 0.618033988749895
+SHADES = [(0.9, 0.8), (0.6, 0.55), (1.0, 0.95)]
+
+#contents maps that have already been read, keyed by (absolute path, modification time, size) of the file
+CACHE = {}
+
+#name of the column holding the well names
+WELL_COLUMN = 'Well'
+
+#cells that are treated as empty, the same as pandas (which contents maps used to be read with)
+EMPTY_CELLS = set(['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+                   '1.#IND', '1.#QNAN', 'N/A', 'NA', 'NULL', 'NaN', 'n/a', 'nan', 'null'])
+
+
+def columnValues(cells):
+    """
+    Converts the cells of a column the same way pandas did, so contents are compared and printed
+    as they always have been (e.g. a pH of "5" is printed as 5.0 if the pH column has empty cells)
+
+    Output: Returns the list of values, whole numbers if every cell is one, booleans or numbers if every
+    cell is one or empty, otherwise strings, with empty cells as ''
+    """
+    values = [None if cell in EMPTY_CELLS else cell for cell in cells]
+    present = [value for value in values if value is not None]
+    if len(present) == len(values):
+        try:
+            return [int(value) for value in values]
+        except ValueError:
+            pass
+    if len(present) > 0 and all(value in ('True', 'TRUE', 'true', 'False', 'FALSE', 'false') for value in present):
+        return ['' if value is None else value.lower() == 'true' for value in values]
+    try:
+        numbers = [float(value) for value in present]
+    except ValueError:
+        return ['' if value is None else value for value in values]
+    numbers.reverse()
+    return ['' if value is None else numbers.pop() for value in values]
+
+
+def conditionVariable2Colour(index):
+    #the colour of the index'th condition variable 2 of a contents map, a name from COLOURS or a hex colour
+    #(both of which matplotlib and reportlab understand), so there is no limit on how many there can be
+    if index < len(COLOURS):
+        return COLOURS[index]
+    index -= len(COLOURS)
+    saturation, value = SHADES[index % len(SHADES)]
+    red, green, blue = colorsys.hsv_to_rgb((index * HUE_STEP) % 1.0, saturation, value)
+    return '#%02x%02x%02x' % (int(round(red * 255)), int(round(green * 255)), int(round(blue * 255)))
+
+
+def readContentsMapFile(contentsMapFilePath):
+    """
+    Reads a tab delimited contents map, ignoring blank columns and rows without a well name
+
+    Output: Returns (list of well names, dictionary of column name to list of values (see columnValues))
+    """
+    try:
+        with open(contentsMapFilePath, 'rU') as fp:
+            rows = [line.rstrip('\r\n').split('\t') for line in fp]
+    except IOError as e:
+        raise MeltdownException('There was a problem reading the contents map file\n' + str(e))
+    if len(rows) == 0:
+        raise MeltdownException('There was a problem reading the contents map file\nThe file is empty')
+    header = [cell.strip() for cell in rows[0]]
+    header[0] = header[0].lstrip('\xef\xbb\xbf')
+    if WELL_COLUMN not in header:
+        raise MeltdownException('There was a problem reading the contents map file\nCould not find a "' + WELL_COLUMN + '" column')
+    wellIndex = header.index(WELL_COLUMN)
+    #rows without a well name are ignored (e.g. empty lines at the end of the file)
+    rows = [(row + [''] * len(header))[:len(header)] for row in rows[1:]]
+    rows = [row for row in rows if row[wellIndex].strip() not in EMPTY_CELLS]
+    wellNames = [row[wellIndex].strip() for row in rows]
+    #blank columns are ignored (default pcrd export includes empty columns sometimes), only the first of
+    #any columns with the same name is used
+    columns = {}
+    for i, name in enumerate(header):
+        if i != wellIndex and name != '' and 'Unnamed' not in name and name not in columns:
+            columns[name] = columnValues([row[i] for row in rows])
+    return wellNames, columns
+
+
+class ContentsMap:
+    def __init__(self, contentsMapFilePath):
+        #a parsed contents map, holding everything about the wells that doesn't depend on the data file,
+        #so that it can be shared by every plate that uses the same contents map
+        self.filePath = contentsMapFilePath
+        #well names in the order of the contents map, and a dict of well name to its Contents
+        self.wellNames = []
+        self.contents = {}
+        #lists of control names
+        self.lysozyme = []
+        self.noDye = []
+        self.proteinAsSupplied = {}
+        self.noProtein = []
+        #mapping of condition variable 2's to colour
+        self.cv2ColourDict = {}
+        #replicate dictionary, maps well name to name of all its replicate wells (including itself), the list
+        #of every group of replicates (the same list objects), and the index of the group of each well
+        self.repDict = {}
+        self.repGroups = []
+        self.groupIdOfWell = {}
+
+        #==================read the in the contents map, as a dictionary of column name to the column's values
+        self.wellNames, contentsMap = readContentsMapFile(contentsMapFilePath)
+        #==================
+
+        for column in ['Condition Variable 1', 'Condition Variable 2']:
+            if column not in contentsMap:
+                raise MeltdownException('Could not read "' + column + '" column from contents map')
+
+        self.__readContents(contentsMap)
+        #create a mapping of condition variable 2's to particular colours, to help with plotting
+        self.__assignConditionVariable2Colours(contentsMap)
+        #create a mapping of each well name to a list of wellnames that are replicates of itself (includeing itself)
+        self.__createRepDict(contentsMap)
+        return
+
+    def __readContents(self, contentsMap):
+        #as ph, dphdt, and control columns are not essential, if they are ommited, values take empty strings
+        columns = []
+        for column in ['Condition Variable 1', 'Condition Variable 2', 'pH', 'd(pH)/dT', 'Control']:
+            if column in contentsMap:
+                columns.append(contentsMap[column])
+            else:
+                columns.append([''] * len(self.wellNames))
+
+        for wellName, cv1, cv2, ph, dphdt, control in zip(self.wellNames, *columns):
+            #create Contents object for the well
+            wellContents = Contents(cv1, cv2, ph, dphdt, control)
+            #check if well is one of the 4 supported controls, and add name to appropriate list if that is the case
+            if wellContents.cv1.lower() == LYSOZYME:
+                #save each of the controls found to be lower cased, so they can be found later
+                #controls have a ph and and condition variable 2 set to null string ('') so they are easier to find
+                wellContents.cv1 = wellContents.cv1.lower()
+                self.lysozyme.append(wellName)
+                wellContents.isControl = 1
+                wellContents.ph = ''
+                wellContents.cv2 = ''
+            elif wellContents.cv1.lower() == NO_DYE:
+                wellContents.cv1 = wellContents.cv1.lower()
+                self.noDye.append(wellName)
+                wellContents.isControl = 1
+                wellContents.ph = ''
+                wellContents.cv2 = ''
+            elif wellContents.cv1.lower() == PROTEIN_AS_SUPPLIED:
+                wellContents.cv1 = wellContents.cv1.lower()
+                #can have multiple groupings of protein as supplied, save them in a dictionary of {condition variable 2 (how they're grouped) : list of wellNames}
+                if wellContents.cv2 not in self.proteinAsSupplied:
+                    self.proteinAsSupplied[wellContents.cv2] = [wellName]
+                else:
+                    self.proteinAsSupplied[wellContents.cv2].append(wellName)
+                wellContents.isControl = 1
+                wellContents.ph = ''
+            elif wellContents.cv1.lower() == NO_PROTEIN:
+                wellContents.cv1 = wellContents.cv1.lower()
+                self.noProtein.append(wellName)
+                wellContents.isControl = 1
+                wellContents.ph = ''
+                wellContents.cv2 = ''
+            self.contents[wellName] = wellContents
+        return
+
+    def __assignConditionVariable2Colours(self, contentsMap):
+        colourIndex=0
+        #for each unseen condition variable 2, map the next colour (see conditionVariable2Colour)
+        for cv2 in contentsMap['Condition Variable 2']:
+            #check if unseen condition variable 2
+            if cv2 not in self.cv2ColourDict:
+                self.cv2ColourDict[cv2] = conditionVariable2Colour(colourIndex)
+                colourIndex += 1
+        return
+
+    def __createRepDict(self, contentsMap):
+        #replicate defined as having same condition variables 1 and 2 as well as same ph (if there is a ph column)
+        keyColumns = ['Condition Variable 1', 'Condition Variable 2']
+        if 'pH' in contentsMap:
+            keyColumns.append('pH')
+        keys = zip(*[contentsMap[column] for column in keyColumns])
+        #one pass over the contents map, grouping wells by their key, groups are in the order they are first seen
+        groupIdOfKey = {}
+        for wellName, key in zip(self.wellNames, keys):
+            if key not in groupIdOfKey:
+                groupIdOfKey[key] = len(self.repGroups)
+                self.repGroups.append([])
+            self.repGroups[groupIdOfKey[key]].append(wellName)
+            self.groupIdOfWell[wellName] = groupIdOfKey[key]
+        #every well maps to its group's list of replicates (including itself)
+        for reps in self.repGroups:
+            for wellName in reps:
+                self.repDict[wellName] = reps
+        return
+
+    def contentsOfWell(self, wellName):
+        #get the well's contents, if it's in the contents map
+        try:
+            return self.contents[wellName]
+        except KeyError:
+            raise MeltdownException('Could not find matching Contents Map row for "' + wellName + '"')
+
+
+def loadContentsMap(contentsMapFilePath):
+    """
+    Gets the parsed contents map of a file, only reading the file if it hasn't been read
+    before (or has changed since), so every plate in a batch shares the same contents map
+
+    Output: Returns a ContentsMap
+    """
+    try:
+        fileStat = os.stat(contentsMapFilePath)
+    except OSError as e:
+        raise MeltdownException('There was a problem reading the contents map file\n' + str(e))
+    path = os.path.abspath(contentsMapFilePath)
+    key = (path, fileStat.st_mtime, fileStat.st_size)
+    if key not in CACHE:
+        contentsMap = ContentsMap(contentsMapFilePath)
+        #forget older versions of the same file
+        for oldKey in [oldKey for oldKey in CACHE if oldKey[0] == path]:
+            del CACHE[oldKey]
+        CACHE[key] = contentsMap
+    return CACHE[key]
+
+
+def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
+    root = Tkinter.Tk()
+    root.withdraw()
+    tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -2,27 +2,20 @@
 
 import csv
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import sys
-import Tkinter, tkMessageBox
-import cStringIO
+import json
+import gzip
+import numpy as np
 
 import replicateHandling as rh
-from DsfPlate import DsfPlate, LYSOZYME, PROTEIN_AS_SUPPLIED, SIMILARITY_THRESHOLD
+import curveClassification as cc
+import referenceCurves as rc
+from DsfPlate import DsfPlate, LYSOZYME, NO_DYE, PROTEIN_AS_SUPPLIED, NO_PROTEIN
+from DsfPlate import OUTLIERS, SATURATIONS, MONOTONICITIES, IN_THE_NOISES, TMS, COMPLEXITIES
+from DsfWell import MONOTONIC, COMPLEX, OUTLIER, IN_THE_NOISE, SATURATED, DISCARDED
 from MeanWell import MeanWell
-
-#reportlab needs to be installed separetly by anaconda, so a messagebox pops up alerting the user if it can't import
-try:
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import cm
-    from reportlab.lib.utils import ImageReader
-except:
-    root = Tkinter.Tk()
-    root.withdraw()
-    tkMessageBox.showerror("ReportLab not found", "You must use Anaconda to install reportlab before Meltdown can be run")
-    sys.exit(1)
+from MeltdownException import MeltdownException
+from runMetrics import StageTimer, READ_DATA, NEGATIVE_CONTROLS, MEAN_WELLS, REPORT_SUMMARY_GRAPH, REPORT_PLATE_MAP, \
+    REPORT_CURVE_GRAPHS, REPORT_SAVE
 
 #(mean, standard deviation) of lysozyme Tm over ~250 experiments
 LYSOZYME_TM_THRESHOLD = (70.8720, 0.7339)
@@ -33,56 +26,114 @@ RUNNING_LOCATION = os.path.dirname(os.path.realpath(__file__))
 #largest tm error before the estimate is considered unreliable
 MAX_TM_ERROR_BEFORE_UNRELIABLE = 1.5
 
+#the summary graph labels at most this many conditions (every nth condition on bigger plates), and its legend
+#has at most this many rows (more columns are used as there are more condition variable 2's)
+SUMMARY_GRAPH_MAX_LABELS = 64
+SUMMARY_GRAPH_MAX_LEGEND_ROWS = 6
+#plates with more wells than this get a page of every well's Tm drawn where it is on the plate (see reportPlots.plateMapFigure)
+PLATE_MAP_MIN_WELLS = 384
+#most condition variable 2's listed by a condition's graph, there is no room on the page for more
+MAX_CV2S_LISTED = 40
+#plates with more wells than PLATE_MAP_MIN_WELLS only get the graphs of this many of their most flagged conditions (see
+#__conditionFlags), every condition is listed in a table instead, with this many rows on each page
+MAX_CONDITION_GRAPHS = 24
+CONDITION_TABLE_ROWS_PER_PAGE = 50
+
+#changed whenever the layout of the results json changes, so programs reading it can tell
+RESULTS_FORMAT_VERSION = 1
+
+#formats the normalised curves can be written in, a tab delimited table or a numpy .npz file
+NORMALISED_TEXT = 'text'
+NORMALISED_BINARY = 'binary'
+
+
+def emptyAsNone(values):
+    #empty contents map cells ('') and numbers that weren't found (nan, or infinite) are None in the results tables
+    return [None if value == '' or (isinstance(value, float) and not np.isfinite(value)) else value for value in values]
+
+def reportlabFound():
+    #reportlab needs to be installed separetly by anaconda, reports can't be generated if it can't be imported.
+    #matplotlib and reportlab are only imported when a report is made, so runs without a report never load them
+    try:
+        import reportlab
+    except ImportError:
+        return False
+    return True
+
+
 class DsfAnalysis:
-    def __init__(self, analysisName):
+    def __init__(self, analysisName, tmRefinement=cc.TM_REFINEMENT, tmDecimalPlaces=cc.TM_DECIMAL_PLACES):
         #initialisations
         self.name = analysisName
+        #how the tms are refined from the derivative curves, see curveClassification.findTms
+        self.tmRefinement = tmRefinement
+        self.tmDecimalPlaces = tmDecimalPlaces
         self.plate = None
         self.meanWells = []
         self.contentsHash = {}
+        #the plate's results version that the mean wells were made from, None if they haven't been made
+        self.meanWellsVersion = None
         self.controlsHash = {"lysozyme": "Not Found",
                              "no dye": "Not Found",
                              "no protein": "Not Found"}
+        #how long each stage of the analysis took, see runMetrics
+        self.timer = StageTimer()
         return
         
-    def loadCurves(self, dataFilePath, contentsMapFilePath):
-        #create the DsfPlate object
-        self.plate = DsfPlate(dataFilePath, contentsMapFilePath)
+    def loadCurves(self, dataFilePath, contentsMapFilePath, useCache=False):
+        #create the DsfPlate object, reading the data from (and saving it to) a cache next to the file if useCache is set
+        self.plate = self.timer.time(READ_DATA, DsfPlate, dataFilePath, contentsMapFilePath, useCache)
         return
     
-    def analyseCurves(self):
-        #perform analysis on the plate, note order here is important
-        self.plate.computeOutliers()
-        self.plate.computeSaturations()
-        self.plate.computeMonotonicities()
+    def setThresholds(self, **thresholds):
+        #change thresholds of the analysis (see DsfPlate.THRESHOLD_STAGES), the next output only
+        #reruns the stages that use them, and the stages after
+        self.plate.setThresholds(**thresholds)
+        return
+    
+    def analyseWells(self):
+        #perform analysis on the plate's wells, note order here is important. Stages that are already
+        #up to date with the plate's thresholds are not redone, so this is quick to call again
+        self.timer.time(OUTLIERS, self.plate.computeOutliers)
+        self.timer.time(SATURATIONS, self.plate.computeSaturations)
+        self.timer.time(MONOTONICITIES, self.plate.computeMonotonicities)
         #no protein control must be done before computing in the noise, as if it fails, in the noise cannot be checked
-        self.__doNegativeControls()
-        if self.controlsHash["no protein"]=="Passed":
-            self.plate.computeInTheNoises()
-        self.plate.computeTms()
-        self.plate.computeComplexities()
+        self.timer.time(NEGATIVE_CONTROLS, self.doNegativeControls)
+        self.timer.time(IN_THE_NOISES, self.plate.computeInTheNoises, self.controlsHash["no protein"]=="Passed")
+        self.timer.time(TMS, self.plate.computeTms, self.tmRefinement, self.tmDecimalPlaces)
+        self.timer.time(COMPLEXITIES, self.plate.computeComplexities)
+        return
+    
+    def analyseCurves(self):
+        #the full analysis, the wells and then the mean wells and controls made from them. The outputs call this
+        #themselves, so it only needs calling directly to look at the results (e.g. the mean wells or controls)
+        self.analyseWells()
+        #the mean wells are only made again if the wells' results have changed since they were last made
+        if self.meanWellsVersion == self.plate.resultsVersion:
+            return
+        self.timer.start(MEAN_WELLS)
+        self.meanWells = []
+        self.contentsHash = {}
         #create the mean wells of replicates on the plate
         self.__createMeanWells()
         #create grouped hash for plotting
         self.__createMeanContentsHash()
         #check the controls on the plate
         self.__doPositiveControls()
+        self.meanWellsVersion = self.plate.resultsVersion
+        self.timer.stop(MEAN_WELLS)
         return
     
     def __createMeanWells(self):
-        seen = []
         #loop through each set of replicates
-        for wellName in self.plate.repDict.keys():
-            if wellName not in seen:
-                reps = self.plate.repDict[wellName]
-                seen += reps
-                #get mean tm and tm error (sd of tms)
-                tm, tmError = rh.meanSd([self.plate.wells[w].tm for w in reps if not self.plate.wells[w].isDiscarded])
-                complexMean = any([self.plate.wells[w].isComplex for w in reps if not self.plate.wells[w].isDiscarded])
-                numRepsNotDiscarded = sum([(not self.plate.wells[w].isDiscarded) for w in reps])
-                contents = self.plate.wells[wellName].contents
-                #create a mean well and add it to list
-                self.meanWells.append(MeanWell(tm, tmError, complexMean, reps, numRepsNotDiscarded, contents))
+        for reps in self.plate.repGroups:
+            #get mean tm and tm error (sd of tms)
+            tm, tmError = rh.meanSd([self.plate.wells[w].tm for w in reps if not self.plate.wells[w].isDiscarded])
+            complexMean = any([self.plate.wells[w].isComplex for w in reps if not self.plate.wells[w].isDiscarded])
+            numRepsNotDiscarded = sum([(not self.plate.wells[w].isDiscarded) for w in reps])
+            contents = self.plate.wells[reps[0]].contents
+            #create a mean well and add it to list
+            self.meanWells.append(MeanWell(tm, tmError, complexMean, reps, numRepsNotDiscarded, contents))
         return
     
     def __createMeanContentsHash(self):
@@ -91,66 +142,40 @@ class DsfAnalysis:
         for well in self.meanWells:
             contents = well.contents
             #build the nested hashmaps as we go through the wells, start with cv1,ph tuple
-            if (contents.cv1, contents.ph) not in self.contentsHash.keys():
+            if (contents.cv1, contents.ph) not in self.contentsHash:
                 self.contentsHash[(contents.cv1, contents.ph)] = {}
             #then cv2, which maps to the mean well itself
-            if contents.cv2 not in self.contentsHash[(contents.cv1,contents.ph)].keys():
+            if contents.cv2 not in self.contentsHash[(contents.cv1,contents.ph)]:
                 self.contentsHash[(contents.cv1,contents.ph)][contents.cv2] = well
         return
     
-    def __doNegativeControls(self):
+    def __meanCurve(self, wellNames):
+        #mean of the curves of the wells that are not outliers, None if they all are
+        rows = [self.plate.wells[wellName].index for wellName in wellNames if not self.plate.wells[wellName].isOutlier]
+        if len(rows) == 0:
+            return None
+        return self.plate.fluorescence[rows].sum(axis=0) / len(rows)
+
+    def __checkNegativeControl(self, wellNames, controlName):
+        #compare the mean curve of the control against its expected curve, resampled onto the plate's temperatures
+        meanCurve = self.__meanCurve(wellNames)
+        #if all the curves are outliers, the control check fails
+        if meanCurve is None:
+            return "Failed"
+        distance = rc.getReferenceCurve(controlName).distanceTo(meanCurve, self.plate.temperatures)
+        #if the curves are within required distance from one another, the control is passed
+        if distance is not None and distance < self.plate.thresholds['SIMILARITY_THRESHOLD']:
+            return "Passed"
+        return "Failed"
+
+    def doNegativeControls(self):
+        #public, so the stages of the analysis can be run (and timed) one at a time, see meltdownBenchmark
         #check if no dye control is present
         if len(self.plate.noDye)>0:
-            #create a mean curve out of the replicates that are not outliers
-            #initialise the mean curve sum to all zeros
-            meanNoDyeCurve = [0 for x in self.plate.wells[self.plate.noDye[0]].temperatures]
-            validCurvesInSum = 0
-            for wellName in self.plate.noDye:
-                well = self.plate.wells[wellName]
-                #creates sum of curves being used
-                if not well.isOutlier:
-                    meanNoDyeCurve = [x+y for x,y in zip(well.fluorescence, meanNoDyeCurve)]
-                    validCurvesInSum += 1
-            #divide sum to give average curve
-            meanNoDyeCurve = [x/validCurvesInSum for x in meanNoDyeCurve]
-            
-            #read in expected no dye control from file
-            noDyeExpected = list(pd.Series.from_csv(RUNNING_LOCATION + "/../data/noDyeControl.csv"))
-            #if the curves are within required distance from one another, the control is passed
-            if rh.aitchisonDistance(meanNoDyeCurve, noDyeExpected) < SIMILARITY_THRESHOLD:
-                self.controlsHash["no dye"] = "Passed"
-            else:
-                self.controlsHash["no dye"] = "Failed"
-            ##print'no dye diff to ideal: ', rh.aitchisonDistance(meanNoDyeCurve, noDyeExpected)
-            
+            self.controlsHash["no dye"] = self.__checkNegativeControl(self.plate.noDye, NO_DYE)
         #check if no protein control is present
         if len(self.plate.noProtein)>0:
-            #create a mean curve out of the replicates that are not outliers
-            #initialise the mean curve sum to all zeros
-            meanNoProteinCurve = [0 for x in self.plate.wells[self.plate.noProtein[0]].temperatures]
-            validCurvesInSum = 0
-            for wellName in self.plate.noDye:
-                well = self.plate.wells[wellName]
-                #creates sum of curves being used
-                if not well.isOutlier:
-                    meanNoProteinCurve = [x+y for x,y in zip(well.fluorescence, meanNoProteinCurve)]
-                    validCurvesInSum += 1
-            #divide sum to give average curve
-            if validCurvesInSum != 0:
-                meanNoProteinCurve = [x/validCurvesInSum for x in meanNoProteinCurve]
-            #if all the curves are outliers, the control check fails
-            else:
-                self.controlsHash["no protein"] = "Failed"
-                return
-            
-            #read in the expected curve for the no protein control
-            noProteinExpected = list(pd.Series.from_csv(RUNNING_LOCATION + "/../data/noProteinControl.csv"))
-            #if the curves are within required distance from one another, the control is passed
-            if rh.aitchisonDistance(meanNoProteinCurve, noProteinExpected) < SIMILARITY_THRESHOLD:
-                self.controlsHash["no protein"] = "Passed"
-            else:
-                self.controlsHash["no protein"] = "Failed"
-            ##print 'no protein diff to ideal: ',rh.aitchisonDistance(meanNoProteinCurve, noProteinExpected)
+            self.controlsHash["no protein"] = self.__checkNegativeControl(self.plate.noProtein, NO_PROTEIN)
         return
     
     def __doPositiveControls(self):
@@ -167,27 +192,54 @@ class DsfAnalysis:
                 self.controlsHash["lysozyme"] = "Failed"
         return
     
-    def produceNormalisedOutput(self, filePath):
-        #names of all the wells in sorted order
-        sortedWellNames = sorted(self.plate.wells.keys())
-        #list of temperatures, taken from first well since all have the same temperature list
-        temperatures = self.plate.wells.values()[0].temperatures
+    def produceNormalisedOutput(self, filePath, dataFormat=NORMALISED_TEXT, floatFormat='', compress=False):
+        """
+        Writes the normalised curves of every well, in sorted order. The text format is a tab delimited
+        table with a row per temperature and a column per well, the binary format is a numpy .npz file
+        of the well names, temperatures, and (wells, temperatures) array of the curves
         
-        with open(filePath, 'w') as fp:
-            fWriter = csv.writer(fp, delimiter='\t')
-            fWriter.writerow(['Temperature'] + sortedWellNames)
-            for i in range(len(temperatures)):
-                #start each row with the temperature
-                row = [temperatures[i]]
-                #create each row as the value at that temperature on each well
-                for wellName in sortedWellNames:
-                    row.append(self.plate.wells[wellName].fluorescence[i])
-                
-                #write to the file
-                fWriter.writerow(row)
+        Input: the file path, the format, the % format of the numbers in a text file (e.g. '%.6g', the
+        default '' writes them exactly), and whether to gzip a text file or compress a binary one
+        """
+        #the normalised curves are made when the plate is loaded, so no analysis is needed
+        wellNames = self.plate.wellNames
+        order = sorted(range(len(wellNames)), key=lambda i: wellNames[i])
+        sortedWellNames = [wellNames[i] for i in order]
+        
+        if dataFormat == NORMALISED_BINARY:
+            save = np.savez_compressed if compress else np.savez
+            with open(filePath, 'wb') as fp:
+                save(fp, wellNames=np.array(sortedWellNames), temperatures=self.plate.temperatures,
+                     fluorescence=self.plate.fluorescence[order])
+            return
+        if dataFormat != NORMALISED_TEXT:
+            raise MeltdownException('Unknown normalised data format "' + dataFormat + '", it must be ' + NORMALISED_TEXT + ' or ' + NORMALISED_BINARY)
+        
+        #start each row with the temperature, then the value at that temperature of each well
+        rows = np.column_stack((self.plate.temperatures, self.plate.fluorescence[order].T)).tolist()
+        #the rows are written with the same line endings as csv.writer
+        if floatFormat:
+            rowFormat = '\t'.join([floatFormat] * (len(sortedWellNames) + 1)) + '\r\n'
+            try:
+                lines = [rowFormat % tuple(row) for row in rows]
+            except (TypeError, ValueError):
+                raise MeltdownException('"' + floatFormat + '" is not a number format that the normalised data can be written with, e.g. %.6g')
+        else:
+            #exact values, as csv.writer writes them
+            lines = ['\t'.join(map(repr, row)) + '\r\n' for row in rows]
+        
+        if compress:
+            fp = gzip.open(filePath, 'wb', compresslevel=6)
+        else:
+            fp = open(filePath, 'w')
+        with fp:
+            fp.write('\t'.join(['Temperature'] + sortedWellNames) + '\r\n')
+            fp.writelines(lines)
         return
 
     def produceExportedTmData(self, filePath):
+        #only the analysis needed for the mean tms is done, if it hasn't been already
+        self.analyseCurves()
         #gets a sorted by ph list of (condition var 1, ph) tuples. these are unique, and do not include controls
         cv1PhPairs = sorted([key for key in self.contentsHash.keys() if any([not meanWell.contents.isControl for meanWell in self.contentsHash[key].values()])], key=lambda x: x[1])
 
@@ -204,7 +256,123 @@ class DsfAnalysis:
         
 
     
-    def generateReport(self, outputFilePath, version):
+    def wellTable(self):
+        """
+        The results of every well, in the order of the plate, only the wells are analysed for these
+        
+        Output: Returns a list of column names, and a dictionary of column name to the list of its values
+        """
+        self.analyseWells()
+        plate = self.plate
+        contents = [plate.wells[wellName].contents for wellName in plate.wellNames]
+        flagged = lambda flag: ((plate.status & flag) != 0).tolist()
+        columns = ["Well", "Cv1", "Cv2", "pH", "d(pH)/dT", "Control", "Replicate Group", "Tm",
+                   "Outlier", "Saturated", "Monotonic", "In The Noise", "Complex", "Discarded", "Monotonic Threshold"]
+        table = {"Well": list(plate.wellNames),
+                 "Cv1": emptyAsNone([c.cv1 for c in contents]),
+                 "Cv2": emptyAsNone([c.cv2 for c in contents]),
+                 "pH": emptyAsNone([c.ph for c in contents]),
+                 "d(pH)/dT": emptyAsNone([c.dphdt for c in contents]),
+                 "Control": [bool(c.isControl) for c in contents],
+                 "Replicate Group": plate.repGroupIds.tolist(),
+                 "Tm": emptyAsNone(plate.tms.tolist()),
+                 "Outlier": flagged(OUTLIER),
+                 "Saturated": flagged(SATURATED),
+                 "Monotonic": flagged(MONOTONIC),
+                 "In The Noise": flagged(IN_THE_NOISE),
+                 "Complex": flagged(COMPLEX),
+                 "Discarded": flagged(DISCARDED),
+                 "Monotonic Threshold": emptyAsNone(plate.wellMonotonicThresholds.tolist())}
+        return columns, table
+    
+    def meanWellTable(self):
+        """
+        The results of every group of replicates, in the order of the contents map
+        
+        Output: Returns a list of column names, and a dictionary of column name to the list of its values
+        """
+        self.analyseCurves()
+        columns = ["Cv1", "Cv2", "pH", "Control", "Tm", "Tm Error", "Complex", "Replicates", "Replicates Not Discarded"]
+        table = {"Cv1": emptyAsNone([meanWell.contents.cv1 for meanWell in self.meanWells]),
+                 "Cv2": emptyAsNone([meanWell.contents.cv2 for meanWell in self.meanWells]),
+                 "pH": emptyAsNone([meanWell.contents.ph for meanWell in self.meanWells]),
+                 "Control": [bool(meanWell.contents.isControl) for meanWell in self.meanWells],
+                 "Tm": [meanWell.tm for meanWell in self.meanWells],
+                 "Tm Error": emptyAsNone([None if meanWell.tmError is None else float(meanWell.tmError) for meanWell in self.meanWells]),
+                 "Complex": [meanWell.isComplex for meanWell in self.meanWells],
+                 "Replicates": [list(meanWell.replicates) for meanWell in self.meanWells],
+                 "Replicates Not Discarded": [meanWell.numReplicatesNotDiscarded for meanWell in self.meanWells]}
+        return columns, table
+    
+    def plateResults(self, version):
+        #the plate level results, and the options and thresholds they were found with
+        self.analyseCurves()
+        return {"Name": self.name,
+                "Meltdown Version": version,
+                "Wells": len(self.plate.wellNames),
+                "Temperatures": self.plate.temperatures.tolist(),
+                "Tm Refinement": self.tmRefinement,
+                "Tm Decimal Places": self.tmDecimalPlaces,
+                "Thresholds": dict(self.plate.thresholds),
+                "Plate Monotonic Threshold": float(self.plate.plateMonotonicThreshold),
+                "Noise Threshold": None if self.plate.noiseThreshold is None else float(self.plate.noiseThreshold),
+                "Controls": {"Lysozyme": self.controlsHash["lysozyme"],
+                             "No Dye": self.controlsHash["no dye"],
+                             "No Protein": self.controlsHash["no protein"]}}
+    
+    def produceWellStatusData(self, filePath):
+        #tab delimited table of every well's results, one row per well
+        columns, table = self.wellTable()
+        with open(filePath, 'w') as fp:
+            fWriter = csv.writer(fp, delimiter='\t')
+            fWriter.writerow(columns)
+            fWriter.writerows(zip(*[['' if value is None else value for value in table[column]] for column in columns]))
+        return
+    
+    def results(self, version):
+        #the plate, well and mean well results together, as written to the results json (the tables are stored by column)
+        wellColumns, wellTable = self.wellTable()
+        meanWellColumns, meanWellTable = self.meanWellTable()
+        return {"Format Version": RESULTS_FORMAT_VERSION,
+                "Plate": self.plateResults(version),
+                "Well Columns": wellColumns,
+                "Wells": wellTable,
+                "Mean Well Columns": meanWellColumns,
+                "Mean Wells": meanWellTable}
+    
+    def produceResultsJson(self, filePath, version):
+        #all the results in one json file, empty values are null
+        with open(filePath, 'w') as fp:
+            json.dump(self.results(version), fp, allow_nan=False)
+        return
+    
+    def __conditionFlags(self, meanWell):
+        #the problems with a condition's Tm that are worth looking at its curves for, an empty list if there are none
+        flags = []
+        #conditions with no Tm are always complex, so that isn't flagged as well
+        if meanWell.tm == None:
+            flags.append("No Tm")
+        elif meanWell.isComplex:
+            flags.append("Complex")
+        if meanWell.tmError != None and meanWell.tmError >= MAX_TM_ERROR_BEFORE_UNRELIABLE:
+            flags.append("Large error")
+        if meanWell.numReplicatesNotDiscarded < len(meanWell.replicates):
+            flags.append("Discarded " + str(len(meanWell.replicates) - meanWell.numReplicatesNotDiscarded))
+        return flags
+
+    def generateReport(self, outputFilePath, version, workers=1, vectorGraphs=False):
+        #the condition graphs are drawn in a pool of this many worker processes (0 uses every core),
+        #or the curve graphs are drawn as vector graphics instead of images if vectorGraphs is set
+        if not reportlabFound():
+            raise MeltdownException("You must use Anaconda to install reportlab before a report can be generated")
+        #reportPlots sets matplotlib's backend, so must be imported before pyplot
+        import reportPlots as rp
+        import matplotlib.pyplot as plt
+        from reportlab.pdfgen import canvas
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.units import cm
+        from reportlab.lib.utils import ImageReader
+        self.analyseCurves()
         #===================# headings and image #===================#
         #initialise the output pdf and print the heading and name of experiment
         pdf = canvas.Canvas(outputFilePath,pagesize=A4)
@@ -223,28 +391,17 @@ class DsfAnalysis:
         
         #===================# protein as supplied graph and Tm #===================#
         #create a plot for the protein as supplied control, and plot the curves
-        proteinAsSuppliedFigure = plt.figure(num=1,figsize=(5,4))
+        proteinAsSuppliedPlot = rp.CurvePlot(self.plate.temperatures)
         for cv2 in self.plate.proteinAsSupplied.keys():
             for wellName in self.plate.proteinAsSupplied[cv2]:
                 well = self.plate.wells[wellName]
-                if well.isDiscarded:
-                    #discarded curves are dotted
-                    plt.plot(well.temperatures, well.fluorescence, self.plate.cv2ColourDict[cv2], linestyle=":")
-                elif well.isComplex:
-                    #complex curves are dashed
-                    plt.plot(well.temperatures, well.fluorescence, self.plate.cv2ColourDict[cv2], linestyle="--")
-                else:
-                    #normal curves are full lines
-                    plt.plot(well.temperatures, well.fluorescence, self.plate.cv2ColourDict[cv2])
-        #hide y axis, as RFU units are arbitrary
-        plt.gca().axes.get_yaxis().set_visible(False)
-        #put the image on the pdf
-        imgdata = cStringIO.StringIO()
-        proteinAsSuppliedFigure.savefig(imgdata, format='png',dpi=140)
-        imgdata.seek(0)
-        Image = ImageReader(imgdata)
-        pdf.drawImage(Image, 0, 18*cm, 8*cm, 6*cm)
-        plt.close()
+                #discarded curves are dotted, complex curves are dashed, and normal curves are full lines
+                proteinAsSuppliedPlot.addCurve(well.fluorescence, self.plate.cv2ColourDict[cv2], rp.wellLinestyle(well))
+        #put the graph on the pdf
+        if vectorGraphs:
+            rp.drawCurvePlot(pdf, proteinAsSuppliedPlot, 0, 18*cm, 8*cm, 6*cm)
+        else:
+            pdf.drawImage(ImageReader(rp.renderCurvePlots([proteinAsSuppliedPlot])[0]), 0, 18*cm, 8*cm, 6*cm)
         
         #print the tm of the protein as supplied below its graph, if the control was found
         pdf.setFont("Helvetica",10)
@@ -375,7 +532,8 @@ class DsfAnalysis:
         #save the meanwell which gives the highest Tm, and put this on the page
         highestTmMeanWell = None
         #creates the graph figure
-        summaryGraphFigure = plt.figure(num=1,figsize=(10,8))
+        self.timer.start(REPORT_SUMMARY_GRAPH)
+        summaryGraphFigure = plt.figure(num=1,figsize=(10,8),dpi=180)
         
         for cv2 in uniqueCv2s:
             #the normal tms
@@ -453,22 +611,23 @@ class DsfAnalysis:
         
             
             
-        #label the axes
+        #label the axes, big plates only have every nth condition labelled so the labels can be read
         plt.ylabel('Tm')
-        plt.xticks([x for x in range(len(xAxisConditionLabels))], xAxisConditionLabels, rotation="vertical")
+        labelStep = max(1, int(np.ceil(len(xAxisConditionLabels) / float(SUMMARY_GRAPH_MAX_LABELS))))
+        plt.xticks([x for x in range(0, len(xAxisConditionLabels), labelStep)], xAxisConditionLabels[::labelStep], rotation="vertical")
         
-        #change the padding above the graph when legend gets bigger (i.e. there are more condition variable 2's)
-        plt.gcf().subplots_adjust(bottom=0.35, top=0.85 - 0.035*(int(len(uniqueCv2s)/3)))
+        #change the padding above the graph when legend gets bigger (i.e. there are more condition variable 2's),
+        #the legend gets more columns (in a smaller font) rather than more rows once it has SUMMARY_GRAPH_MAX_LEGEND_ROWS
+        legendColumns = max(3, int(np.ceil(len(uniqueCv2s) / float(SUMMARY_GRAPH_MAX_LEGEND_ROWS))))
+        plt.gcf().subplots_adjust(bottom=0.35, top=0.85 - 0.035*(int(len(uniqueCv2s)/legendColumns)))
         #plot the legend
-        plt.legend(legendHandles, uniqueCv2s, loc='lower center', bbox_to_anchor=(0.5, 1), ncol=3, fancybox=True, shadow=False, numpoints=1)
-        
-        #save the graph and print it on the pdf
-        imgdata = cStringIO.StringIO()
-        summaryGraphFigure.savefig(imgdata, format='png',dpi=180)
-        imgdata.seek(0)
-        Image = ImageReader(imgdata)
-        pdf.drawImage(Image, 2.5*cm, 4*cm, 16*cm, 11*cm)
+        plt.legend(legendHandles, uniqueCv2s, loc='lower center', bbox_to_anchor=(0.5, 1), ncol=legendColumns, fancybox=True, shadow=False, numpoints=1,
+                   fontsize='medium' if legendColumns == 3 else 'x-small')
+        
+        #draw the graph and print it on the pdf
+        pdf.drawImage(ImageReader(rp.figureImage(summaryGraphFigure)), 2.5*cm, 4*cm, 16*cm, 11*cm)
         plt.close()
+        self.timer.stop(REPORT_SUMMARY_GRAPH)
 
         #if there were any Tms computed as unreliable, print a warning above the graph
         pdf.setFillColor("black")
@@ -486,7 +645,86 @@ class DsfAnalysis:
             pdf.setFont("Helvetica",12)
         
         
+        #===================# plate map #===================#
+        #big plates get a page showing every well's Tm where it is on the plate, so the whole screen can be seen at once
+        if len(self.plate.wellNames) > PLATE_MAP_MIN_WELLS:
+            pdf.showPage()
+            self.timer.start(REPORT_PLATE_MAP)
+            plateMapFigure = rp.plateMapFigure(self.plate.wellNames, self.plate.tms, self.plate.flagged(DISCARDED), self.plate.flagged(COMPLEX))
+            pdf.drawImage(ImageReader(rp.figureImage(plateMapFigure)), 0.5*cm, 10*cm, 20*cm, 14.8*cm)
+            self.timer.stop(REPORT_PLATE_MAP)
+
+            pdf.setFillColor("black")
+            pdf.setFont("Helvetica-Bold",16)
+            pdf.drawString(cm,27*cm,"Plate Map")
+            pdf.setFont("Helvetica",10)
+            pdf.drawString(cm,26.3*cm,"Each well's Tm is shown where the well is on the plate, wells marked with a dot are complex.")
+            pdf.drawString(cm,25.8*cm,"Light grey wells have no Tm, dark grey wells were discarded.")
+            counts = [("Wells", len(self.plate.wellNames)),
+                      ("Tms found", int(np.count_nonzero(~np.isnan(self.plate.tms)))),
+                      ("Complex", int(np.count_nonzero(self.plate.flagged(COMPLEX)))),
+                      ("Discarded", int(np.count_nonzero(self.plate.flagged(DISCARDED)))),
+                      ("    Outliers", int(np.count_nonzero(self.plate.flagged(OUTLIER)))),
+                      ("    Saturated", int(np.count_nonzero(self.plate.flagged(SATURATED)))),
+                      ("    Monotonic", int(np.count_nonzero(self.plate.flagged(MONOTONIC)))),
+                      ("    In the noise", int(np.count_nonzero(self.plate.flagged(IN_THE_NOISE))))]
+            offset = 9
+            for name, count in counts:
+                pdf.drawString(2*cm,offset*cm,name + ":")
+                pdf.drawRightString(7*cm,offset*cm,str(count))
+                offset -= 0.5
+        
+        
+        #===================# condition table #===================#
+        #big plates would need hundreds of pages to draw every condition's graph, so only the most flagged conditions get
+        #graphs (the ones with the most flagged condition variable 2's first), and every condition is listed in a table
+        graphedPairs = cv1PhPairs
+        if len(self.plate.wellNames) > PLATE_MAP_MIN_WELLS:
+            numFlagged = dict([(pair, len([cv2 for cv2 in self.contentsHash[pair].keys() if self.__conditionFlags(self.contentsHash[pair][cv2])]))
+                               for pair in cv1PhPairs])
+            flaggedPairs = sorted([pair for pair in cv1PhPairs if numFlagged[pair] > 0], key=lambda pair: -numFlagged[pair])
+            graphedPairs = [pair for pair in cv1PhPairs if pair in set(flaggedPairs[:MAX_CONDITION_GRAPHS])]
+            
+            def fittedText(text, width):
+                #the text, cut short with '...' if it is wider than its column
+                if pdf.stringWidth(text, "Helvetica", 8) <= width:
+                    return text
+                while len(text) > 0 and pdf.stringWidth(text + "...", "Helvetica", 8) > width:
+                    text = text[:-1]
+                return text + "..."
+            
+            rows = [(cv1, ph, cv2) for cv1, ph in cv1PhPairs for cv2 in sorted(self.contentsHash[(cv1, ph)].keys())]
+            for start in range(0, len(rows), CONDITION_TABLE_ROWS_PER_PAGE):
+                pdf.showPage()
+                pdf.setFillColor("black")
+                pdf.setFont("Helvetica-Bold",16)
+                pdf.drawString(cm,28*cm,"Conditions")
+                pdf.setFont("Helvetica",10)
+                pdf.drawString(cm,27.3*cm,"Only the graphs of the " + str(len(graphedPairs)) + " most flagged of the " + str(len(cv1PhPairs)) +
+                               " conditions are drawn on plates of more than " + str(PLATE_MAP_MIN_WELLS) + " wells,")
+                pdf.drawString(cm,26.8*cm,"they are marked with a *. Every condition's Tm is listed here, and in the Tm data.")
+                pdf.setFont("Helvetica-Bold",8)
+                for x, heading in [(1, "Condition Variable 1"), (7.3, "pH"), (8.5, "Condition Variable 2"), (13, "Tm"), (14.3, "Tm Error"), (15.8, "Flags")]:
+                    pdf.drawString(x*cm,26*cm,heading)
+                pdf.setFont("Helvetica",8)
+                offset = 25.5
+                for cv1, ph, cv2 in rows[start:start + CONDITION_TABLE_ROWS_PER_PAGE]:
+                    meanWell = self.contentsHash[(cv1, ph)][cv2]
+                    pdf.drawString(0.6*cm,offset*cm,"*" if (cv1, ph) in graphedPairs else "")
+                    pdf.drawString(cm,offset*cm,fittedText(cv1, 6.1*cm))
+                    pdf.drawString(7.3*cm,offset*cm,fittedText(str(ph), 1.1*cm))
+                    pdf.drawString(8.5*cm,offset*cm,fittedText(cv2, 4.3*cm))
+                    pdf.drawString(13*cm,offset*cm,"None" if meanWell.tm == None else str(round(meanWell.tm,2)))
+                    pdf.drawString(14.3*cm,offset*cm,"" if meanWell.tmError == None else str(round(meanWell.tmError,2)))
+                    pdf.drawString(15.8*cm,offset*cm,", ".join(self.__conditionFlags(meanWell)))
+                    offset -= 0.45
+        
+        
         #===================# individual condition graphs #===================#
+        #nothing more to draw if none of the conditions get graphs
+        if len(graphedPairs) == 0:
+            self.timer.time(REPORT_SAVE, pdf.save)
+            return
         #start a new page
         pdf.showPage()
         pdf.setFont("Helvetica",10)
@@ -528,31 +766,32 @@ class DsfAnalysis:
             ypos = 1
             yNum = 1
         
+        #draw every condition's graph first (in parallel if there are workers), all with the same y axis
+        conditionPlots = []
+        for cv1, ph in graphedPairs:
+            conditionPlot = rp.CurvePlot(self.plate.temperatures, (minYValue-paddingSize,maxYValue+paddingSize))
+            for cv2 in sorted(self.contentsHash[(cv1, ph)].keys()):
+                for wellName in self.contentsHash[(cv1, ph)][cv2].replicates:
+                    well = self.plate.wells[wellName]
+                    #dotted line for discarded curves, dashed line for complex curves, full line for normal curves
+                    conditionPlot.addCurve(well.fluorescence, self.plate.cv2ColourDict[cv2], rp.wellLinestyle(well))
+            conditionPlots.append(conditionPlot)
+        if vectorGraphs:
+            conditionImages = [None] * len(conditionPlots)
+        else:
+            conditionImages = self.timer.time(REPORT_CURVE_GRAPHS, rp.renderCurvePlots, conditionPlots, workers)
+
         #first we loop the condition variable 1 / pH pairs
-        for cv1, ph in cv1PhPairs:
-            #the plotting figure used for current cv1/ph image
-            singleConditionFigure = plt.figure(num=1,figsize=(5,4))
+        for (cv1, ph), conditionPlot, conditionImage in zip(graphedPairs, conditionPlots, conditionImages):
             #start printing the tms at the top of the list, and assume no dph/dt is present for condition to begin with
             tmPrintOffset = 0
             hasDphdt = False
             #loop condition variable 2's present for the cv1/ph pair
-            for cv2 in sorted(self.contentsHash[(cv1, ph)].keys()):
+            cv2s = sorted(self.contentsHash[(cv1, ph)].keys())
+            for cv2 in cv2s[:MAX_CV2S_LISTED]:
                 #find the associated mean well
                 meanWell = self.contentsHash[(cv1, ph)][cv2]
                 
-                #plot the curve for the well
-                wells = [self.plate.wells[wellName] for wellName in meanWell.replicates]
-                for well in wells:
-                    #dotted line for discarded curves
-                    if well.isDiscarded:
-                        plt.plot(well.temperatures, well.fluorescence, self.plate.cv2ColourDict[cv2],linestyle=":")
-                    #dashed line for complex curves
-                    elif well.isComplex:
-                        plt.plot(well.temperatures, well.fluorescence, self.plate.cv2ColourDict[cv2],linestyle="--")
-                    #full line for normal curves
-                    else:
-                        plt.plot(well.temperatures, well.fluorescence, self.plate.cv2ColourDict[cv2])
-                
                 #print the tm calculated for the condition
                 pdf.setFont("Helvetica",10)
                 pdf.setFillColor(self.plate.cv2ColourDict[cv2])
@@ -593,16 +832,17 @@ class DsfAnalysis:
                 #incrememnt the tm printing offset, for the next condition variable 2
                 tmPrintOffset += 1
             
-            #finalise the plot's axes
-            plt.ylim(minYValue-paddingSize,maxYValue+paddingSize)
-            plt.gca().axes.get_yaxis().set_visible(False)
-            #save the graph figure, and print it to the pdf
-            imgdata = cStringIO.StringIO()
-            singleConditionFigure.savefig(imgdata, format='png',dpi=140)
-            imgdata.seek(0)
-            Image = ImageReader(imgdata)
-            pdf.drawImage(Image, cm+(xpos % 2)*9.5*cm,23.5*cm - (ypos % yNum)*ySize*cm , 8*cm, 6*cm)
-            plt.close()
+            #the rest of the tms are only in the exported tm data
+            if len(cv2s) > MAX_CV2S_LISTED:
+                pdf.setFillColor("black")
+                pdf.drawString(cm+(xpos % 2)*9.5*cm,22*cm - (ypos % yNum)*ySize*cm - tmPrintOffset*0.5*cm,
+                               "... and " + str(len(cv2s) - MAX_CV2S_LISTED) + " more (see the Tm data)")
+            
+            #print the condition's graph to the pdf
+            if vectorGraphs:
+                rp.drawCurvePlot(pdf, conditionPlot, cm+(xpos % 2)*9.5*cm,23.5*cm - (ypos % yNum)*ySize*cm , 8*cm, 6*cm)
+            else:
+                pdf.drawImage(ImageReader(conditionImage), cm+(xpos % 2)*9.5*cm,23.5*cm - (ypos % yNum)*ySize*cm , 8*cm, 6*cm)
             
             #print the condition name, and headings for calculated data
             pdf.setFillColor("black")
@@ -637,10 +877,12 @@ class DsfAnalysis:
                 pdf.showPage()
 
         #save the pdf    
-        pdf.save()
+        self.timer.time(REPORT_SAVE, pdf.save)
         return
 
 def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
     root = Tkinter.Tk()
     root.withdraw()
     tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
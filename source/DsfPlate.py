@@ -1,25 +1,14 @@
 # -*- coding: utf-8 -*-
 
-import pandas as pd
-from itertools import combinations
-import Tkinter, tkMessageBox
+import numpy as np
 
 import replicateHandling as rh
-from DsfWell import DsfWell
-from Contents import Contents
+import curveClassification as cc
+import dsfReader
+from DsfWell import DsfWell, MONOTONIC, COMPLEX, IN_THE_NOISE, SATURATED, DISCARDED
+from ContentsMap import ContentsMap, loadContentsMap, LYSOZYME, NO_DYE, PROTEIN_AS_SUPPLIED, NO_PROTEIN, COLOURS
 from MeltdownException import MeltdownException
 
-#control names that we recognise in contents map (lower cased)
-LYSOZYME = 'lysozyme'
-NO_DYE = 'no dye'
-PROTEIN_AS_SUPPLIED = 'protein as supplied'
-NO_PROTEIN = 'no protein'
-
-#possible colours of plots
-COLOURS = ["Blue","DarkOrange","Green","Magenta","Cyan","Red",
-            "DarkSlateGray","Olive","LightSeaGreen","DarkMagenta","Gold","Navy",
-            "DarkRed","Lime","Indigo","MediumSpringGreen","DeepPink","Salmon",
-            "Teal","DeepSkyBlue","DarkOliveGreen","Maroon","GoldenRod","MediumVioletRed"]
 #TODO make sure these constants are k
 #discarding bad replicates threshold. calculated as mean difference between any two of 168 normalised lysozyme curves
 SIMILARITY_THRESHOLD = 0.010718638818#1.72570084974
@@ -28,9 +17,45 @@ PLATE_MONOTONICITY_THRESHOLD_FACTOR = 0.0005
 #gives the 'in the noise' threshold when multiplied by the mean monotonicity threshold of the 'no protein' control wells
 NOISE_THRESHOLD_FACTOR = 1#1.15
 
+#the stages of the analysis of a plate, in the order they must be run. Each stage only looks at the wells
+#not discarded by the stages before it, so changing anything a stage uses means every stage after it is rerun
+OUTLIERS = 'outliers'
+SATURATIONS = 'saturations'
+MONOTONICITIES = 'monotonicities'
+IN_THE_NOISES = 'inTheNoises'
+TMS = 'tms'
+COMPLEXITIES = 'complexities'
+STAGES = (OUTLIERS, SATURATIONS, MONOTONICITIES, IN_THE_NOISES, TMS, COMPLEXITIES)
+
+#the thresholds that can be changed for a plate (named as their module constants), and the stage that uses each
+THRESHOLD_STAGES = {'SIMILARITY_THRESHOLD': OUTLIERS,
+                    'SATURATION_FLUCTUATION_THRESHOLD': SATURATIONS,
+                    'LENGTH_OF_FLAT_CONSIDERED_SATURATED': SATURATIONS,
+                    'PLATE_MONOTONICITY_THRESHOLD_FACTOR': MONOTONICITIES,
+                    'MONOTONIC_CONTRADICTION_LIMIT': MONOTONICITIES,
+                    'NOISE_THRESHOLD_FACTOR': IN_THE_NOISES,
+                    'FRACTION_OF_CURVE_NOT_CHECKED_FOR_TM': TMS,
+                    'SIGN_CHANGE_THRESH': COMPLEXITIES,
+                    'MAX_DIFFERENCE_BETWEEN_TMS_BEFORE_COMPLEX': COMPLEXITIES}
+
+
+def defaultThresholds():
+    #the current values of the threshold constants, keyed by their names
+    return {'SIMILARITY_THRESHOLD': SIMILARITY_THRESHOLD,
+            'SATURATION_FLUCTUATION_THRESHOLD': cc.SATURATION_FLUCTUATION_THRESHOLD,
+            'LENGTH_OF_FLAT_CONSIDERED_SATURATED': cc.LENGTH_OF_FLAT_CONSIDERED_SATURATED,
+            'PLATE_MONOTONICITY_THRESHOLD_FACTOR': PLATE_MONOTONICITY_THRESHOLD_FACTOR,
+            'MONOTONIC_CONTRADICTION_LIMIT': cc.MONOTONIC_CONTRADICTION_LIMIT,
+            'NOISE_THRESHOLD_FACTOR': NOISE_THRESHOLD_FACTOR,
+            'FRACTION_OF_CURVE_NOT_CHECKED_FOR_TM': cc.FRACTION_OF_CURVE_NOT_CHECKED_FOR_TM,
+            'SIGN_CHANGE_THRESH': cc.SIGN_CHANGE_THRESH,
+            'MAX_DIFFERENCE_BETWEEN_TMS_BEFORE_COMPLEX': cc.MAX_DIFFERENCE_BETWEEN_TMS_BEFORE_COMPLEX}
+
 
 class DsfPlate:
-    def __init__(self, dataFilePath, contentsMapFilePath):
+    def __init__(self, dataFilePath, contentsMap, useCache=False):
+        #the data can be given as a DSF results file or its cache (see dsfReader.loadDsfFile), and the
+        #contents map as a file path or an already parsed ContentsMap. With useCache, results files are cached
         
         #initialise dict of well names to wells
         self.wells = {}
@@ -43,251 +68,287 @@ class DsfPlate:
         self.cv2ColourDict = {}
         #initialised replicate dictionary, maps well name to name of all its replicate wells (including itself)
         self.repDict = {}
+        #list of every group of replicates (each group is the same list object as in the replicate dictionary),
+        #and the index of the group that each well on the plate belongs to, in the order of the plate's wells
+        self.repGroups = []
+        self.repGroupIds = None
         
         #initial values for plate specific thresholds
         self.plateMonotonicThreshold = None
         self.noiseThreshold = None
+        #per well monotonic thresholds, calculated with the plate's one
+        self.wellMonotonicThresholds = None
+        #derivative series of the normalised curves, only calculated once needed
+        self.derivatives = None
+        
+        #the thresholds used by the analysis, these can be changed between analyses (see setThresholds)
+        self.thresholds = defaultThresholds()
+        #how many of the STAGES are up to date, and the thresholds/options each was run with and the
+        #wells' statuses before it was run, so that a stage can be rerun without redoing the ones before it
+        self.stagesDone = 0
+        #changed whenever a stage is run, so anything made from the wells' results knows when to be made again
+        self.resultsVersion = 0
+        self.__stageInputs = []
+        self.__statusBeforeStage = []
+        #results of the slow parts of each stage, for every well (so they don't depend on which wells the stages
+        #before discarded), keyed by the thresholds they depend on
+        self.__distanceMatrices = None
+        self.__runLengths = {}
+        self.__peakContradictions = {}
+        self.__tmResults = {}
+        self.__complexCurves = {}
+        self.__midpointTms = None
         
-        #==================read the data file as a pandas data frame
-        try:
-            data = pd.DataFrame.from_csv(dataFilePath, sep='\t', index_col='Temperature')
-        except Exception as e:
-            raise MeltdownException('There was a problem reading the data file\n' + e.message)
+        #==================read the data file, all the curves are held in one (wells, temperatures) array,
+        #each well is a view onto its row
+        self.wellNames, self.temperatures, rawFluorescence = dsfReader.loadDsfFile(dataFilePath, useCache)
+        #==================
         
-        #turn the column headers (well names) into strings, allows naming well names 1,2,3 etc
-        data.columns = [str(colName) for colName in data.columns]
-        #remove any columns that that are blank (default pcrd export includes empty columns sometimes)
-        for column in data:
-            if 'Unnamed' in column:
-                data.pop(column)
-        #remove any rows that are all blank (e.g. empty lines at the end of the file)
-        data.drop(data.index[pd.isnull(data.index)], inplace=True)
-        #replace any empty cells (default value NaN) to be empty strings ('')
-        data.fillna(value='', inplace=True)
+        #get min and max of the non normalised and normalised curves
+        self.wellMins = rawFluorescence.min(axis=1)
+        self.wellMaxs = rawFluorescence.max(axis=1)
+        self.fluorescence, self.normalisationFactors = cc.normalise(rawFluorescence, self.temperatures)
+        self.wellNormalisedMins = self.fluorescence.min(axis=1)
+        self.wellNormalisedMaxs = self.fluorescence.max(axis=1)
         
-        #==================read the in the contents map as a dataframe too
-        try:
-            contentsMap = pd.DataFrame.from_csv(contentsMapFilePath, sep='\t', index_col='Well')
-        except Exception as e:
-            raise MeltdownException('There was a problem reading the contents map file\n' + e.message)
+        #the tm and status of every well, tms that can't be found are left as nan. The status flags
+        #(monotonic, complex, outlier etc.) are bits of one byte per well, see DsfWell
+        numWells = len(self.wellNames)
+        self.tms = np.empty(numWells)
+        self.tms.fill(np.nan)
+        self.status = np.zeros(numWells, dtype=np.uint8)
         
-        #remove any columns that that are blank (default pcrd export includes empty columns sometimes)
-        for column in contentsMap:
-            if 'Unnamed' in column:
-                contentsMap.pop(column)
-        #remove any rows that are all blank (e.g. empty lines at the end of the file)
-        contentsMap.drop(contentsMap.index[pd.isnull(contentsMap.index)], inplace=True)
-        #replace any empty cells (default value NaN) to be empty strings ('')
-        contentsMap.fillna(value='', inplace=True)
+        #==================get the parsed contents map, which is only read once for all plates that share it
+        if not isinstance(contentsMap, ContentsMap):
+            contentsMap = loadContentsMap(contentsMap)
+        self.contentsMap = contentsMap
         #==================
         
-        for wellName in data.columns:
-            wellContents = self.__readContentsOfWell(contentsMap, wellName)
-            #check if well is one of the 4 supported controls, and add name to appropriate list if that is the case
-            if wellContents.cv1.lower() == LYSOZYME:
-                #save each of the controls found to be lower cased, so they can be found later
-                #controls have a ph and and condition variable 2 set to null string ('') so they are easier to find
-                wellContents.cv1 = wellContents.cv1.lower()
-                self.lysozyme.append(wellName)
-                wellContents.isControl = 1
-                wellContents.ph = ''
-                wellContents.cv2 = ''
-            elif wellContents.cv1.lower() == NO_DYE:
-                wellContents.cv1 = wellContents.cv1.lower()
-                self.noDye.append(wellName)
-                wellContents.isControl = 1
-                wellContents.ph = ''
-                wellContents.cv2 = ''
-            elif wellContents.cv1.lower() == PROTEIN_AS_SUPPLIED:
-                wellContents.cv1 = wellContents.cv1.lower()
-                wellContents.cv2 = wellContents.cv2
-                #can have multiple groupings of protein as supplied, save them in a dictionary of {condition variable 2 (how they're grouped) : list of wellNames}
-                if wellContents.cv2 not in self.proteinAsSupplied.keys():
-                    self.proteinAsSupplied[wellContents.cv2] = [wellName]
-                else:
-                    self.proteinAsSupplied[wellContents.cv2].append(wellName)
-                wellContents.isControl = 1
-                wellContents.ph = ''
-            elif wellContents.cv1.lower() == NO_PROTEIN:
-                wellContents.cv1 = wellContents.cv1.lower()
-                self.noProtein.append(wellName)
-                wellContents.isControl = 1
-                wellContents.ph = ''
-                wellContents.cv2 = ''
-            
+        for index, wellName in enumerate(self.wellNames):
             #populate the list of wells
-            self.__addWell(data[wellName], wellName, wellContents)
+            self.__addWell(index, wellName, contentsMap.contentsOfWell(wellName))
         
-        #create a mapping of condition variable 2's to particular colours, to help with plotting
-        self.__assignConditionVariable2Colours(contentsMap)
-        #create a mapping of each well name to a list of wellnames that are replicates of itself (includeing itself)
-        self.__createRepDict(contentsMap)
-                
+        #the control lists only hold the controls on this plate, in the order of the plate's wells
+        self.lysozyme = self.__wellsOnPlate(contentsMap.lysozyme)
+        self.noDye = self.__wellsOnPlate(contentsMap.noDye)
+        self.noProtein = self.__wellsOnPlate(contentsMap.noProtein)
+        for cv2, wellNames in contentsMap.proteinAsSupplied.items():
+            if len(self.__wellsOnPlate(wellNames)) > 0:
+                self.proteinAsSupplied[cv2] = self.__wellsOnPlate(wellNames)
+        
+        #the mapping of condition variable 2's to colours, and the replicates, are the same for every plate using the contents map
+        self.cv2ColourDict = contentsMap.cv2ColourDict
+        self.repDict = contentsMap.repDict
+        self.repGroups = contentsMap.repGroups
+        self.repGroupIds = np.array([contentsMap.groupIdOfWell[wellName] for wellName in self.wellNames], dtype=int)
         return
     
-    def __readContentsOfWell(self, contentsMap, wellName):
-        #get the well's row from the contents map dataframe, if it's there
-        try:
-            contentsRow = contentsMap.xs(wellName)
-        except Exception as e:
-            raise MeltdownException('Could not find matching Contents Map row for "' + wellName + '"\n' + e.message)
-
-        #get information from the row
-        try:
-            cv1 = contentsRow['Condition Variable 1']
-        except Exception as e:
-            raise MeltdownException('Could not read "Condition Variable 1" column for "' + wellName + '" from contents map\n' + e.message)
-        
-        try:
-            cv2 = contentsRow['Condition Variable 2']
-        except Exception as e:
-            raise MeltdownException('Could not read "Condition Variable 2" column for "' + wellName + '" from contents map\n' + e.message)
-        #as ph, dphdt, and control columns are not essential, if they are ommited, values take empty strings
-        try:
-            ph = contentsRow['pH']
-        except KeyError:
-            ph = ''
-        except Exception as e:
-            raise MeltdownException('Could not read "pH" column for "' + wellName + '" from contents map\n' + e.message)
-        
-        try:
-            dphdt = contentsRow['d(pH)/dT']
-        except KeyError:
-            dphdt = ''
-        except Exception as e:
-            raise MeltdownException('Could not read "d(pH)/dT" column for "' + wellName + '" from contents map\n' + e.message)
-        
-        try:
-            control = contentsRow['Control']
-        except KeyError:
-            control = ''
-        except Exception as e:
-            raise MeltdownException('Could not read "Control" column for "' + wellName + '" from contents map\n' + e.message)
-        
-        #create Contents object for the well
-        contents = Contents(cv1, cv2, ph, dphdt, control)
-        return contents
+    def __wellsOnPlate(self, wellNames):
+        #the given wells that are on the plate, in the order of the plate's wells
+        return sorted([wellName for wellName in wellNames if wellName in self.wells], key=lambda wellName: self.wells[wellName].index)
     
-    def __addWell(self, fluorescenceSeries, name, contents):
-        #create a dsf well object and add it to wells list
-        well = DsfWell(list(fluorescenceSeries.values), list(fluorescenceSeries.index), name, contents)
+    def __addWell(self, index, name, contents):
+        #create a dsf well object, viewing the given row of the plate, and add it to wells list
+        well = DsfWell(self, index, name, contents)
         self.wells[name] = well
         return
     
-    def __assignConditionVariable2Colours(self, contentsMap):
-        colourIndex=0
-        #for each unseen condition variable 2, map the next colour in the COLOUR list
-        for cv2 in contentsMap['Condition Variable 2']:
-            #check if unseen condition variable 2
-            if cv2 not in self.cv2ColourDict.keys():
-                #limit to how many condition variable 2's there can be
-                if colourIndex == len(COLOURS):
-                    raise MeltdownException('No more than '+ str(len(COLOURS)) +'different Condition Variable 2\'s are permitted')
-                self.cv2ColourDict[cv2] = COLOURS[colourIndex]
-                colourIndex += 1
+    def setThresholds(self, **thresholds):
+        """
+        Changes thresholds of the analysis, given by the names of their constants (see THRESHOLD_STAGES).
+        The results of the stages using them, and every stage after, are out of date until they are rerun
+        """
+        for name, value in thresholds.items():
+            if name not in THRESHOLD_STAGES:
+                raise MeltdownException('Unknown threshold "' + name + '", thresholds are: ' + ', '.join(sorted(THRESHOLD_STAGES.keys())))
+            self.thresholds[name] = value
         return
-        
-    def __createRepDict(self, contentsMap):
-        #loop through each well name
-        for wellName in contentsMap.index:
-            self.repDict[wellName] = []
-            #reloop through each well name, and add those with the same solution to the initial wells list of replicates
-            for comparedWellName in contentsMap.index:
-                well = contentsMap.xs(wellName)
-                cmpWell = contentsMap.xs(comparedWellName)
-                #replicate defined as having same condition variables 1 and 2 as well as same ph
-                if well['Condition Variable 1'] == cmpWell['Condition Variable 1'] and\
-                well['Condition Variable 2'] == cmpWell['Condition Variable 2']:
-                    try:
-                        if well['pH'] == cmpWell['pH']:
-                            #found a replicate: cv1, cv2, and ph all the same
-                            self.repDict[wellName].append(comparedWellName)
-                    except KeyError:
-                        #found a replicate: cv1, cv2 are the same, and ph column was not found
-                        self.repDict[wellName].append(comparedWellName)
+    
+    def __startStage(self, stage, inputs):
+        #returns False if the stage is up to date with the given inputs, otherwise puts the wells back to how they were
+        #before the stage, ready for it to be run. Stages that were skipped count as having found nothing
+        index = STAGES.index(stage)
+        if index < self.stagesDone:
+            if self.__stageInputs[index] == inputs:
+                return False
+            self.status[:] = self.__statusBeforeStage[index]
+            del self.__stageInputs[index:]
+            del self.__statusBeforeStage[index:]
+            self.stagesDone = index
+            if index <= STAGES.index(TMS):
+                self.tms.fill(np.nan)
+        while self.stagesDone < index:
+            self.__stageInputs.append(None)
+            self.__statusBeforeStage.append(self.status.copy())
+            self.stagesDone += 1
+        self.__stageInputs.append(inputs)
+        self.__statusBeforeStage.append(self.status.copy())
+        self.resultsVersion += 1
+        return True
+    
+    def __finishStage(self, stage):
+        self.stagesDone = STAGES.index(stage) + 1
         return
     
     def computeOutliers(self):
-        seen = []
+        similarityThreshold = self.thresholds['SIMILARITY_THRESHOLD']
+        if not self.__startStage(OUTLIERS, (similarityThreshold,)):
+            return
+        if self.__distanceMatrices is None:
+            #log each curve only once, for all the aitchison distances it is used in. Curves with points
+            #that can't be logged get nan distances, which are never within the similarity threshold
+            with np.errstate(divide='ignore', invalid='ignore'):
+                logFluorescence = np.log(self.fluorescence)
+            #the distance matrix between every pair of replicates, as described in replicate handling, for each group
+            self.__distanceMatrices = [rh.aitchisonDistanceMatrix(logFluorescence[[self.wells[rep].index for rep in reps]])
+                                       for reps in self.repGroups]
         outlierWells = []
-        for wellName in self.wells.keys():
-            #carful not to loop over the same wells
-            if wellName not in seen:
-                reps = self.repDict[wellName]
-                #every possible pair of replicates
-                pairs = combinations(reps, 2)
-                #initialise the distance matrix, as described in replicate handling
-                distMatrix = [[0 for x in range(len(reps))] for y in range(len(reps))]
-                for pair in pairs:
-                    #calculate the distance between the pairs
-                    dist = rh.aitchisonDistance(self.wells[pair[0]].fluorescence, self.wells[pair[1]].fluorescence)
-                    #add the appropriate distance values to the distance matrix
-                    distMatrix[reps.index(pair[0])][reps.index(pair[1])] = dist
-                    distMatrix[reps.index(pair[1])][reps.index(pair[0])] = dist
-                #get list of replicates which are NOT outliers
-                keep = rh.discardBad(reps, distMatrix, SIMILARITY_THRESHOLD)
-                #add to the total list of outlier wells
-                for rep in reps:
-                    seen.append(rep)
-                    if rep not in keep:
-                        outlierWells.append(rep)
+        #each group of replicates is looked at once
+        for reps, distMatrix in zip(self.repGroups, self.__distanceMatrices):
+            #get list of replicates which are NOT outliers
+            keep = rh.discardBad(reps, distMatrix, similarityThreshold)
+            #add to the total list of outlier wells
+            for rep in reps:
+                if rep not in keep:
+                    outlierWells.append(rep)
         #go thraough all the outlier wells and set their outlier and discarded flags to true
         ##print 'discarded: ', outlierWells
         for wellName in outlierWells:
             self.wells[wellName].setAsOutlier()
+        self.__finishStage(OUTLIERS)
         return
     
     def computeSaturations(self):
-        #let each stored well calculate if it is saturated
-        for well in self.wells.values():
-            well.computeSaturation()
+        fluctuationThreshold = self.thresholds['SATURATION_FLUCTUATION_THRESHOLD']
+        flatLength = self.thresholds['LENGTH_OF_FLAT_CONSIDERED_SATURATED']
+        if not self.__startStage(SATURATIONS, (fluctuationThreshold, flatLength)):
+            return
+        #the flat lengths around every curve's maximum only depend on how much the flat section can fluctuate
+        if fluctuationThreshold not in self.__runLengths:
+            self.__runLengths[fluctuationThreshold] = cc.findSaturated(self.fluorescence, self.wellNormalisedMins,
+                                                                       self.wellNormalisedMaxs, fluctuationThreshold)[1]
+        #only wells that aren't already discarded are checked
+        remaining = self.notFlagged(DISCARDED)
+        self.__discard(SATURATED, remaining, self.__runLengths[fluctuationThreshold][remaining] >= flatLength)
+        self.__finishStage(SATURATIONS)
         return
     
     def computeMonotonicities(self):
-        self.__computePlateMonotonicThreshold()
-        #make each well calculate whether it is monotonic, with the now calculated plate monotonicity threshold
-        for well in self.wells.values():
-            well.computeMonotonicity(self.plateMonotonicThreshold)
+        thresholdFactor = self.thresholds['PLATE_MONOTONICITY_THRESHOLD_FACTOR']
+        contradictionLimit = self.thresholds['MONOTONIC_CONTRADICTION_LIMIT']
+        if not self.__startStage(MONOTONICITIES, (thresholdFactor, contradictionLimit)):
+            return
+        self.__computePlateMonotonicThreshold(thresholdFactor)
+        #calculate every well's individual monotonic threshold from the plate's one
+        self.wellMonotonicThresholds = self.plateMonotonicThreshold / self.normalisationFactors
+        #how far each curve breaks its monotonicity, which only depends on the monotonic thresholds
+        if thresholdFactor not in self.__peakContradictions:
+            self.__peakContradictions[thresholdFactor] = cc.peakContradictions(self.fluorescence, self.wellMonotonicThresholds)
+        #no need to calculate if curve is monotonic, if it is already tagged as discarded
+        remaining = self.notFlagged(DISCARDED)
+        self.__discard(MONOTONIC, remaining, ~(self.__peakContradictions[thresholdFactor][remaining] >= contradictionLimit))
+        self.__finishStage(MONOTONICITIES)
         return
     
-    def computeInTheNoises(self):
-        self.__computeNoiseThreshold()
-        #make each well calculate whether it is in the noise, with the now calculated noise threshold
-        for well in self.wells.values():
-            well.computeInTheNoise(self.noiseThreshold)
+    def computeInTheNoises(self, checked=True):
+        #wells are only checked for being in the noise if checked is set (e.g. if the no protein control passed)
+        noiseThresholdFactor = self.thresholds['NOISE_THRESHOLD_FACTOR']
+        if not self.__startStage(IN_THE_NOISES, (noiseThresholdFactor, checked)):
+            return
+        self.__computeNoiseThreshold(noiseThresholdFactor)
+        #no noise threshold means no no protein controls, so no wells can be in the noise
+        if checked and self.noiseThreshold != None:
+            #curve is in the noise, and should be discarded, if its monotonic threshold is greater than the noise threshold
+            remaining = self.notFlagged(DISCARDED)
+            self.__discard(IN_THE_NOISE, remaining, self.wellMonotonicThresholds[remaining] > self.noiseThreshold)
+        self.__finishStage(IN_THE_NOISES)
         return
     
-    def computeTms(self):
-        #each well calculates its Tm on itself
-        for well in self.wells.values():
-            well.computeTm()
+    def computeTms(self, refinement=cc.TM_REFINEMENT, decimalPlaces=cc.TM_DECIMAL_PLACES):
+        fractionNotChecked = self.thresholds['FRACTION_OF_CURVE_NOT_CHECKED_FOR_TM']
+        inputs = (fractionNotChecked, refinement, decimalPlaces)
+        if not self.__startStage(TMS, inputs):
+            return
+        if inputs not in self.__tmResults:
+            self.__tmResults[inputs] = cc.findTms(self.__getDerivatives(), self.temperatures, fractionNotChecked,
+                                                  refinement, decimalPlaces)
+        tms, noTm = self.__tmResults[inputs]
+        #if well is monotonic, saturated, in the noise, or an outlier, then don't try to find its Tm
+        remaining = self.notFlagged(DISCARDED)
+        self.tms[remaining] = tms[remaining]
+        #force curve to be complex if no Tm can be found, and it has not been discarded
+        self.status[remaining & noTm] |= COMPLEX
+        self.__finishStage(TMS)
         return
     
     def computeComplexities(self):
-        #each well calculates if it is complex on itself
-        for well in self.wells.values():
-            well.computeComplexity()
+        signChangeThreshold = self.thresholds['SIGN_CHANGE_THRESH']
+        maxTmDifference = self.thresholds['MAX_DIFFERENCE_BETWEEN_TMS_BEFORE_COMPLEX']
+        if not self.__startStage(COMPLEXITIES, (signChangeThreshold, maxTmDifference)):
+            return
+        if signChangeThreshold not in self.__complexCurves:
+            self.__complexCurves[signChangeThreshold] = cc.findComplex(self.fluorescence, self.__getDerivatives(), signChangeThreshold)
+        #only calculate if curve is not discarded, and not already marked as complex
+        remaining = self.notFlagged(DISCARDED | COMPLEX)
+        complexCurves = self.__complexCurves[signChangeThreshold]
+        #other check for complex curve, if the Tm is too far from another estimate of it
+        if maxTmDifference is not None:
+            if self.__midpointTms is None:
+                self.__midpointTms = cc.findMidpointTms(self.fluorescence, self.temperatures)
+            with np.errstate(invalid='ignore'):
+                complexCurves = complexCurves | (np.fabs(self.__midpointTms - self.tms) > maxTmDifference)
+        self.status[remaining & complexCurves] |= COMPLEX
+        self.__finishStage(COMPLEXITIES)
+        return
+    
+    def __getDerivatives(self):
+        #the normalised curves never change, so the derivative series only need calculating once
+        if self.derivatives is None:
+            self.derivatives = cc.derivatives(self.fluorescence, self.temperatures)
+        return self.derivatives
+    
+    def wellCounters(self):
+        #counters of the work done on every well by the stages that have been run, for the run metrics (see runMetrics):
+        #the length of the flat section around each curve's maximum (see computeSaturations), and the highest count of
+        #monotonicity contradictions each curve reached (see computeMonotonicities). Both are found for every well,
+        #including wells already discarded before the stage
+        counters = {}
+        if self.stagesDone > STAGES.index(SATURATIONS) and self.__stageInputs[STAGES.index(SATURATIONS)] is not None:
+            counters['Saturation Run Length'] = self.__runLengths[self.__stageInputs[STAGES.index(SATURATIONS)][0]]
+        if self.stagesDone > STAGES.index(MONOTONICITIES) and self.__stageInputs[STAGES.index(MONOTONICITIES)] is not None:
+            counters['Monotonic Contradictions'] = self.__peakContradictions[self.__stageInputs[STAGES.index(MONOTONICITIES)][0]]
+        return counters
+
+    def flagged(self, flags):
+        #boolean array of the wells that have any of the given status flags (e.g. COMPLEX | DISCARDED)
+        return (self.status & flags) != 0
+    
+    def notFlagged(self, flags):
+        #boolean array of the wells that have none of the given status flags
+        return (self.status & flags) == 0
+    
+    def __discard(self, flag, checked, found):
+        #set the given flag, and discard, the checked wells that were found to have the property
+        foundRows = np.flatnonzero(checked)[found]
+        self.status[foundRows] |= flag | DISCARDED
         return
     
-    def __computePlateMonotonicThreshold(self):
+    def __computePlateMonotonicThreshold(self, thresholdFactor):
         #get the highest fluorescence value from all wells before they were normalised
-        overallMaxNonNormalised = 0
-        for well in self.wells.values():
-            if well.wellMax > overallMaxNonNormalised:
-                overallMaxNonNormalised = well.wellMax
+        overallMaxNonNormalised = max(0, self.wellMaxs.max())
         #calculate the plates monotonic threshold used the constant factor
-        self.plateMonotonicThreshold = PLATE_MONOTONICITY_THRESHOLD_FACTOR * overallMaxNonNormalised
+        self.plateMonotonicThreshold = thresholdFactor * overallMaxNonNormalised
         ##print 'plate monotonic threshold: ', self.plateMonotonicThreshold
         return
     
-    def __computeNoiseThreshold(self):#TODO threshold is too high, too many things are getting culled
-        #if no no protein controls, leave the noise threshold as None, and let this be handled in DsfWell
+    def __computeNoiseThreshold(self, noiseThresholdFactor):#TODO threshold is too high, too many things are getting culled
+        #if no no protein controls, leave the noise threshold as None, and let this be handled in computeInTheNoises
         if len(self.noProtein)==0:
             self.noiseThreshold = None
             return
         #otherwise, calculate th noise threshold from the constant factor
         meanNoProteinMonotonicThreshold, sd = rh.meanSd([self.wells[wellName].wellMonotonicThreshold for wellName in self.noProtein])
-        self.noiseThreshold = meanNoProteinMonotonicThreshold / NOISE_THRESHOLD_FACTOR
+        self.noiseThreshold = meanNoProteinMonotonicThreshold / noiseThresholdFactor
         ##print 'plate noise threshold: ', self.noiseThreshold
         return
 
@@ -295,6 +356,8 @@ class DsfPlate:
 
 
 def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
     root = Tkinter.Tk()
     root.withdraw()
     tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
-import Tkinter, tkMessageBox
 
-class MeanWell:
+class MeanWell(object):
+    __slots__ = ('tm', 'tmError', 'isComplex', 'replicates', 'numReplicatesNotDiscarded', 'contents')
+
     def __init__(self, tm, tmError, isComplex, replicates, numReplicatesNotDiscarded, contents):
         #relevant info for a mean well
         self.tm = tm
@@ -15,6 +16,8 @@ class MeanWell:
 
 
 def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
     root = Tkinter.Tk()
     root.withdraw()
     tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
@@ -17,35 +17,36 @@
 #  License: XXX
 
 import Tkinter, tkFileDialog, tkMessageBox
-import os
-import ConfigParser
-import sys, traceback
 
-from DsfAnalysis import DsfAnalysis
 from MeltdownException import MeltdownException
+import meltdownRunner
+from DsfAnalysis import reportlabFound
 import meltdownReleases
 
 #the running location of this file
-RUNNING_LOCATION = os.path.dirname(os.path.realpath(__file__))
+RUNNING_LOCATION = meltdownRunner.RUNNING_LOCATION
 #get the version number as a string
-with open(RUNNING_LOCATION + "/../VERSION.txt") as versionFile:
-    VERSION = versionFile.readline()
-
-#open the settings.ini and set the appropriate flags
-cfg = ConfigParser.ConfigParser()
-cfg.readfp(open(RUNNING_LOCATION + '/../settings.ini'))
-#get options
-DELETE_INPUT_FILES = cfg.getboolean('Running Options', 'DeleteInputFiles')
-CREATE_NORMALISED_DATA = cfg.getboolean('Extra Output', 'ProduceNormalisedData')
-CREATE_TM_DATA = cfg.getboolean("Extra Output", "ProduceTmData")
-CHECK_FOR_NEW_VERSION = cfg.getboolean('Running Options', 'CheckForNewVersion')
+VERSION = meltdownRunner.VERSION
 
 def main():
     #opens up selection windows for user to use
     root = Tkinter.Tk()
     root.withdraw()
     
-    if (CHECK_FOR_NEW_VERSION):
+    try:
+        #open the settings.ini and get the options
+        settings = meltdownRunner.readSettings()
+    except MeltdownException as e:
+        tkMessageBox.showerror("Error", e.message)
+        print '*error occured* ' + e.message
+        return
+    
+    #reportlab needs to be installed separetly by anaconda, so alert the user if it can't be imported (it's only needed for reports)
+    if settings['ProduceReport'] and not reportlabFound():
+        tkMessageBox.showerror("ReportLab not found", "You must use Anaconda to install reportlab before Meltdown can be run")
+        return
+    
+    if (settings['CheckForNewVersion']):
         try:
             newer_v = meltdownReleases.checkIfLatestRelease(VERSION)
             if newer_v:
@@ -54,73 +55,41 @@ def main():
             #if user doesn't have internet, or github is down, then errors will occur, and we skip the check
             pass
     
-    try:
-        #choosing a dsf results data file
-        rfuFilepath = tkFileDialog.askopenfilename(title="Select the DSF Experiment Results", filetypes=[("text files", ".txt")])
-        #raise error if dialog is closed before selecting a file
-        if rfuFilepath == '':
-            raise MeltdownException("Data file not selected")
-        
-        #choosing a contents map for the data file
-        contentsMapFilepath = tkFileDialog.askopenfilename(title="Select the Contents Map", filetypes=[("text files", ".txt")])
-        #raise error if dialog is closed
-        if contentsMapFilepath == '':
-            raise MeltdownException("Contents map file not selected")
-
-        #the analysis
-        print 'reading in data ...'
-        #name the analysis the name of the data file
-        experiment = DsfAnalysis(rfuFilepath.split('/')[-1])
-        experiment.loadCurves(rfuFilepath,contentsMapFilepath)
-        print 'analysing ...'
-        experiment.analyseCurves()
-        
-        # generating the report
-        print 'generating report ...'
-        name = rfuFilepath.split(".")[0]
-        experiment.generateReport(name+".pdf", VERSION)
-
-        #remove any exported files in the directory of the data file. These files are identified if they
-        #have the same word at the start of their file name, this is assumed to be the protein name, and
-        #all files with the same first word in the directory are deleted
-        if DELETE_INPUT_FILES:
+    #choosing a dsf results data file
+    rfuFilepath = tkFileDialog.askopenfilename(title="Select the DSF Experiment Results", filetypes=[("text files", ".txt")])
+    #error if dialog is closed before selecting a file
+    if rfuFilepath == '':
+        tkMessageBox.showerror("Error", "Data file not selected")
+        print '*error occured* Data file not selected'
+        return
+    
+    #choosing a contents map for the data file
+    contentsMapFilepath = tkFileDialog.askopenfilename(title="Select the Contents Map", filetypes=[("text files", ".txt")])
+    #error if dialog is closed
+    if contentsMapFilepath == '':
+        tkMessageBox.showerror("Error", "Contents map file not selected")
+        print '*error occured* Contents map file not selected'
+        return
+    
+    #the analysis, report, and extra output
+    result = meltdownRunner.analyseFile(rfuFilepath, contentsMapFilepath, settings, printStages=True)
+    
+    if result.succeeded:
+        #remove any exported files in the directory of the data file
+        if settings['DeleteInputFiles']:
             print 'deleting input data files ...'
-            folder = rfuFilepath[:-len(rfuFilepath.split('/')[-1]) - 1]
-            proteinName = rfuFilepath.split('/')[-1].split()[0]
-            for fl in os.listdir(folder):
-                if '.pdf' in fl:
-                    continue
-                if proteinName in fl:
-                    os.remove(folder+'/'+fl)
-                    
-        #generate a tab delimited .txt file of the normalised curves
-        if CREATE_NORMALISED_DATA:
-            #add -normalised to the end of the filename
-            print 'creating normalised data ...'
-            experiment.produceNormalisedOutput(rfuFilepath[:-4] + '-normalised.txt')
-
-        if CREATE_TM_DATA:
-            print "creating tm data ..."
-            experiment.produceExportedTmData(rfuFilepath[:-4] + "-tms.txt")
-        
+            meltdownRunner.deleteInputFiles([result])
         print '*done*'
-            
-    #expected error, to do with reading input, will give descriptive messages
-    except MeltdownException as e:
-        tkMessageBox.showerror("Error", e.message)
-        print '*error occured* ' + e.message
     #unexpected errors only direct you to the error log
-    except Exception:
+    elif result.errorLog:
         tkMessageBox.showerror("Error", "Unexpected error, please check the error log for more information")
         #save to the error log before finishing
-        errors = open(RUNNING_LOCATION + "/../error_log.txt",'w')
-        etype, value, tb = sys.exc_info()
-        errors.write("Version: "+VERSION+"\n")
-        errors.write(''.join(traceback.format_exception(etype, value, tb, None))) 
-        root = Tkinter.Tk()
-        root.withdraw()
-        errors.close()
+        meltdownRunner.writeErrorLog(RUNNING_LOCATION + "/../error_log.txt", result.errorLog)
         print '*error occured* check error log'
+    #expected error, to do with reading input, will give descriptive messages
+    else:
+        tkMessageBox.showerror("Error", result.message)
+        print '*error occured* ' + result.message
     return
 
 #excecutes main() on file run
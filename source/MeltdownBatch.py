@@ -2,25 +2,18 @@
 
 import Tkinter, tkFileDialog, tkMessageBox
 import os
-import ConfigParser
 import sys, traceback
+import time
 
-from DsfAnalysis import DsfAnalysis
 from MeltdownException import MeltdownException
+import meltdownRunner
+import dsfReader
+from DsfAnalysis import reportlabFound
 
 #the running location of this file
-RUNNING_LOCATION = os.path.dirname(os.path.realpath(__file__))
+RUNNING_LOCATION = meltdownRunner.RUNNING_LOCATION
 #get the version number as a string
-with open(RUNNING_LOCATION + "/../VERSION.txt") as versionFile:
-    VERSION = versionFile.readline()
-
-#open the settings.ini and set the appropriate flags
-cfg = ConfigParser.ConfigParser()
-cfg.readfp(open(RUNNING_LOCATION + '/../settings.ini'))
-#get options
-DELETE_INPUT_FILES = cfg.getboolean('Running Options', 'DeleteInputFiles')
-CREATE_NORMALISED_DATA = cfg.getboolean('Extra Output', 'ProduceNormalisedData')
-CREATE_TM_DATA = cfg.getboolean("Extra Output", "ProduceTmData")
+VERSION = meltdownRunner.VERSION
 
 def main():
     #opens up selection windows for user to use
@@ -28,6 +21,14 @@ def main():
     root.withdraw()
     
     try:
+        #open the settings.ini and get the options
+        settings = meltdownRunner.readSettings()
+        
+        #reportlab needs to be installed separetly by anaconda, so alert the user if it can't be imported (it's only needed for reports)
+        if settings['ProduceReport'] and not reportlabFound():
+            tkMessageBox.showerror("ReportLab not found", "You must use Anaconda to install reportlab before Meltdown can be run")
+            return
+        
         #choosing a dsf results data file
         directoryOfResultFiles = tkFileDialog.askdirectory(title='Choose the folder containing all the DSF result files')
         
@@ -41,43 +42,25 @@ def main():
         if contentsMapFilepath == '':
             raise MeltdownException("Contents map file not selected")
         
-        allFilePaths = [directoryOfResultFiles+'/'+f for f in os.listdir(directoryOfResultFiles) if os.path.isfile(directoryOfResultFiles+'/'+f)]
-        for rfuFilepath in allFilePaths:
-            try:
-                #the analysis
-                print 'analysing: ' + rfuFilepath.split('/')[-1]
-                #name the analysis the name of the data file
-                experiment = DsfAnalysis(rfuFilepath.split('/')[-1])
-                experiment.loadCurves(rfuFilepath,contentsMapFilepath)
-                experiment.analyseCurves()
-                
-                # generating the report
-                name = rfuFilepath.split(".")[0]
-                experiment.generateReport(name+".pdf", VERSION)
+        allFilePaths = [directoryOfResultFiles+'/'+f for f in os.listdir(directoryOfResultFiles)
+                        if os.path.isfile(directoryOfResultFiles+'/'+f) and not meltdownRunner.isOutputFile(f)
+                        and not dsfReader.isCacheFile(f)]
         
-                #remove any exported files in the directory of the data file. These files are identified if they
-                #have the same word at the start of their file name, this is assumed to be the protein name, and
-                #all files with the same first word in the directory are deleted
-                if DELETE_INPUT_FILES:
-                    folder = rfuFilepath[:-len(rfuFilepath.split('/')[-1]) - 1]
-                    proteinName = rfuFilepath.split('/')[-1].split()[0]
-                    for fl in os.listdir(folder):
-                        if '.pdf' in fl:
-                            continue
-                        if proteinName in fl:
-                            os.remove(folder+'/'+fl)
-                            
-                #generate a tab delimited .txt file of the normalised curves
-                if CREATE_NORMALISED_DATA:
-                    #add -normalised to the end of the filename
-                    experiment.produceNormalisedOutput(rfuFilepath[:-4] + '-normalised.txt')
-
-                if CREATE_TM_DATA:
-                    experiment.produceExportedTmData(rfuFilepath[:-4] + "-tms.txt")
-                    
-            except Exception as e:
-                print '*ERROR*'
-                print 'failed to analyse: ' + rfuFilepath.split('/')[-1] + '\n' + e.message
+        startTime = time.time()
+        results = meltdownRunner.analyseFiles(allFilePaths, contentsMapFilepath, settings)
+        
+        #remove any exported files in the directory of the data files, once all the files have been analysed
+        if settings['DeleteInputFiles']:
+            meltdownRunner.deleteInputFiles(results)
+        
+        meltdownRunner.writeSummary(results, directoryOfResultFiles+'/'+meltdownRunner.SUMMARY_FILE_NAME, time.time() - startTime)
+        print '*done* summary written to ' + meltdownRunner.SUMMARY_FILE_NAME
+        if settings['ProduceRunMetrics']:
+            meltdownRunner.writeBatchMetrics(results, directoryOfResultFiles+'/'+meltdownRunner.BATCH_METRICS_FILE_NAME, time.time() - startTime)
+            print '*done* metrics written to ' + meltdownRunner.BATCH_METRICS_FILE_NAME
+        if settings['AggregatePlates'] and meltdownRunner.writeAggregatedResults(results, directoryOfResultFiles+'/'+meltdownRunner.AGGREGATED_TMS_FILE_NAME,
+                                                                                 directoryOfResultFiles+'/'+meltdownRunner.AGGREGATED_PLATES_FILE_NAME) > 0:
+            print '*done* pooled tms written to ' + meltdownRunner.AGGREGATED_TMS_FILE_NAME
             
     #expected error, to do with reading input, will give descriptive messages
     except MeltdownException as e:
@@ -87,13 +70,8 @@ def main():
     except Exception:
         tkMessageBox.showerror("Error", "Unexpected error, please check the error log for more information")
         #save to the error log before finishing
-        errors = open(RUNNING_LOCATION + "/error_log.txt",'w')
         etype, value, tb = sys.exc_info()
-        errors.write("Version: "+VERSION+"\n")
-        errors.write(''.join(traceback.format_exception(etype, value, tb, None))) 
-        root = Tkinter.Tk()
-        root.withdraw()
-        errors.close()
+        meltdownRunner.writeErrorLog(RUNNING_LOCATION + "/error_log.txt", ''.join(traceback.format_exception(etype, value, tb, None)))
         print '*error occured* check error log'
     return
 
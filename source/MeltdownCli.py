@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+Command line entry point for meltdown, for running analyses without a display
+(e.g. from schedulers or pipelines on analysis servers). Tkinter is never imported.
+
+Usage:
+python MeltdownCli.py DATA [DATA ...] -c CONTENTS_MAP [-o OUTPUT_DIR] [--settings FILE]
+                      [--set NAME=VALUE ...] [--data-only] [--workers N] [--summary FILE]
+                      [--metrics FILE] [--aggregate]
+
+DATA can be DSF results files, folders (every .txt file in them is analysed), or glob
+patterns such as "results/*.txt". The .meltdown-cache.json files saved when
+CacheParsedData is set can be given instead of the results files they were made from. Settings are read from settings.ini (or --settings)
+and any of them can be overridden with --set, using the names in settings.ini, e.g.
+--set ProduceTmData=True --set TmRefinement=grid
+
+--data-only writes the Tm, well status, results json and normalised data files
+without the pdf reports, so matplotlib and reportlab are never imported (e.g. on
+screening nodes where reports are made later, if at all).
+
+--metrics writes the time of every file, and of every stage summed over the files,
+as json (see runMetrics). Each file's own metrics are written when ProduceRunMetrics is set.
+
+--aggregate treats the data files as technical replicate plates, pooling their replicates
+into one Tm per condition (see plateAggregation, the same as setting AggregatePlates). The
+pooled Tms and how each plate compared are written to meltdown_aggregated_tms.txt and
+meltdown_aggregated_plates.txt, in the output folder (or the folder of the first data file).
+
+Exit codes:
+0   every file was analysed
+1   at least one file failed to be analysed
+2   the arguments or input files were not usable, nothing was analysed
+
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+from MeltdownException import MeltdownException
+import meltdownRunner
+import dsfReader
+
+#exit codes
+EXIT_SUCCESS = 0
+EXIT_FILES_FAILED = 1
+EXIT_BAD_INPUT = 2
+
+
+def findDataFiles(paths):
+    """
+    Expands the given data paths into a list of DSF results files
+
+    Input: list of file paths, folders and glob patterns
+
+    Output: Returns the list of file paths, folders give every .txt file in them (except meltdown's own output), and
+    meltdown's output and the files of caches (see dsfReader) are only used when given by name
+    """
+    dataFiles = []
+    for path in paths:
+        if os.path.isdir(path):
+            matches = [os.path.join(path, f) for f in sorted(os.listdir(path))
+                       if f.lower().endswith('.txt') and not meltdownRunner.isOutputFile(f) and not dsfReader.isCacheFile(f)]
+            matches = [match for match in matches if os.path.isfile(match)]
+        elif os.path.isfile(path):
+            matches = [path]
+        else:
+            #globs are expanded here too, as not every shell expands them
+            matches = [match for match in sorted(glob.glob(path))
+                       if os.path.isfile(match) and not meltdownRunner.isOutputFile(match) and not dsfReader.isCacheFile(match)]
+        if len(matches) == 0:
+            raise MeltdownException('No data files found for "' + path + '"')
+        for match in matches:
+            if match not in dataFiles:
+                dataFiles.append(match)
+    #a results file and its cache header are the same plate
+    return meltdownRunner.uniquePlates(dataFiles)
+
+
+def parseBoolean(value):
+    #same boolean values as are allowed in settings.ini
+    if value.lower() in ('1', 'yes', 'true', 'on'):
+        return True
+    if value.lower() in ('0', 'no', 'false', 'off'):
+        return False
+    raise ValueError('"' + value + '" is not a boolean')
+
+
+def applySettingOverrides(settings, overrides):
+    """
+    Overrides settings with NAME=VALUE strings, the values are converted to the type of the setting
+
+    Output: Returns a new dictionary of the settings
+    """
+    settings = dict(settings)
+    for override in overrides:
+        if '=' not in override:
+            raise MeltdownException('Setting overrides must be given as NAME=VALUE, not "' + override + '"')
+        name, value = [part.strip() for part in override.split('=', 1)]
+        if name not in settings:
+            raise MeltdownException('Unknown setting "' + name + '", settings are: ' + ', '.join(sorted(settings.keys())))
+        try:
+            if isinstance(settings[name], bool):
+                settings[name] = parseBoolean(value)
+            elif isinstance(settings[name], int):
+                settings[name] = int(value)
+            elif name in ('TmRefinement', 'NormalisedDataFormat'):
+                settings[name] = value.lower()
+            else:
+                settings[name] = value
+        except ValueError as e:
+            raise MeltdownException('Could not set "' + name + '"\n' + str(e))
+    meltdownRunner.checkTmRefinement(settings['TmRefinement'])
+    return settings
+
+
+def createParser():
+    parser = argparse.ArgumentParser(prog='MeltdownCli.py',
+                                     description='Analyse DSF results files with meltdown, without a user interface.')
+    parser.add_argument('data', nargs='+',
+                        help='DSF results files, folders of them, or glob patterns')
+    parser.add_argument('-c', '--contents-map', required=True,
+                        help='the contents map used for every data file')
+    parser.add_argument('-o', '--output-dir',
+                        help='folder the reports and extra output are written to (default: next to each data file)')
+    parser.add_argument('--settings', default=meltdownRunner.DEFAULT_SETTINGS_FILE,
+                        help='settings file to read the options from (default: meltdown\'s settings.ini)')
+    parser.add_argument('--set', dest='overrides', action='append', default=[], metavar='NAME=VALUE',
+                        help='override a setting from the settings file, can be given multiple times')
+    parser.add_argument('--data-only', action='store_true',
+                        help='only write the tm, well status, results json and normalised data files, not the reports '
+                             '(matplotlib and reportlab are never loaded)')
+    parser.add_argument('--workers', type=int,
+                        help='number of files analysed at the same time, 0 uses every core (overrides BatchWorkers)')
+    parser.add_argument('--summary',
+                        help='write a tab delimited summary of how each file went to this file')
+    parser.add_argument('--metrics',
+                        help='write the time each file and each stage of the analysis took as json to this file')
+    parser.add_argument('--aggregate', action='store_true',
+                        help='pool the replicates of every data file, as technical replicate plates (sets AggregatePlates)')
+    return parser
+
+
+def main(argv=None):
+    args = createParser().parse_args(argv)
+    try:
+        settings = applySettingOverrides(meltdownRunner.readSettings(args.settings), args.overrides)
+        if args.data_only:
+            settings.update(ProduceReport=False, ProduceTmData=True, ProduceWellStatusData=True,
+                            ProduceResultsJson=True, ProduceNormalisedData=True)
+        if args.workers is not None:
+            settings['BatchWorkers'] = args.workers
+        if args.aggregate:
+            settings['AggregatePlates'] = True
+        dataFiles = findDataFiles(args.data)
+        if not os.path.isfile(args.contents_map):
+            raise MeltdownException('Contents map "' + args.contents_map + '" not found')
+        if args.output_dir is not None and not os.path.isdir(args.output_dir):
+            os.makedirs(args.output_dir)
+    except (MeltdownException, OSError) as e:
+        sys.stderr.write('*error occured* ' + str(e) + '\n')
+        return EXIT_BAD_INPUT
+
+    startTime = time.time()
+    try:
+        results = meltdownRunner.analyseFiles(dataFiles, args.contents_map, settings, args.output_dir)
+    #the results database couldn't be opened
+    except MeltdownException as e:
+        sys.stderr.write('*error occured* ' + str(e) + '\n')
+        return EXIT_BAD_INPUT
+    #unexpected errors have their full traceback printed, as there is no error log
+    for result in results:
+        if result.errorLog:
+            sys.stderr.write(os.path.basename(result.filePath) + ':\n' + result.errorLog)
+
+    #remove any exported files in the directory of the data files, once all the files have been analysed
+    if settings['DeleteInputFiles']:
+        meltdownRunner.deleteInputFiles(results)
+    if args.summary:
+        meltdownRunner.writeSummary(results, args.summary, time.time() - startTime)
+    if args.metrics:
+        meltdownRunner.writeBatchMetrics(results, args.metrics, time.time() - startTime)
+    if settings['AggregatePlates']:
+        aggregateDirectory = args.output_dir or os.path.dirname(os.path.abspath(dataFiles[0]))
+        numPooled = meltdownRunner.writeAggregatedResults(results, os.path.join(aggregateDirectory, meltdownRunner.AGGREGATED_TMS_FILE_NAME),
+                                                          os.path.join(aggregateDirectory, meltdownRunner.AGGREGATED_PLATES_FILE_NAME))
+        print '*done* pooled the replicates of ' + str(numPooled) + ' plates'
+
+    numFailed = len([result for result in results if not result.succeeded])
+    print '*done* analysed ' + str(len(results) - numFailed) + ' of ' + str(len(results)) + ' files'
+    if numFailed > 0:
+        return EXIT_FILES_FAILED
+    return EXIT_SUCCESS
+
+#excecutes main() on file run
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+This .py file stores the plate wide melt curve classifiers. Every function works
+on a whole plate at once, where the curves are held as a single 2-D numpy array
+of shape (wells, temperatures), and all the wells share the same temperature array.
+
+The functions reproduce the original per well logic exactly (including the order
+in which floating point operations are done), so that the verdicts given for each
+well are identical to those that were calculated one curve at a time.
+
+"""
+
+import numpy as np
+
+#the max amount the flat saturated curves can fluctuate within the flat section
+SATURATION_FLUCTUATION_THRESHOLD = 0.005
+#how long a flat section on curve can be before it is considered saturated
+LENGTH_OF_FLAT_CONSIDERED_SATURATED = 10
+#the fraction of the total curve, at the end, that will not be iterated over for Tm calculation, as last section is unreliable
+FRACTION_OF_CURVE_NOT_CHECKED_FOR_TM = 0.125
+#number of times a monotonic curve can break its monotonicity but still be considered monotonic
+MONOTONIC_CONTRADICTION_LIMIT = 5
+#when finding sign changes in the derivative series, this is the forgiving threshold from 0
+SIGN_CHANGE_THRESH = 0.000001
+#the largest difference between the calculated Tm, and the mid point of the highest and lowest points on the curve before
+#curve is considered complex. None turns the check off, as it has never been applied by earlier versions of meltdown
+#(they set a flag that was never read), so it is off by default to keep their results. Try e.g. 5 in a threshold sweep
+MAX_DIFFERENCE_BETWEEN_TMS_BEFORE_COMPLEX = None
+
+#ways of finding the lowest point on the parabola fitted around the lowest derivative point
+#analytic takes the parabola's vertex directly, grid scans the parabola in 0.01 steps (as older versions of meltdown did)
+TM_REFINEMENT_ANALYTIC = 'analytic'
+TM_REFINEMENT_GRID = 'grid'
+TM_REFINEMENT = TM_REFINEMENT_ANALYTIC
+#number of decimal places analytic Tms are rounded to, None leaves them unrounded
+TM_DECIMAL_PLACES = 2
+
+
+def normalise(fluorescence, temperatures):
+    """
+    Normalises every curve so that the area under it is 1
+
+    Input: (wells, temperatures) array of raw fluorescence, and the temperature array
+
+    Output: Returns a tuple of the normalised curves, and the normalisation factor
+    of each curve (used to calculate the monotonicity thresholds)
+    """
+    stepSize = abs(temperatures[1] - temperatures[0])
+    #cumulative sum adds the points strictly left to right, like the original running total did
+    factors = np.cumsum(fluorescence * stepSize, axis=1)[:, -1]
+    return (fluorescence / factors[:, np.newaxis], factors)
+
+
+def derivatives(fluorescence, temperatures):
+    """
+    Gets the (negative) derivative series of every curve, each point is the slope
+    between successive points in the curve. There is one less point in each derivative
+    series than in the curves, the i'th point belonging to the i'th temperature
+    """
+    return -np.diff(fluorescence, axis=1) / np.diff(temperatures)
+
+
+def findSaturated(fluorescence, normalisedMins, normalisedMaxs,
+                  fluctuationThreshold=SATURATION_FLUCTUATION_THRESHOLD,
+                  flatLength=LENGTH_OF_FLAT_CONSIDERED_SATURATED):
+    """
+    Finds the curves that have a long flat section around their highest point
+
+    Input: normalised curves, and their minimum and maximum values
+
+    Output: Returns a tuple of a boolean array marking the saturated curves, and
+    the number of flat temperature steps found either side of each curve's maximum
+    """
+    numPoints = fluorescence.shape[1]
+    #first occurence of the maximum of each curve
+    maxInds = fluorescence.argmax(axis=1)[:, np.newaxis]
+    # A boundry defining how much the points can fluctuate and still be considered flat
+    lowFlatBoundries = normalisedMaxs - fluctuationThreshold*(normalisedMaxs - normalisedMins)
+    notFlat = ~(fluorescence > lowFlatBoundries[:, np.newaxis])
+    columns = np.arange(numPoints)
+    #the first point that is not flat, looking each way from the maximum
+    leftBreaks = np.where(notFlat & (columns < maxInds), columns, -1).max(axis=1)
+    rightBreaks = np.where(notFlat & (columns > maxInds), columns, numPoints).min(axis=1)
+    maxInds = maxInds[:, 0]
+    runLengths = (maxInds - 1 - leftBreaks) + (rightBreaks - maxInds - 1)
+    return (runLengths >= flatLength, runLengths)
+
+
+def findMonotonic(fluorescence, monotonicThresholds, contradictionLimit=MONOTONIC_CONTRADICTION_LIMIT):
+    """
+    Finds the curves that are decreasing monotonic. A curve stops being monotonic once
+    its contradiction counter (increased on a rise, decreased on a fall, never below 0)
+    reaches the contradiction limit (which should be at least 1)
+
+    Input: normalised curves, and the monotonic threshold of each curve
+
+    Output: Returns a boolean array marking the monotonic curves
+    """
+    return ~(peakContradictions(fluorescence, monotonicThresholds) >= contradictionLimit)
+
+
+def peakContradictions(fluorescence, monotonicThresholds):
+    """
+    Finds the highest value the contradiction counter of each curve reaches (see findMonotonic).
+    The counter only changes by one at a time, so a curve reaches any limit up to this value,
+    which lets the curves be checked against different limits without going over them again
+
+    Input: normalised curves, and the monotonic threshold of each curve
+
+    Output: Returns an integer array of the highest counter value of each curve
+    """
+    numWells, numPoints = fluorescence.shape
+    contradictions = np.zeros(numWells, dtype=int)
+    peaks = np.zeros(numWells, dtype=int)
+    #the counter depends on its previous value, so step along the temperatures, doing all the curves at once
+    for i in range(1, numPoints):
+        bound = fluorescence[:, i-1] + monotonicThresholds
+        rises = fluorescence[:, i] > bound
+        falls = (fluorescence[:, i] < bound) & (contradictions != 0)
+        contradictions += rises
+        contradictions -= falls
+        np.maximum(peaks, contradictions, out=peaks)
+    return peaks
+
+
+def findTms(derivativeSeries, temperatures, fractionNotChecked=FRACTION_OF_CURVE_NOT_CHECKED_FOR_TM,
+           refinement=TM_REFINEMENT, decimalPlaces=TM_DECIMAL_PLACES):
+    """
+    Finds the Tm of every curve, as the lowest point of its derivative series. Unless the
+    lowest point is at either end of the checked section, a parabola is fitted to it and its
+    two neighbours, and the Tm is the lowest point on the parabola. The analytic refinement
+    takes the vertex of the parabola (rounded to the given decimal places), the grid refinement
+    scans the parabola in 0.01 steps, reproducing Tms from older versions exactly
+
+    Input: derivative series of the curves, and the temperature array
+
+    Output: Returns a tuple of the Tms (nan where no Tm was found), and a boolean
+    array marking the curves where no Tm could be found
+    """
+    if refinement not in (TM_REFINEMENT_ANALYTIC, TM_REFINEMENT_GRID):
+        raise ValueError('Unknown Tm refinement "' + str(refinement) + '"')
+    numWells, numPoints = derivativeSeries.shape
+    tms = np.empty(numWells)
+    tms.fill(np.nan)
+    #since the end of the melt curves is often very unpredictable, we only search for a Tm up to a point
+    ignored = int(numPoints*fractionNotChecked)
+    checkedLength = numPoints - ignored if ignored != 0 else 0
+    if checkedLength == 0 or numWells == 0:
+        return (tms, np.ones(numWells, dtype=bool))
+
+    checked = derivativeSeries[:, :checkedLength]
+    rows = np.arange(numWells)
+    #first occurence of the lowest point, only counts if it is below 0
+    lowestInds = checked.argmin(axis=1)
+    noTm = ~(checked[rows, lowestInds] < 0)
+
+    #if lowest point was found to be at the start or end of the checked derivative series, then no curve fit is required
+    atEdge = ~noTm & ((lowestInds == 0) | (lowestInds == checkedLength - 1))
+    tms[atEdge] = temperatures[lowestInds[atEdge]]
+
+    fitted = rows[~noTm & ~atEdge]
+    if len(fitted) == 0:
+        return (tms, noTm)
+    middle = lowestInds[fitted]
+    xs = np.column_stack([temperatures[middle - 1], temperatures[middle], temperatures[middle + 1]])
+    Y = np.column_stack([derivativeSeries[fitted, middle - 1],
+                         derivativeSeries[fitted, middle],
+                         derivativeSeries[fitted, middle + 1]])
+    if refinement == TM_REFINEMENT_ANALYTIC:
+        tms[fitted] = parabolaVertices(xs, Y, decimalPlaces)
+    else:
+        tms[fitted] = gridScanParabolas(xs, Y)
+    return (tms, noTm)
+
+
+def parabolaVertices(xs, Y, decimalPlaces=TM_DECIMAL_PLACES):
+    """
+    Finds the vertex of the parabola through each row of 3 points in closed form. The middle
+    point is always the lowest of the 3, so every parabola opens upwards
+
+    Input: (curves, 3) arrays of the x and y values of the points
+
+    Output: Returns the x value of each vertex, rounded to the given decimal places
+    """
+    leftWidths = xs[:, 1] - xs[:, 0]
+    rightWidths = xs[:, 1] - xs[:, 2]
+    leftRises = Y[:, 1] - Y[:, 2]
+    rightRises = Y[:, 1] - Y[:, 0]
+    numerators = leftWidths**2*leftRises - rightWidths**2*rightRises
+    denominators = leftWidths*leftRises - rightWidths*rightRises
+    vertices = xs[:, 1] - 0.5*numerators/denominators
+    if decimalPlaces is not None:
+        vertices = np.round(vertices, decimalPlaces)
+    return vertices
+
+
+def gridScanParabolas(xs, Y):
+    """
+    Finds the lowest point on the parabola through each row of 3 points, by scanning between
+    the outer points in 0.01 steps (the original method of refining Tms)
+
+    Input: (curves, 3) arrays of the x and y values of the points
+
+    Output: Returns the x value of the lowest scanned point of each parabola
+    """
+    #power rather than squaring, to match how python squared the temperatures for each well
+    A = np.dstack([np.power(xs, 2.0), xs, np.ones(xs.shape)])
+    #solves for b, in the form Y=Ab, for every curve at once
+    coefficients = np.linalg.solve(A, Y)
+
+    lowestPoints = np.empty(len(xs))
+    for i, (a, b, c) in enumerate(coefficients):
+        #set tm to the lowest point on the fitted parabola rounded to nearest 0.01
+        grid = np.arange(xs[i, 0], xs[i, 2], 0.01)
+        points = a*np.power(grid, 2.0) + b*grid + c
+        lowest = points.argmin()
+        if points[lowest] < 0:
+            lowestPoints[i] = grid[lowest]
+        else:
+            #no point on the parabola is below 0, tm keeps its initial value of the left most point of the relevant curve
+            lowestPoints[i] = Y[i, 0]
+    return lowestPoints
+
+
+def curveSections(fluorescence):
+    """
+    Finds the lowest and highest points of every curve that complexity is checked between
+    (the last point of each curve is not used)
+
+    Input: normalised curves
+
+    Output: Returns a tuple of the index of the lowest point, the index of the highest point,
+    and a boolean array marking the curves where both were found
+    """
+    curves = fluorescence[:, :-1]
+    numWells, numPoints = curves.shape
+    rows = np.arange(numWells)
+    columns = np.arange(numPoints)
+
+    #the highest point only counts if it is above 0, and the lowest if it is below 1
+    highestInds = curves.argmax(axis=1)
+    valid = curves[rows, highestInds] > 0
+    #if the highest point is at the start, the lowest point is looked for over the whole curve,
+    #and the highest is then looked for after it. Otherwise the lowest is looked for before the highest
+    startsHighest = highestInds == 0
+    lowestSearch = np.where(startsHighest[:, np.newaxis], curves, np.where(columns <= highestInds[:, np.newaxis], curves, np.inf))
+    lowestInds = lowestSearch.argmin(axis=1)
+    valid &= lowestSearch[rows, lowestInds] < 1
+    highestSearch = np.where(columns >= lowestInds[:, np.newaxis], curves, -np.inf)
+    highestInds = np.where(startsHighest, highestSearch.argmax(axis=1), highestInds)
+    valid &= curves[rows, highestInds] > 0
+    return lowestInds, highestInds, valid
+
+
+def findComplex(fluorescence, derivativeSeries, signChangeThreshold=SIGN_CHANGE_THRESH):
+    """
+    Finds the complex curves, which have a sign change in their derivative series between
+    the lowest and highest points on the curve (the last point of each curve is not used)
+
+    Input: normalised curves, and their derivative series
+
+    Output: Returns a boolean array marking the complex curves
+    """
+    if fluorescence.shape[0] == 0:
+        return np.zeros(0, dtype=bool)
+    lowestInds, highestInds, valid = curveSections(fluorescence)
+
+    #each derivative point is compared to the one before it, only within the section between the
+    #lowest and highest points, and only when the previous point is not exactly 0
+    previous = derivativeSeries[:, :-1]
+    current = derivativeSeries[:, 1:]
+    signChanges = ((current + signChangeThreshold < 0) & (previous - signChangeThreshold > 0)) |\
+                  ((current - signChangeThreshold > 0) & (previous + signChangeThreshold < 0))
+    signChanges &= previous != 0
+    currentInds = np.arange(1, derivativeSeries.shape[1])
+    inSection = (currentInds >= lowestInds[:, np.newaxis] + 2) & (currentInds < highestInds[:, np.newaxis])
+    return valid & (signChanges & inSection).any(axis=1)
+
+
+def findMidpointTms(fluorescence, temperatures):
+    """
+    Another estimate of every curve's Tm, the first temperature from the lowest point on the curve
+    where the curve reaches the mid point of its lowest and highest points. Curves whose Tm is too far
+    from this are complex (see MAX_DIFFERENCE_BETWEEN_TMS_BEFORE_COMPLEX)
+
+    Input: normalised curves, and the temperature array
+
+    Output: Returns an array of the estimated Tms, nan where the lowest and highest points weren't found
+    """
+    numWells = fluorescence.shape[0]
+    if numWells == 0:
+        return np.zeros(0)
+    lowestInds, highestInds, valid = curveSections(fluorescence)
+    rows = np.arange(numWells)
+    averagePoints = (fluorescence[rows, lowestInds] + fluorescence[rows, highestInds]) / 2
+    #the highest point is never before the lowest, so the mid point is always reached by it
+    reached = (np.arange(fluorescence.shape[1]) >= lowestInds[:, np.newaxis]) & (fluorescence >= averagePoints[:, np.newaxis])
+    midpointTms = temperatures[reached.argmax(axis=1)].astype(float)
+    midpointTms[~valid] = np.nan
+    return midpointTms
+
+
+def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
+    root = Tkinter.Tk()
+    root.withdraw()
+    tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+This .py file stores the reader of DSF results files, the tab delimited export of
+the qPCR machine with a Temperature column followed by a column of fluorescence
+readings for each well.
+
+The file is parsed straight into a float array with a row per well, skipping the
+blank columns and rows that exports sometimes have. Problems are reported with
+the line number (and well) of the cell that caused them.
+
+Parsed files can also be cached next to the results file, as a .npy array of the
+fluorescence and a small json header of the well names and temperatures, so that
+analysing the same file again only has to memory map the array. The cache is only
+used while the results file's size and modification time (or contents) are the same.
+
+"""
+
+import os
+import json
+import hashlib
+import numpy as np
+
+from MeltdownException import MeltdownException
+
+#name of the column holding the temperatures
+TEMPERATURE_COLUMN = 'Temperature'
+
+#the cache of a results file is written next to it, named after it with these endings
+CACHE_HEADER_SUFFIX = '.meltdown-cache.json'
+CACHE_DATA_SUFFIX = '.meltdown-cache.npy'
+#changed whenever the layout of the cache changes, so older caches are ignored
+CACHE_FORMAT_VERSION = 1
+
+
+def splitCells(line):
+    #split a line of the file into its cells, ignoring the line ending
+    return line.rstrip('\r\n').split('\t')
+
+
+def describeBadCell(cells, lineNumber, columnNames):
+    #find the first cell of a line that isn't a number, for the error message
+    for cell, columnName in zip(cells, columnNames):
+        try:
+            float(cell)
+        except ValueError:
+            if cell.strip() == '':
+                return 'Empty value for "' + columnName + '" on line ' + str(lineNumber)
+            return 'Non numeric value "' + cell.strip() + '" for "' + columnName + '" on line ' + str(lineNumber)
+    return 'Could not read line ' + str(lineNumber)
+
+
+def readDsfFile(dataFilePath):
+    """
+    Reads a DSF results file
+
+    Output: Returns (well names, temperatures, fluorescence), the temperatures as a 1-D float array,
+    and the fluorescence as a 2-D float array with one row per well (in the order of the well names)
+    """
+    try:
+        dataFile = open(dataFilePath, 'rU')
+    except IOError as e:
+        raise MeltdownException('There was a problem reading the data file\n' + str(e))
+    with dataFile:
+        #==================read the header, keeping the temperature column and every column with a well name
+        header = [cell.strip() for cell in splitCells(dataFile.readline().lstrip('\xef\xbb\xbf'))]
+        if TEMPERATURE_COLUMN not in header:
+            raise MeltdownException('There was a problem reading the data file\nCould not find a "' + TEMPERATURE_COLUMN + '" column')
+        if header.count(TEMPERATURE_COLUMN) > 1:
+            raise MeltdownException('There was a problem reading the data file\nThere is more than one "' + TEMPERATURE_COLUMN + '" column')
+        #blank column headers are ignored (default pcrd export includes empty columns sometimes)
+        columns = [i for i, cell in enumerate(header) if cell != '']
+        wellNames = [header[i] for i in columns if header[i] != TEMPERATURE_COLUMN]
+        if len(wellNames) == 0:
+            raise MeltdownException('There was a problem reading the data file\nThere are no well columns')
+        if len(set(wellNames)) < len(wellNames):
+            duplicate = [wellName for wellName in wellNames if wellNames.count(wellName) > 1][0]
+            raise MeltdownException('There was a problem reading the data file\nWell "' + duplicate + '" has more than one column')
+        #the temperature is moved to the first column of the parsed rows
+        temperatureIndex = header.index(TEMPERATURE_COLUMN)
+        columns.remove(temperatureIndex)
+        columns.insert(0, temperatureIndex)
+        columnNames = [header[i] for i in columns]
+        #==================
+
+        #==================convert the cells of the kept columns line by line, skipping rows that are all blank
+        #(columns only need picking out if there are blank ones)
+        pickColumns = columns != range(len(header))
+        rows = []
+        lineNumbers = []
+        for lineNumber, line in enumerate(dataFile, 2):
+            cells = splitCells(line)
+            if len(cells) != len(header):
+                cells = (cells + [''] * len(header))[:len(header)]
+            if pickColumns:
+                cells = [cells[i] for i in columns]
+            try:
+                rows.append(map(float, cells))
+            except ValueError:
+                if all(cell.strip() == '' for cell in cells):
+                    continue
+                raise MeltdownException('The data file contains empty or non numeric values\n' + describeBadCell(cells, lineNumber, columnNames))
+            lineNumbers.append(lineNumber)
+        if len(rows) == 0:
+            raise MeltdownException('There was a problem reading the data file\nThere are no readings in the file')
+        #==================
+
+    values = np.array(rows, dtype=float)
+    temperatures = values[:, 0]
+    if not np.all(np.isfinite(temperatures)):
+        raise MeltdownException('The data file\'s temperatures must all be numbers')
+    notIncreasing = np.flatnonzero(np.diff(temperatures) <= 0)
+    if len(notIncreasing) > 0:
+        raise MeltdownException('The data file\'s temperatures must be increasing, but they are not on line ' + str(lineNumbers[notIncreasing[0] + 1]))
+    #one contiguous row of fluorescence readings per well
+    fluorescence = np.ascontiguousarray(values[:, 1:].T)
+    return wellNames, temperatures, fluorescence
+
+
+def fileHash(filePath):
+    #sha1 of a file's contents, read in chunks
+    sha1 = hashlib.sha1()
+    with open(filePath, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), ''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def readCache(cacheHeaderPath):
+    """
+    Reads a parsed results file from its cache, the fluorescence array is memory mapped (read only)
+
+    Output: Returns (header dictionary, well names, temperatures, fluorescence)
+    """
+    try:
+        with open(cacheHeaderPath) as fp:
+            header = json.load(fp)
+        if header.get('version') != CACHE_FORMAT_VERSION:
+            raise ValueError('cache was written by a different version of meltdown')
+        wellNames = [wellName.encode('utf-8') for wellName in header['wellNames']]
+        temperatures = np.array(header['temperatures'], dtype=float)
+        dataPath = os.path.join(os.path.dirname(cacheHeaderPath), header['dataFile'])
+        #a plain array view of the memory mapped file, so arrays computed from it aren't memmaps themselves
+        fluorescence = np.asarray(np.load(dataPath, mmap_mode='r'))
+    except (IOError, OSError, ValueError, KeyError) as e:
+        raise MeltdownException('There was a problem reading the cached data file "' + cacheHeaderPath + '"\n' + str(e))
+    if fluorescence.shape != (len(wellNames), len(temperatures)):
+        raise MeltdownException('The cached data file "' + cacheHeaderPath + '" does not match its header')
+    return header, wellNames, temperatures, fluorescence
+
+
+def readValidCache(dataFilePath):
+    #the cached copy of a results file, if there is one that is still up to date, otherwise None
+    cacheHeaderPath = dataFilePath + CACHE_HEADER_SUFFIX
+    if not os.path.isfile(cacheHeaderPath):
+        return None
+    try:
+        header, wellNames, temperatures, fluorescence = readCache(cacheHeaderPath)
+    except MeltdownException:
+        return None
+    fileStat = os.stat(dataFilePath)
+    if header.get('size') != fileStat.st_size:
+        return None
+    #a file with a new modification time (e.g. copied or touched) is still cached if its contents are the same
+    if header.get('mtime') != fileStat.st_mtime:
+        if header.get('sha1') != fileHash(dataFilePath):
+            return None
+        header['mtime'] = fileStat.st_mtime
+        #the cache is still used if its header can't be updated (e.g. the folder is read only), it is only checked again next time
+        try:
+            writeCacheHeader(cacheHeaderPath, header)
+        except (IOError, OSError):
+            pass
+    return wellNames, temperatures, fluorescence
+
+
+def writeCacheHeader(cacheHeaderPath, header):
+    #written to a temporary file first, so a cache is never seen half written
+    temporaryPath = cacheHeaderPath + '.' + str(os.getpid())
+    try:
+        with open(temporaryPath, 'w') as fp:
+            json.dump(header, fp)
+        try:
+            os.rename(temporaryPath, cacheHeaderPath)
+        except OSError:
+            #windows can't rename over an existing file, anywhere else the rename was refused
+            if os.name != 'nt' or not os.path.exists(cacheHeaderPath):
+                raise
+            os.remove(cacheHeaderPath)
+            os.rename(temporaryPath, cacheHeaderPath)
+    except (IOError, OSError):
+        #the temporary file is never left behind, whoever called this decides what a failed write means
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+        raise
+    return
+
+
+def writeCache(dataFilePath, wellNames, temperatures, fluorescence):
+    """
+    Caches a parsed results file next to it. Caching is only to speed up later analyses,
+    so if the cache can't be written (e.g. the folder is read only) nothing is cached
+    """
+    cacheDataPath = dataFilePath + CACHE_DATA_SUFFIX
+    temporaryPath = cacheDataPath + '.' + str(os.getpid())
+    try:
+        fileStat = os.stat(dataFilePath)
+        header = {'version': CACHE_FORMAT_VERSION,
+                  'size': fileStat.st_size,
+                  'mtime': fileStat.st_mtime,
+                  'sha1': fileHash(dataFilePath),
+                  'dataFile': os.path.basename(cacheDataPath),
+                  'wellNames': wellNames,
+                  'temperatures': list(temperatures)}
+        with open(temporaryPath, 'wb') as fp:
+            np.save(fp, np.ascontiguousarray(fluorescence, dtype=np.float64))
+        if os.path.exists(cacheDataPath):
+            os.remove(cacheDataPath)
+        os.rename(temporaryPath, cacheDataPath)
+        writeCacheHeader(dataFilePath + CACHE_HEADER_SUFFIX, header)
+    except (IOError, OSError):
+        if os.path.exists(temporaryPath):
+            os.remove(temporaryPath)
+    return
+
+
+def sourceFilePath(dataFilePath):
+    #the results file a cache header was made from, other paths are returned as they are
+    if dataFilePath.endswith(CACHE_HEADER_SUFFIX):
+        return dataFilePath[:-len(CACHE_HEADER_SUFFIX)]
+    return dataFilePath
+
+
+def isCacheFile(filePath):
+    #whether the path is one of the two files of a cache, rather than a results file
+    return filePath.endswith(CACHE_HEADER_SUFFIX) or filePath.endswith(CACHE_DATA_SUFFIX)
+
+
+def loadDsfFile(dataFilePath, useCache=False):
+    """
+    Gets the well names, temperatures and fluorescence of a results file, as readDsfFile does.
+    The path can also be of a cache header (ending in CACHE_HEADER_SUFFIX), which is read directly.
+    If useCache is set, an up to date cache of the file is used if there is one, otherwise the
+    file is parsed and then cached
+
+    Output: Returns (well names, temperatures, fluorescence)
+    """
+    if dataFilePath.endswith(CACHE_HEADER_SUFFIX):
+        return readCache(dataFilePath)[1:]
+    if not useCache or not os.path.isfile(dataFilePath):
+        return readDsfFile(dataFilePath)
+    cached = readValidCache(dataFilePath)
+    if cached is not None:
+        return cached
+    wellNames, temperatures, fluorescence = readDsfFile(dataFilePath)
+    writeCache(dataFilePath, wellNames, temperatures, fluorescence)
+    return wellNames, temperatures, fluorescence
+
+
+def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
+    root = Tkinter.Tk()
+    root.withdraw()
+    tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
+    return
+
+
+if __name__ == "__main__":
+    main()
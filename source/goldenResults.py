@@ -0,0 +1,462 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+Checks that a version of meltdown gives the same results as another (e.g. after speeding
+up the analysis), by analysing a corpus of plates with both and comparing the flags and
+Tm of every well, the replicate groups and Tms of the mean wells, and the control outcomes.
+
+Usage:
+python goldenResults.py snapshot -o FILE [--source MELTDOWN_DIR] [--plate DATA CONTENTS_MAP ...]
+                                 [--tm-refinement R] [--tm-decimal-places D]
+python goldenResults.py compare REFERENCE CANDIDATE [--plate DATA CONTENTS_MAP ...] [--tm-tolerance T]
+                                [--report FILE] [--reference-tm-refinement R] [--candidate-tm-refinement R]
+                                [--reference-tm-decimal-places D] [--candidate-tm-decimal-places D]
+
+A snapshot is the results of every plate of the corpus, as analysed by one meltdown folder
+(by default the one this file is in), saved as json so that golden results can be kept and
+checked against later. REFERENCE and CANDIDATE can each be a snapshot or a meltdown folder,
+which is snapshotted on the spot, e.g. to compare a release with the working copy:
+
+python source/goldenResults.py compare ../meltdown-1.0 .
+
+Unless plates are given, the corpus is the sample plate in the help folder and synthetic
+plates of every size (see syntheticPlates). Each meltdown folder is run in its own python
+process, so their modules never mix, using only what every version has (the wells, mean
+wells and controls of DsfAnalysis), so old releases can be the reference. Tms can differ by
+the tolerance, everything else must be the same. The exit code of compare is 0 if the
+results are the same, 1 if they differ, and 2 if they couldn't be compared.
+
+The analysis options (e.g. --tm-refinement) are given to each side of a compare on its own
+(e.g. --candidate-tm-refinement), since older versions don't take them, and can only be
+given to meltdown folders that do.
+
+"""
+
+import argparse
+import inspect
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import traceback
+
+#meltdown's own modules are only imported once the folder to analyse with is known (see useMeltdownFolder)
+
+#the running location of this file
+RUNNING_LOCATION = os.path.dirname(os.path.realpath(__file__))
+
+#changed whenever the layout of the snapshots changes
+SNAPSHOT_FORMAT_VERSION = 1
+
+#the sample plate, and the synthetic plates (wells, seed), of the default corpus
+SAMPLE_PLATE = (RUNNING_LOCATION + '/../help/Sample DSF Results.txt', RUNNING_LOCATION + '/../help/Sample Contents Map.txt')
+SYNTHETIC_PLATES = [(96, 0), (96, 1), (384, 0), (1536, 0)]
+
+#the flags of a well that are compared, and the DsfWell attribute of each
+WELL_FLAGS = [('Outlier', 'isOutlier'), ('Saturated', 'isSaturated'), ('Monotonic', 'isMonotonic'),
+              ('In The Noise', 'isInTheNoise'), ('Complex', 'isComplex'), ('Discarded', 'isDiscarded')]
+#the controls, and their keys in DsfAnalysis.controlsHash
+CONTROLS = [('Lysozyme', 'lysozyme'), ('No Dye', 'no dye'), ('No Protein', 'no protein')]
+
+#options of DsfAnalysis that can be set, and their command line options (for compare, each side has its own)
+ANALYSIS_OPTIONS = [('tmRefinement', '--tm-refinement'), ('tmDecimalPlaces', '--tm-decimal-places')]
+#the sides of a compare
+SIDES = ['reference', 'candidate']
+
+#largest difference between Tms (degrees) that is still the same result
+TM_TOLERANCE = 0.01
+#the most wells listed for each difference in the report
+MAX_WELLS_LISTED = 8
+
+#exit codes of compare
+EXIT_SAME = 0
+EXIT_DIFFERENT = 1
+EXIT_BAD_INPUT = 2
+
+
+def sourceFolder(meltdownFolder):
+    #the folder of the python files of a meltdown folder, which can also be given directly
+    if os.path.isdir(os.path.join(meltdownFolder, 'source')):
+        return os.path.join(meltdownFolder, 'source')
+    return meltdownFolder
+
+
+def useMeltdownFolder(meltdownFolder):
+    #makes the meltdown modules that are imported come from the given folder, rather than this file's
+    folder = os.path.realpath(sourceFolder(meltdownFolder))
+    sys.path[:] = [path for path in sys.path if os.path.realpath(path or '.') != RUNNING_LOCATION]
+    sys.path.insert(0, folder)
+    #modules of this folder that were already imported (e.g. to make the synthetic plates) are forgotten
+    for name, module in sys.modules.items():
+        moduleFile = getattr(module, '__file__', None)
+        if name != '__main__' and moduleFile is not None and os.path.dirname(os.path.realpath(moduleFile)) == RUNNING_LOCATION:
+            del sys.modules[name]
+    return folder
+
+
+def checkAnalysisOptions(meltdownFolder, analysisOptions):
+    #raises a ValueError if the imported DsfAnalysis (see useMeltdownFolder) doesn't take the options
+    from DsfAnalysis import DsfAnalysis
+    taken = inspect.getargspec(DsfAnalysis.__init__).args
+    notTaken = [commandLineOption for option, commandLineOption in ANALYSIS_OPTIONS
+                if option in analysisOptions and option not in taken]
+    if len(notTaken) > 0:
+        raise ValueError('The meltdown in "' + meltdownFolder + '" does not take ' + ', '.join(notTaken))
+    return
+
+
+def number(value):
+    #a result as a float, or None if there is none (None or nan)
+    if value is None or math.isnan(value):
+        return None
+    return float(value)
+
+
+def plateSnapshot(dataFilePath, contentsMapFilePath, analysisOptions):
+    """
+    Analyses a plate with the meltdown modules that are imported (see useMeltdownFolder)
+
+    Input: the plate's results file and contents map, and any options given to DsfAnalysis
+    (e.g. tmRefinement), which are left out if none are given, as older versions had none
+
+    Output: Returns a dictionary of the plate's wells, mean wells and controls
+    """
+    from DsfAnalysis import DsfAnalysis
+    experiment = DsfAnalysis(os.path.basename(dataFilePath), **analysisOptions)
+    experiment.loadCurves(dataFilePath, contentsMapFilePath)
+    experiment.analyseCurves()
+    wells = {}
+    for wellName, well in experiment.plate.wells.items():
+        wells[wellName] = dict([(flag, bool(getattr(well, attribute))) for flag, attribute in WELL_FLAGS])
+        wells[wellName]['Tm'] = number(well.tm)
+    meanWells = [{"Replicates": sorted(meanWell.replicates),
+                  "Tm": number(meanWell.tm),
+                  "Tm Error": number(meanWell.tmError),
+                  "Complex": bool(meanWell.isComplex),
+                  "Replicates Not Discarded": int(meanWell.numReplicatesNotDiscarded)} for meanWell in experiment.meanWells]
+    return {"Wells": wells,
+            "Mean Wells": sorted(meanWells, key=lambda meanWell: meanWell["Replicates"]),
+            "Controls": dict([(control, experiment.controlsHash[key]) for control, key in CONTROLS]),
+            "Error": ''}
+
+
+def snapshot(plates, analysisOptions={}):
+    """
+    Analyses every plate of a corpus, plates that fail have their error kept instead of their results
+
+    Input: list of (results file, contents map) pairs, and any options given to DsfAnalysis
+
+    Output: Returns the snapshot, a dictionary of the plates' results keyed by their file names
+    """
+    results = {}
+    for dataFilePath, contentsMapFilePath in plates:
+        name = os.path.basename(dataFilePath)
+        if name in results:
+            raise ValueError('More than one plate is named "' + name + '"')
+        try:
+            results[name] = plateSnapshot(dataFilePath, contentsMapFilePath, analysisOptions)
+        except Exception as e:
+            results[name] = {"Error": type(e).__name__ + ': ' + str(e)}
+    return results
+
+
+def snapshotDescription(plates, meltdownFolder):
+    #a snapshot, with the version of meltdown that made it
+    try:
+        with open(os.path.join(sourceFolder(meltdownFolder), '..', 'VERSION.txt')) as versionFile:
+            version = versionFile.readline().strip()
+    except IOError:
+        version = None
+    return {"Snapshot Format Version": SNAPSHOT_FORMAT_VERSION,
+            "Meltdown Folder": os.path.abspath(meltdownFolder),
+            "Meltdown Version": version,
+            "Plates": plates}
+
+
+def readSnapshot(filePath):
+    with open(filePath) as fp:
+        description = json.load(fp)
+    if description.get("Snapshot Format Version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError('"' + filePath + '" is not a snapshot made by this version of goldenResults')
+    return description
+
+
+def snapshotInProcess(meltdownFolder, plates, analysisOptions):
+    """
+    Snapshots a corpus with a meltdown folder, in a new python process so that its modules are its own
+
+    Output: Returns the snapshot description (see snapshotDescription)
+    """
+    directory = tempfile.mkdtemp(prefix='meltdown-golden-')
+    try:
+        snapshotFilePath = os.path.join(directory, 'snapshot.json')
+        command = [sys.executable, os.path.realpath(__file__), 'snapshot', '-o', snapshotFilePath, '--source', meltdownFolder]
+        for dataFilePath, contentsMapFilePath in plates:
+            command += ['--plate', dataFilePath, contentsMapFilePath]
+        for option, commandLineOption in ANALYSIS_OPTIONS:
+            if option in analysisOptions:
+                command += [commandLineOption, str(analysisOptions[option])]
+        if subprocess.call(command) != 0:
+            raise ValueError('Could not snapshot the plates with "' + meltdownFolder + '"')
+        return readSnapshot(snapshotFilePath)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def syntheticCorpus(directory):
+    #writes the synthetic plates of the default corpus to the directory, returning their (results file, contents map) pairs
+    import syntheticPlates
+    plates = []
+    for numWells, seed in SYNTHETIC_PLATES:
+        name = os.path.join(directory, 'synthetic-' + str(numWells) + '-' + str(seed))
+        syntheticPlates.writePlate(name + '.txt', name + '-contents.txt', numWells, 0.5, seed)
+        plates.append((name + '.txt', name + '-contents.txt'))
+    return plates
+
+
+class PlateComparison:
+    def __init__(self, name):
+        #the differences between the reference and candidate results of one plate
+        self.name = name
+        self.numWells = 0
+        self.numMeanWells = 0
+        #plate missing from either snapshot, or errors that stopped either analysing it
+        self.problems = []
+        #well names only in one of the snapshots
+        self.wellsOnlyInReference = []
+        self.wellsOnlyInCandidate = []
+        #wells whose flag differs, keyed by the flag
+        self.flagDifferences = {}
+        #(well, reference tm, candidate tm) of the wells whose Tms differ by more than the tolerance
+        self.tmDifferences = []
+        #replicate groups of the mean wells that are only in one of the snapshots
+        self.groupsOnlyInReference = []
+        self.groupsOnlyInCandidate = []
+        #(replicates, what differs, reference value, candidate value) of the mean wells of the same replicates
+        self.meanWellDifferences = []
+        #(control, reference outcome, candidate outcome)
+        self.controlDifferences = []
+        return
+
+    def isSame(self):
+        return not (self.problems or self.wellsOnlyInReference or self.wellsOnlyInCandidate or self.flagDifferences or
+                    self.tmDifferences or self.groupsOnlyInReference or self.groupsOnlyInCandidate or
+                    self.meanWellDifferences or self.controlDifferences)
+
+
+def tmsDiffer(referenceTm, candidateTm, tmTolerance):
+    #whether two results differ, they can be None if there wasn't one
+    if referenceTm is None or candidateTm is None:
+        return referenceTm is not candidateTm
+    return abs(referenceTm - candidateTm) > tmTolerance + 1e-9
+
+
+def comparePlate(name, reference, candidate, tmTolerance=TM_TOLERANCE):
+    """
+    Compares the results of a plate in two snapshots
+
+    Output: Returns a PlateComparison
+    """
+    comparison = PlateComparison(name)
+    if reference is None or candidate is None:
+        comparison.problems.append('only in the ' + ('candidate' if reference is None else 'reference'))
+        return comparison
+    for side, results in [('reference', reference), ('candidate', candidate)]:
+        if results["Error"]:
+            comparison.problems.append('the ' + side + ' failed: ' + results["Error"])
+    if comparison.problems:
+        return comparison
+
+    #==================the wells
+    comparison.numWells = len(reference["Wells"])
+    comparison.wellsOnlyInReference = sorted(set(reference["Wells"]) - set(candidate["Wells"]))
+    comparison.wellsOnlyInCandidate = sorted(set(candidate["Wells"]) - set(reference["Wells"]))
+    for wellName in sorted(set(reference["Wells"]) & set(candidate["Wells"])):
+        referenceWell = reference["Wells"][wellName]
+        candidateWell = candidate["Wells"][wellName]
+        for flag, attribute in WELL_FLAGS:
+            if referenceWell[flag] != candidateWell[flag]:
+                comparison.flagDifferences.setdefault(flag, []).append(wellName)
+        if tmsDiffer(referenceWell["Tm"], candidateWell["Tm"], tmTolerance):
+            comparison.tmDifferences.append((wellName, referenceWell["Tm"], candidateWell["Tm"]))
+    #==================
+
+    #==================the mean wells, matched by their replicates
+    comparison.numMeanWells = len(reference["Mean Wells"])
+    referenceMeanWells = dict([(tuple(meanWell["Replicates"]), meanWell) for meanWell in reference["Mean Wells"]])
+    candidateMeanWells = dict([(tuple(meanWell["Replicates"]), meanWell) for meanWell in candidate["Mean Wells"]])
+    comparison.groupsOnlyInReference = sorted(set(referenceMeanWells) - set(candidateMeanWells))
+    comparison.groupsOnlyInCandidate = sorted(set(candidateMeanWells) - set(referenceMeanWells))
+    for replicates in sorted(set(referenceMeanWells) & set(candidateMeanWells)):
+        referenceMeanWell = referenceMeanWells[replicates]
+        candidateMeanWell = candidateMeanWells[replicates]
+        for key in ["Tm", "Tm Error"]:
+            if tmsDiffer(referenceMeanWell[key], candidateMeanWell[key], tmTolerance):
+                comparison.meanWellDifferences.append((replicates, key, referenceMeanWell[key], candidateMeanWell[key]))
+        for key in ["Complex", "Replicates Not Discarded"]:
+            if referenceMeanWell[key] != candidateMeanWell[key]:
+                comparison.meanWellDifferences.append((replicates, key, referenceMeanWell[key], candidateMeanWell[key]))
+    #==================
+
+    for control, key in CONTROLS:
+        if reference["Controls"][control] != candidate["Controls"][control]:
+            comparison.controlDifferences.append((control, reference["Controls"][control], candidate["Controls"][control]))
+    return comparison
+
+
+def compareSnapshots(reference, candidate, tmTolerance=TM_TOLERANCE):
+    #compares every plate in either snapshot, returning the list of PlateComparisons in the order of the plates' names
+    names = sorted(set(reference["Plates"]) | set(candidate["Plates"]))
+    return [comparePlate(name, reference["Plates"].get(name), candidate["Plates"].get(name), tmTolerance) for name in names]
+
+
+def listed(items):
+    #a short list of items for the report
+    items = [str(item) for item in items]
+    if len(items) > MAX_WELLS_LISTED:
+        return ', '.join(items[:MAX_WELLS_LISTED]) + ' and ' + str(len(items) - MAX_WELLS_LISTED) + ' more'
+    return ', '.join(items)
+
+
+def formatTm(tm):
+    return 'none' if tm is None else '%.3f' % tm
+
+
+def comparisonReport(comparisons, reference, candidate, tmTolerance=TM_TOLERANCE):
+    """
+    A short report of the differences between two snapshots, one line per plate that is the
+    same, and a line per kind of difference for plates that aren't
+
+    Output: Returns the report as a string
+    """
+    lines = ['Reference: ' + str(reference["Meltdown Folder"]) + ' (version ' + str(reference["Meltdown Version"]) + ')',
+             'Candidate: ' + str(candidate["Meltdown Folder"]) + ' (version ' + str(candidate["Meltdown Version"]) + ')',
+             'Tm tolerance: ' + str(tmTolerance), '']
+    for comparison in comparisons:
+        if comparison.isSame():
+            lines.append(comparison.name + ': same (' + str(comparison.numWells) + ' wells, ' + str(comparison.numMeanWells) + ' mean wells)')
+            continue
+        lines.append(comparison.name + ': DIFFERENT')
+        for problem in comparison.problems:
+            lines.append('    ' + problem)
+        if comparison.wellsOnlyInReference:
+            lines.append('    wells only in the reference: ' + listed(comparison.wellsOnlyInReference))
+        if comparison.wellsOnlyInCandidate:
+            lines.append('    wells only in the candidate: ' + listed(comparison.wellsOnlyInCandidate))
+        for flag, attribute in WELL_FLAGS:
+            if flag in comparison.flagDifferences:
+                wellNames = comparison.flagDifferences[flag]
+                lines.append('    ' + flag + ' differs for ' + str(len(wellNames)) + ' wells: ' + listed(wellNames))
+        if comparison.tmDifferences:
+            lines.append('    Tm differs for ' + str(len(comparison.tmDifferences)) + ' wells: ' +
+                         listed([wellName + ' ' + formatTm(referenceTm) + ' -> ' + formatTm(candidateTm)
+                                 for wellName, referenceTm, candidateTm in comparison.tmDifferences]))
+        if comparison.groupsOnlyInReference:
+            lines.append('    replicate groups only in the reference: ' + listed(['/'.join(group) for group in comparison.groupsOnlyInReference]))
+        if comparison.groupsOnlyInCandidate:
+            lines.append('    replicate groups only in the candidate: ' + listed(['/'.join(group) for group in comparison.groupsOnlyInCandidate]))
+        if comparison.meanWellDifferences:
+            lines.append('    mean wells differ ' + str(len(comparison.meanWellDifferences)) + ' times: ' +
+                         listed(['/'.join(replicates) + ' ' + key + ' ' + str(referenceValue) + ' -> ' + str(candidateValue)
+                                 for replicates, key, referenceValue, candidateValue in comparison.meanWellDifferences]))
+        for control, referenceOutcome, candidateOutcome in comparison.controlDifferences:
+            lines.append('    ' + control + ' control ' + referenceOutcome + ' -> ' + candidateOutcome)
+    numSame = len([comparison for comparison in comparisons if comparison.isSame()])
+    lines += ['', str(numSame) + ' of ' + str(len(comparisons)) + ' plates are the same']
+    return '\n'.join(lines) + '\n'
+
+
+def analysisOptionsOf(args, side=None):
+    #the options given to DsfAnalysis (for a compare, those of one side), only those that were set, as older versions don't take them
+    prefix = '' if side is None else side + '-'
+    analysisOptions = {}
+    for option, commandLineOption in ANALYSIS_OPTIONS:
+        value = getattr(args, (prefix + commandLineOption.lstrip('-')).replace('-', '_'))
+        if value is not None:
+            analysisOptions[option] = value
+    return analysisOptions
+
+
+def createParser():
+    parser = argparse.ArgumentParser(prog='goldenResults.py',
+                                     description='Check that two versions of meltdown give the same results.')
+    commands = parser.add_subparsers(dest='command')
+    snapshotParser = commands.add_parser('snapshot', help='save the results of the corpus, as analysed by a meltdown folder')
+    snapshotParser.add_argument('-o', '--output', required=True,
+                                help='json file the snapshot is written to')
+    snapshotParser.add_argument('--source', default=os.path.join(RUNNING_LOCATION, '..'),
+                                help='meltdown folder to analyse the plates with (default: this one)')
+    compareParser = commands.add_parser('compare', help='compare the results of two snapshots or meltdown folders')
+    compareParser.add_argument('reference',
+                               help='the snapshot or meltdown folder with the expected results')
+    compareParser.add_argument('candidate',
+                               help='the snapshot or meltdown folder being checked')
+    compareParser.add_argument('--tm-tolerance', type=float, default=TM_TOLERANCE,
+                               help='largest difference between Tms that is the same result (default: ' + str(TM_TOLERANCE) + ')')
+    compareParser.add_argument('--report',
+                               help='also write the report to this file')
+    for commandParser in [snapshotParser, compareParser]:
+        commandParser.add_argument('--plate', nargs=2, action='append', default=[], metavar=('DATA', 'CONTENTS_MAP'),
+                                   help='a plate of the corpus, can be given multiple times '
+                                        '(default: the sample plate and synthetic plates)')
+    #the analysis options, for compare each side's are given on their own as only some versions take them
+    for commandParser, prefix, whose in [(snapshotParser, '--', 'the')] + [(compareParser, '--' + side + '-', 'the ' + side + "'s")
+                                                                          for side in SIDES]:
+        commandParser.add_argument(prefix + 'tm-refinement',
+                                   help='TmRefinement of ' + whose + ' analysis, only for versions that have it (default: their own)')
+        commandParser.add_argument(prefix + 'tm-decimal-places', type=int,
+                                   help='TmDecimalPlaces of ' + whose + ' analysis, only for versions that have it (default: their own)')
+    return parser
+
+
+def main(argv=None):
+    args = createParser().parse_args(argv)
+    directory = tempfile.mkdtemp(prefix='meltdown-corpus-')
+    try:
+        plates = [tuple(plate) for plate in args.plate]
+        if len(plates) == 0:
+            plates = [SAMPLE_PLATE] + syntheticCorpus(directory)
+
+        if args.command == 'snapshot':
+            analysisOptions = analysisOptionsOf(args)
+            useMeltdownFolder(args.source)
+            checkAnalysisOptions(args.source, analysisOptions)
+            with open(args.output, 'w') as fp:
+                json.dump(snapshotDescription(snapshot(plates, analysisOptions), args.source), fp, indent=1, sort_keys=True)
+            return EXIT_SAME
+
+        snapshots = []
+        for side, path in zip(SIDES, [args.reference, args.candidate]):
+            analysisOptions = analysisOptionsOf(args, side)
+            if os.path.isdir(path):
+                snapshots.append(snapshotInProcess(path, plates, analysisOptions))
+            elif len(analysisOptions) > 0:
+                raise ValueError('The ' + side + ' "' + path + '" is a snapshot, its analysis options can only be given when it is snapshotted')
+            else:
+                snapshots.append(readSnapshot(path))
+    except (IOError, OSError, ValueError) as e:
+        sys.stderr.write('*error occured* ' + str(e) + '\n')
+        return EXIT_BAD_INPUT
+    except Exception:
+        sys.stderr.write('*error occured*\n' + traceback.format_exc())
+        return EXIT_BAD_INPUT
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    reference, candidate = snapshots
+    comparisons = compareSnapshots(reference, candidate, args.tm_tolerance)
+    report = comparisonReport(comparisons, reference, candidate, args.tm_tolerance)
+    sys.stdout.write(report)
+    if args.report:
+        with open(args.report, 'w') as fp:
+            fp.write(report)
+    if all([comparison.isSame() for comparison in comparisons]):
+        return EXIT_SAME
+    return EXIT_DIFFERENT
+
+#excecutes main() on file run
+if __name__ == "__main__":
+    sys.exit(main())
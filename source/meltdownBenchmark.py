@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+Benchmarks meltdown on synthetic plates (see syntheticPlates), timing every stage of
+the analysis of a plate and the outputs made from it, to catch slowdowns between
+versions and to size the computers a screen's throughput needs.
+
+Usage:
+python meltdownBenchmark.py [--wells N [N ...]] [--steps STEP [STEP ...]] [--repeats N]
+                            [--seed N] [-o FILE] [--no-report] [--settings FILE] [--keep DIR]
+
+Every plate size is benchmarked at every temperature step, each run in a fresh process so
+that the peak memory of a run isn't hidden by the runs before it. The stages timed are
+reading the contents map, reading the results file (DsfPlate), each analysis stage of the
+plate (outliers, saturations, monotonicities, the negative controls, in the noise, tms,
+complexities), the mean wells and positive controls, each extra output, and the report.
+The analysis options and report workers are read from settings.ini (or --settings).
+
+The results are written as json: the computer and versions the benchmark was run on, the
+seconds and peak memory (the process's peak resident memory once the stage has finished,
+which isn't available on Windows) of every stage of every run, and the median seconds of
+each stage (and of the whole run) over the repeats.
+
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+import numpy as np
+
+from DsfAnalysis import DsfAnalysis, NORMALISED_BINARY, reportlabFound
+from DsfPlate import OUTLIERS, SATURATIONS, MONOTONICITIES, IN_THE_NOISES, TMS, COMPLEXITIES
+from ContentsMap import ContentsMap, NO_DYE, NO_PROTEIN
+from MeltdownException import MeltdownException
+import referenceCurves as rc
+import syntheticPlates
+from plateFormats import PLATE_LAYOUTS
+import meltdownRunner
+from runMetrics import StageTimer, CONTENTS_MAP, READ_DATA, NEGATIVE_CONTROLS, MEAN_WELLS, NORMALISED_DATA, TM_DATA, \
+    WELL_STATUS_DATA, RESULTS_JSON, REPORT
+
+#changed whenever the layout of the benchmark json changes
+BENCHMARK_FORMAT_VERSION = 1
+
+#the stages that are timed (see runMetrics), in the order they are run
+BENCHMARK_STAGES = (CONTENTS_MAP, READ_DATA, OUTLIERS, SATURATIONS, MONOTONICITIES, NEGATIVE_CONTROLS, IN_THE_NOISES,
+                    TMS, COMPLEXITIES, MEAN_WELLS, NORMALISED_DATA, TM_DATA, WELL_STATUS_DATA, RESULTS_JSON, REPORT)
+#the summary of a whole run
+TOTAL = 'total'
+
+
+def benchmarkPlate(dataFilePath, contentsMapFilePath, outputBase, settings, produceReport=True):
+    """
+    Runs and times every stage of the analysis of one plate, and the outputs made from it
+
+    Input: the plate's results file and contents map, the path (without extension) the outputs are
+    written to, the analysis options (as read by meltdownRunner.readSettings), and whether to make the report
+
+    Output: Returns a list of the stages' results, each a dictionary of the stage, seconds and peak memory (see runMetrics.StageTimer)
+    """
+    timer = StageTimer()
+    if settings['NoDyeReferenceCurve']:
+        rc.registerReferenceCurveFile(NO_DYE, settings['NoDyeReferenceCurve'])
+    if settings['NoProteinReferenceCurve']:
+        rc.registerReferenceCurveFile(NO_PROTEIN, settings['NoProteinReferenceCurve'])
+    experiment = DsfAnalysis(os.path.basename(dataFilePath), settings['TmRefinement'], settings['TmDecimalPlaces'])
+    #the contents map is read on its own, so reading the results file can be timed without it
+    contentsMap = timer.time(CONTENTS_MAP, ContentsMap, contentsMapFilePath)
+    timer.time(READ_DATA, experiment.loadCurves, dataFilePath, contentsMap)
+
+    #the stages of DsfAnalysis.analyseWells, one at a time
+    plate = experiment.plate
+    timer.time(OUTLIERS, plate.computeOutliers)
+    timer.time(SATURATIONS, plate.computeSaturations)
+    timer.time(MONOTONICITIES, plate.computeMonotonicities)
+    timer.time(NEGATIVE_CONTROLS, experiment.doNegativeControls)
+    timer.time(IN_THE_NOISES, lambda: plate.computeInTheNoises(experiment.controlsHash["no protein"] == "Passed"))
+    timer.time(TMS, plate.computeTms, experiment.tmRefinement, experiment.tmDecimalPlaces)
+    timer.time(COMPLEXITIES, plate.computeComplexities)
+    #every well stage is up to date, so this only makes the mean wells and checks the positive controls
+    timer.time(MEAN_WELLS, experiment.analyseCurves)
+
+    if settings['NormalisedDataFormat'] == NORMALISED_BINARY:
+        normalisedFilePath = outputBase + '-normalised.npz'
+    elif settings['CompressNormalisedData']:
+        normalisedFilePath = outputBase + '-normalised.txt.gz'
+    else:
+        normalisedFilePath = outputBase + '-normalised.txt'
+    timer.time(NORMALISED_DATA, experiment.produceNormalisedOutput, normalisedFilePath, settings['NormalisedDataFormat'],
+               settings['NormalisedDataNumberFormat'], settings['CompressNormalisedData'])
+    timer.time(TM_DATA, experiment.produceExportedTmData, outputBase + '-tms.txt')
+    timer.time(WELL_STATUS_DATA, experiment.produceWellStatusData, outputBase + '-wells.txt')
+    timer.time(RESULTS_JSON, experiment.produceResultsJson, outputBase + '-results.json', meltdownRunner.VERSION)
+    if produceReport:
+        timer.time(REPORT, experiment.generateReport, outputBase + '.pdf', meltdownRunner.VERSION,
+                   settings['ReportWorkers'], settings['VectorGraphs'])
+    return timer.stages()
+
+
+def benchmarkPlateTask(connection, args):
+    #runs in its own process, sending back the stages, or the error that stopped the run
+    try:
+        connection.send((benchmarkPlate(*args), ''))
+    except MeltdownException as e:
+        connection.send(([], e.message))
+    except Exception as e:
+        connection.send(([], 'Unexpected error: ' + (str(e) or type(e).__name__) + '\n' + traceback.format_exc()))
+    connection.close()
+    return
+
+
+def benchmarkPlateInProcess(*args):
+    """
+    Runs benchmarkPlate in a new process, so that its peak memory is its own. The process
+    isn't a pool worker, so the report can still be drawn by a pool of its own
+
+    Output: Returns (the list of stage results, error message or '' if the run finished)
+    """
+    receiver, sender = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target=benchmarkPlateTask, args=(sender, args))
+    process.start()
+    sender.close()
+    try:
+        stages, error = receiver.recv()
+    #the process died without sending anything back (e.g. it ran out of memory)
+    except EOFError:
+        stages, error = [], 'The benchmark process stopped unexpectedly'
+    process.join()
+    return stages, error
+
+
+def summarise(runs):
+    """
+    The median and fastest seconds of each stage (and of the whole run) over the repeats of every plate
+    size and temperature step, and their highest peak memory, for comparing benchmarks against each other
+
+    Output: Returns a list of dictionaries, one per plate size, temperature step and stage
+    """
+    summary = []
+    for wells, step in sorted(set([(run["Wells"], run["Temperature Step"]) for run in runs])):
+        #runs that failed are left out, as they didn't run every stage
+        repeats = [run for run in runs if (run["Wells"], run["Temperature Step"]) == (wells, step) and run["Error"] == '']
+        if len(repeats) == 0:
+            continue
+        for stageName in BENCHMARK_STAGES + (TOTAL,):
+            if stageName == TOTAL:
+                results = [(run["Total Seconds"], run["Peak Memory MB"]) for run in repeats]
+            else:
+                results = [(stage["Seconds"], stage["Peak Memory MB"]) for run in repeats for stage in run["Stages"]
+                           if stage["Stage"] == stageName]
+            if len(results) == 0:
+                continue
+            seconds, memories = zip(*results)
+            memories = [memory for memory in memories if memory is not None]
+            summary.append({"Wells": wells,
+                            "Temperature Step": step,
+                            "Stage": stageName,
+                            "Median Seconds": float(np.median(seconds)),
+                            "Fastest Seconds": min(seconds),
+                            "Peak Memory MB": max(memories) if len(memories) > 0 else None})
+    return summary
+
+
+def runBenchmarks(wellCounts, temperatureSteps, repeats, seed, settings, produceReport, directory):
+    """
+    Benchmarks every plate size at every temperature step, repeats times each. The plates and
+    their outputs are written to the directory
+
+    Output: Returns a list of the runs, each a dictionary of the plate and its stages' results
+    """
+    runs = []
+    for numWells in wellCounts:
+        for temperatureStep in temperatureSteps:
+            name = 'synthetic-' + str(numWells) + '-' + str(temperatureStep)
+            dataFilePath = os.path.join(directory, name + '.txt')
+            contentsMapFilePath = os.path.join(directory, name + '-contents.txt')
+            plate = syntheticPlates.writePlate(dataFilePath, contentsMapFilePath, numWells, temperatureStep, seed)
+            for repeat in range(repeats):
+                stages, error = benchmarkPlateInProcess(dataFilePath, contentsMapFilePath, os.path.join(directory, name),
+                                                        settings, produceReport)
+                runs.append({"Wells": numWells,
+                             "Temperatures": len(plate.temperatures),
+                             "Temperature Step": temperatureStep,
+                             "Seed": seed,
+                             "Repeat": repeat,
+                             "Stages": stages,
+                             "Total Seconds": sum([stage["Seconds"] for stage in stages]),
+                             "Peak Memory MB": stages[-1]["Peak Memory MB"] if len(stages) > 0 else None,
+                             "Error": error})
+                print str(numWells) + ' wells, step ' + str(temperatureStep) + ', repeat ' + str(repeat + 1) + ': ' + \
+                    ('%.3fs' % runs[-1]["Total Seconds"] if error == '' else 'failed, ' + error.split('\n')[0])
+    return runs
+
+
+def benchmarkDescription(runs, settings, produceReport):
+    #the benchmark's results, with what they were run on and with
+    return {"Benchmark Format Version": BENCHMARK_FORMAT_VERSION,
+            "Meltdown Version": meltdownRunner.VERSION,
+            "Date": time.strftime('%Y-%m-%d %H:%M:%S'),
+            "Python Version": platform.python_version(),
+            "Numpy Version": np.__version__,
+            "Platform": platform.platform(),
+            "Processor": platform.processor(),
+            "Processors": multiprocessing.cpu_count(),
+            "Settings": dict([(name, settings[name]) for name in ['TmRefinement', 'TmDecimalPlaces', 'ReportWorkers', 'VectorGraphs',
+                                                                  'NormalisedDataFormat', 'NormalisedDataNumberFormat',
+                                                                  'CompressNormalisedData']]),
+            "Report": produceReport,
+            "Runs": runs,
+            "Summary": summarise(runs)}
+
+
+def createParser():
+    parser = argparse.ArgumentParser(prog='meltdownBenchmark.py',
+                                     description='Time every stage of meltdown on synthetic plates.')
+    parser.add_argument('--wells', type=int, nargs='+', default=sorted(PLATE_LAYOUTS.keys()),
+                        help='plate sizes to benchmark (default: 96 384 1536)')
+    parser.add_argument('--steps', type=float, nargs='+', default=[0.5],
+                        help='temperature steps of the plates, in degrees (default: 0.5)')
+    parser.add_argument('--repeats', type=int, default=3,
+                        help='number of times each plate is benchmarked (default: 3)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed the plates are made from (default: 0)')
+    parser.add_argument('-o', '--output', default='meltdown-benchmark.json',
+                        help='json file the results are written to (default: meltdown-benchmark.json)')
+    parser.add_argument('--no-report', action='store_true',
+                        help='don\'t time the report (matplotlib and reportlab are never loaded)')
+    parser.add_argument('--settings', default=meltdownRunner.DEFAULT_SETTINGS_FILE,
+                        help='settings file to read the analysis options from (default: meltdown\'s settings.ini)')
+    parser.add_argument('--keep', metavar='DIR',
+                        help='write the plates and their outputs to this folder and keep them (default: a temporary folder)')
+    return parser
+
+
+def main(argv=None):
+    args = createParser().parse_args(argv)
+    try:
+        settings = meltdownRunner.readSettings(args.settings)
+    except MeltdownException as e:
+        sys.stderr.write('*error occured* ' + str(e) + '\n')
+        return 2
+    produceReport = not args.no_report
+    if produceReport and not reportlabFound():
+        sys.stderr.write('*warning* reportlab is not installed, the report is not timed\n')
+        produceReport = False
+
+    if args.keep:
+        directory = args.keep
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+    else:
+        directory = tempfile.mkdtemp(prefix='meltdown-benchmark-')
+    try:
+        runs = runBenchmarks(args.wells, args.steps, args.repeats, args.seed, settings, produceReport, directory)
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    with open(args.output, 'w') as fp:
+        json.dump(benchmarkDescription(runs, settings, produceReport), fp, indent=1, sort_keys=True)
+    print '*done* benchmark written to ' + args.output
+    if any([run["Error"] != '' for run in runs]):
+        return 1
+    return 0
+
+#excecutes main() on file run
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+This .py file stores the functions used to run the full meltdown pipeline (load,
+analyse, report and any extra output) on DSF results files, without any user
+interface. The Tkinter launchers (Meltdown.py, MeltdownBatch.py) and the command
+line (MeltdownCli.py) are all thin wrappers around these functions.
+
+Nothing here imports Tkinter, so it can be used on computers without a display.
+
+"""
+
+import os
+import ConfigParser
+import cProfile
+import multiprocessing
+import time
+import traceback
+
+from DsfAnalysis import DsfAnalysis, NORMALISED_TEXT, NORMALISED_BINARY
+from ContentsMap import NO_DYE, NO_PROTEIN
+import referenceCurves as rc
+import curveClassification as cc
+import dsfReader
+import resultsDatabase
+import plateAggregation
+import runMetrics
+from runMetrics import REPORT, NORMALISED_DATA, TM_DATA, WELL_STATUS_DATA, RESULTS_JSON
+from MeltdownException import MeltdownException
+
+#the running location of this file
+RUNNING_LOCATION = os.path.dirname(os.path.realpath(__file__))
+#get the version number as a string
+with open(RUNNING_LOCATION + "/../VERSION.txt") as versionFile:
+    VERSION = versionFile.readline().strip()
+
+#the settings file that is used unless another is given
+DEFAULT_SETTINGS_FILE = RUNNING_LOCATION + '/../settings.ini'
+
+#name of the summary of a batch run, written in the folder of result files
+SUMMARY_FILE_NAME = 'meltdown_batch_summary.txt'
+#name of the metrics of a batch run (see runMetrics), written in the folder of result files if ProduceRunMetrics is set
+BATCH_METRICS_FILE_NAME = 'meltdown_batch_metrics.json'
+#names of the pooled tms of technical replicate plates, and how each plate compared, written in the folder of result
+#files if AggregatePlates is set (see plateAggregation)
+AGGREGATED_TMS_FILE_NAME = 'meltdown_aggregated_tms.txt'
+AGGREGATED_PLATES_FILE_NAME = 'meltdown_aggregated_plates.txt'
+#every file a batch writes in the folder of result files, which are never analysed or deleted as input files
+BATCH_FILE_NAMES = (SUMMARY_FILE_NAME, BATCH_METRICS_FILE_NAME, AGGREGATED_TMS_FILE_NAME, AGGREGATED_PLATES_FILE_NAME)
+#endings of the files written for each plate (see analyseFile), which are never analysed as plates of their own
+OUTPUT_FILE_SUFFIXES = ('.pdf', '-normalised.txt', '-normalised.txt.gz', '-normalised.npz', '-tms.txt', '-wells.txt',
+                        '-results.json', '-metrics.json', '-profile.prof')
+
+
+#settings added since the first release of settings.ini, and the values they have in the shipped settings.ini,
+#so that older settings files still work. Every other setting must be in the settings file
+SETTING_DEFAULTS = {'BatchWorkers': 1,
+                    'ReportWorkers': 1,
+                    'CacheParsedData': False,
+                    'ResultsDatabase': '',
+                    'AggregatePlates': False,
+                    'ProduceReport': True,
+                    'NormalisedDataFormat': NORMALISED_TEXT,
+                    'NormalisedDataNumberFormat': '',
+                    'CompressNormalisedData': False,
+                    'ProduceWellStatusData': False,
+                    'ProduceResultsJson': False,
+                    'VectorGraphs': False,
+                    'ProduceRunMetrics': False,
+                    'ProfilePlates': False,
+                    'TmRefinement': cc.TM_REFINEMENT,
+                    'TmDecimalPlaces': cc.TM_DECIMAL_PLACES,
+                    'NoDyeReferenceCurve': '',
+                    'NoProteinReferenceCurve': ''}
+
+
+def checkTmRefinement(tmRefinement):
+    #an unknown TmRefinement would make every plate fail, so it is reported before any are analysed
+    if tmRefinement not in (cc.TM_REFINEMENT_ANALYTIC, cc.TM_REFINEMENT_GRID):
+        raise MeltdownException('Unknown TmRefinement "' + tmRefinement + '", it must be ' + cc.TM_REFINEMENT_ANALYTIC +
+                                ' or ' + cc.TM_REFINEMENT_GRID)
+    return
+
+
+def readSettings(settingsFilePath=DEFAULT_SETTINGS_FILE):
+    """
+    Reads the running options from a settings file, settings missing from it that were added since
+    the first release are given their defaults (see SETTING_DEFAULTS)
+
+    Output: Returns a dictionary of the settings, keyed by their names in settings.ini
+    """
+    cfg = ConfigParser.ConfigParser()
+
+    def optional(getter, section, name, **kwargs):
+        #the setting's value, or its default if the settings file doesn't have it
+        if cfg.has_option(section, name):
+            return getter(section, name, **kwargs)
+        return SETTING_DEFAULTS[name]
+
+    try:
+        with open(settingsFilePath) as settingsFile:
+            cfg.readfp(settingsFile)
+        settings = {'DeleteInputFiles': cfg.getboolean('Running Options', 'DeleteInputFiles'),
+                    'CheckForNewVersion': cfg.getboolean('Running Options', 'CheckForNewVersion'),
+                    'BatchWorkers': optional(cfg.getint, 'Running Options', 'BatchWorkers'),
+                    'ReportWorkers': optional(cfg.getint, 'Running Options', 'ReportWorkers'),
+                    'CacheParsedData': optional(cfg.getboolean, 'Running Options', 'CacheParsedData'),
+                    'ResultsDatabase': optional(cfg.get, 'Running Options', 'ResultsDatabase').strip(),
+                    'AggregatePlates': optional(cfg.getboolean, 'Running Options', 'AggregatePlates'),
+                    'ProduceReport': optional(cfg.getboolean, 'Extra Output', 'ProduceReport'),
+                    'ProduceNormalisedData': cfg.getboolean('Extra Output', 'ProduceNormalisedData'),
+                    'NormalisedDataFormat': optional(cfg.get, 'Extra Output', 'NormalisedDataFormat').strip().lower(),
+                    'NormalisedDataNumberFormat': optional(cfg.get, 'Extra Output', 'NormalisedDataNumberFormat', raw=True).strip(),
+                    'CompressNormalisedData': optional(cfg.getboolean, 'Extra Output', 'CompressNormalisedData'),
+                    'ProduceTmData': cfg.getboolean('Extra Output', 'ProduceTmData'),
+                    'ProduceWellStatusData': optional(cfg.getboolean, 'Extra Output', 'ProduceWellStatusData'),
+                    'ProduceResultsJson': optional(cfg.getboolean, 'Extra Output', 'ProduceResultsJson'),
+                    'VectorGraphs': optional(cfg.getboolean, 'Extra Output', 'VectorGraphs'),
+                    'ProduceRunMetrics': optional(cfg.getboolean, 'Extra Output', 'ProduceRunMetrics'),
+                    'ProfilePlates': optional(cfg.getboolean, 'Extra Output', 'ProfilePlates'),
+                    'TmRefinement': optional(cfg.get, 'Analysis Options', 'TmRefinement').strip().lower(),
+                    'TmDecimalPlaces': optional(cfg.getint, 'Analysis Options', 'TmDecimalPlaces'),
+                    'NoDyeReferenceCurve': optional(cfg.get, 'Analysis Options', 'NoDyeReferenceCurve').strip(),
+                    'NoProteinReferenceCurve': optional(cfg.get, 'Analysis Options', 'NoProteinReferenceCurve').strip()}
+    except (IOError, ConfigParser.Error, ValueError) as e:
+        raise MeltdownException('There was a problem reading the settings file "' + settingsFilePath + '"\n' + str(e))
+    checkTmRefinement(settings['TmRefinement'])
+    return settings
+
+
+class FileResult:
+    def __init__(self, filePath):
+        #how the analysis of a single results file went
+        self.filePath = filePath
+        self.succeeded = False
+        #error message if the analysis failed, and the full traceback if the error was unexpected
+        self.message = ''
+        self.errorLog = ''
+        self.seconds = 0.0
+        self.outputFiles = []
+        #the results of the analysis (see DsfAnalysis.results), only kept if they are added to a results database
+        #or pooled with the other plates (see plateAggregation)
+        self.results = None
+        #the timings of each stage of the analysis (see runMetrics.StageTimer.stages)
+        self.stages = []
+        return
+
+
+def outputPathBase(rfuFilepath, outputDirectory=None):
+    #output files are named after the data file (or the file a cache was made from), and written next to it
+    #unless an output directory is given
+    base = os.path.splitext(dsfReader.sourceFilePath(rfuFilepath))[0]
+    if outputDirectory is not None:
+        base = os.path.join(outputDirectory, os.path.basename(base))
+    return base
+
+
+def analyseFile(rfuFilepath, contentsMapFilepath, settings, outputDirectory=None, printStages=False):
+    """
+    Runs the analysis of one DSF results file, producing its report (unless ProduceReport is off) and any extra output.
+    This can be run in a worker process, so all errors are caught and returned rather than raised
+
+    Output: Returns a FileResult
+    """
+    result = FileResult(rfuFilepath)
+    startTime = time.time()
+    base = outputPathBase(rfuFilepath, outputDirectory)
+    experiment = None
+    #the whole run of the file is profiled, except for graphs drawn by other processes
+    profiler = None
+    if settings['ProfilePlates']:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        if printStages:
+            print 'reading in data ...'
+        #site-specific expected control curves, only read the first time in each process
+        if settings['NoDyeReferenceCurve']:
+            rc.registerReferenceCurveFile(NO_DYE, settings['NoDyeReferenceCurve'])
+        if settings['NoProteinReferenceCurve']:
+            rc.registerReferenceCurveFile(NO_PROTEIN, settings['NoProteinReferenceCurve'])
+        #name the analysis the name of the data file
+        experiment = DsfAnalysis(os.path.basename(dsfReader.sourceFilePath(rfuFilepath)), settings['TmRefinement'], settings['TmDecimalPlaces'])
+        experiment.loadCurves(rfuFilepath, contentsMapFilepath, settings['CacheParsedData'])
+        #each output only does the analysis it needs (the mean wells are only made for the report and tms),
+        #the normalised data doesn't need any
+        if settings['ProduceReport'] or settings['ProduceTmData'] or settings['ProduceWellStatusData'] or settings['ProduceResultsJson'] \
+                or settings['ResultsDatabase'] or settings['AggregatePlates']:
+            if printStages:
+                print 'analysing ...'
+            experiment.analyseWells()
+
+        # generating the report
+        if settings['ProduceReport']:
+            if printStages:
+                print 'generating report ...'
+            experiment.timer.time(REPORT, experiment.generateReport, base + ".pdf", VERSION, settings['ReportWorkers'], settings['VectorGraphs'])
+            result.outputFiles.append(base + ".pdf")
+
+        #generate a tab delimited .txt file of the normalised curves
+        if settings['ProduceNormalisedData']:
+            #add -normalised to the end of the filename
+            if printStages:
+                print 'creating normalised data ...'
+            if settings['NormalisedDataFormat'] == NORMALISED_BINARY:
+                normalisedFilepath = base + '-normalised.npz'
+            elif settings['CompressNormalisedData']:
+                normalisedFilepath = base + '-normalised.txt.gz'
+            else:
+                normalisedFilepath = base + '-normalised.txt'
+            experiment.timer.time(NORMALISED_DATA, experiment.produceNormalisedOutput, normalisedFilepath, settings['NormalisedDataFormat'],
+                                  settings['NormalisedDataNumberFormat'], settings['CompressNormalisedData'])
+            result.outputFiles.append(normalisedFilepath)
+
+        if settings['ProduceTmData']:
+            if printStages:
+                print "creating tm data ..."
+            experiment.timer.time(TM_DATA, experiment.produceExportedTmData, base + "-tms.txt")
+            result.outputFiles.append(base + "-tms.txt")
+
+        if settings['ProduceWellStatusData']:
+            if printStages:
+                print "creating well status data ..."
+            experiment.timer.time(WELL_STATUS_DATA, experiment.produceWellStatusData, base + "-wells.txt")
+            result.outputFiles.append(base + "-wells.txt")
+
+        if settings['ProduceResultsJson']:
+            if printStages:
+                print "creating results json ..."
+            experiment.timer.time(RESULTS_JSON, experiment.produceResultsJson, base + "-results.json", VERSION)
+            result.outputFiles.append(base + "-results.json")
+
+        #the results are sent back to be added to the results database, which is only written to by one process
+        if settings['ResultsDatabase'] or settings['AggregatePlates']:
+            result.results = experiment.results(VERSION)
+
+        #the profile and metrics are written last, so they cover everything else
+        profileFilepath = None
+        if profiler is not None:
+            profiler.disable()
+            profileFilepath = base + "-profile.prof"
+            profiler.dump_stats(profileFilepath)
+            result.outputFiles.append(profileFilepath)
+        if settings['ProduceRunMetrics']:
+            runMetrics.writeMetrics(runMetrics.plateMetrics(experiment, rfuFilepath, time.time() - startTime, VERSION, profileFilepath),
+                                    base + "-metrics.json")
+            result.outputFiles.append(base + "-metrics.json")
+        result.succeeded = True
+    #expected error, to do with reading input, will give descriptive messages
+    except MeltdownException as e:
+        result.message = e.message
+    #unexpected errors keep their traceback for the error log
+    except Exception as e:
+        result.message = 'Unexpected error: ' + (str(e) or type(e).__name__)
+        result.errorLog = traceback.format_exc()
+    if profiler is not None:
+        profiler.disable()
+    result.seconds = time.time() - startTime
+    #the stages are kept (even if the file failed) for the metrics of the batch
+    if experiment is not None:
+        result.stages = experiment.timer.stages()
+    return result
+
+
+def analyseFileTask(args):
+    #pool workers only pass a single argument
+    return analyseFile(*args)
+
+
+def uniquePlates(allFilePaths):
+    """
+    Drops files that are the same plate as a file before them, a results file and the cache header made
+    from it (see dsfReader.sourceFilePath) are the same plate, and would write the same output files
+
+    Output: Returns the list of file paths, in the order given
+    """
+    filePaths = []
+    plates = set()
+    for filePath in allFilePaths:
+        plate = os.path.normcase(os.path.abspath(dsfReader.sourceFilePath(filePath)))
+        if plate not in plates:
+            plates.add(plate)
+            filePaths.append(filePath)
+    return filePaths
+
+
+def analyseFiles(allFilePaths, contentsMapFilepath, settings, outputDirectory=None, workers=None):
+    """
+    Analyses every file, in a pool of worker processes (0 uses every core, None uses the
+    BatchWorkers setting). Progress and failures are printed as each file finishes, and each
+    file's results are added to the ResultsDatabase as it finishes, if one is set. A plate
+    given more than once (e.g. as its results file and its cache header) is only analysed once
+
+    Output: Returns the list of FileResults, in the order the files finished
+    """
+    allFilePaths = uniquePlates(allFilePaths)
+    #opened before any files are analysed, so a database that can't be used stops the batch
+    database = None
+    if settings['ResultsDatabase']:
+        database = resultsDatabase.openDatabase(settings['ResultsDatabase'])
+    if workers is None:
+        workers = settings['BatchWorkers']
+    if workers <= 0:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(allFilePaths))
+    tasks = [(rfuFilepath, contentsMapFilepath, settings, outputDirectory) for rfuFilepath in allFilePaths]
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        resultIterator = pool.imap_unordered(analyseFileTask, tasks)
+    else:
+        resultIterator = (analyseFileTask(task) for task in tasks)
+
+    results = []
+    try:
+        for result in resultIterator:
+            if result.succeeded and database is not None:
+                try:
+                    resultsDatabase.addPlate(database, result.filePath, result.results)
+                except MeltdownException as e:
+                    result.succeeded = False
+                    result.message = e.message
+            #the results are only needed for the database, unless the plates are pooled once they are all analysed
+            if not settings['AggregatePlates']:
+                result.results = None
+            results.append(result)
+            progress = '[' + str(len(results)) + '/' + str(len(tasks)) + '] '
+            if result.succeeded:
+                print progress + 'analysed: ' + os.path.basename(result.filePath) + ' (' + str(round(result.seconds, 1)) + 's)'
+            else:
+                print progress + '*ERROR*'
+                print 'failed to analyse: ' + os.path.basename(result.filePath) + '\n' + result.message
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if database is not None:
+            database.close()
+    return results
+
+
+def deleteInputFiles(results):
+    """
+    Removes any exported files in the directory of each successfully analysed data file. These
+    files are identified if they have the same word at the start of their file name, this is
+    assumed to be the protein name, and all files with the same first word in the directory are
+    deleted (except for meltdown's output). This is only done once all the files have been
+    analysed, so that files still waiting to be analysed aren't deleted
+    """
+    outputFiles = set(os.path.abspath(outputFile) for result in results for outputFile in result.outputFiles)
+    for result in results:
+        if not result.succeeded:
+            continue
+        folder = os.path.dirname(os.path.abspath(result.filePath))
+        proteinName = os.path.basename(result.filePath).split()[0]
+        for fl in os.listdir(folder):
+            filePath = os.path.join(folder, fl)
+            if '.pdf' in fl or filePath in outputFiles or fl in BATCH_FILE_NAMES:
+                continue
+            if proteinName in fl and os.path.isfile(filePath):
+                os.remove(filePath)
+    return
+
+
+def isOutputFile(filePath):
+    #if the file is one that meltdown writes for a plate or a batch, rather than a plate's data
+    fileName = os.path.basename(filePath)
+    return fileName in BATCH_FILE_NAMES or fileName.endswith(OUTPUT_FILE_SUFFIXES)
+
+
+def writeSummary(results, summaryFilepath, totalSeconds):
+    #tab delimited summary of how each file went, in file name order
+    with open(summaryFilepath, 'w') as fp:
+        fp.write('File\tStatus\tSeconds\tMessage\n')
+        for result in sorted(results, key=lambda x: x.filePath):
+            status = 'Analysed' if result.succeeded else 'Failed'
+            fp.write('\t'.join([os.path.basename(result.filePath), status, str(round(result.seconds, 2)), result.message.replace('\n', ' ')]) + '\n')
+        numFailed = len([result for result in results if not result.succeeded])
+        fp.write('\nAnalysed ' + str(len(results) - numFailed) + ' of ' + str(len(results)) + ' files in ' + str(round(totalSeconds, 1)) + 's\n')
+    return
+
+
+def writeBatchMetrics(results, metricsFilepath, totalSeconds):
+    #json of every file's time and slowest stage, and every stage's time over the batch (see runMetrics.batchMetrics)
+    runMetrics.writeMetrics(runMetrics.batchMetrics(results, totalSeconds, VERSION), metricsFilepath)
+    return
+
+
+def writeAggregatedResults(results, tmsFilepath, platesFilepath):
+    """
+    Pools the replicates of every successfully analysed file, as technical replicate plates (see plateAggregation),
+    writing the pooled tm of each condition, and how each plate compared to the others, as tab delimited tables.
+    The files must have been analysed with AggregatePlates set, so their results were kept
+
+    Output: Returns the number of plates pooled, nothing is written if there were none
+    """
+    plateResults = [(os.path.basename(dsfReader.sourceFilePath(result.filePath)), result.results)
+                    for result in sorted(results, key=lambda x: x.filePath) if result.succeeded]
+    if len(plateResults) == 0:
+        return 0
+    conditionColumns, conditionTable, plateColumns, plateTable = plateAggregation.aggregatePlates(plateResults)
+    plateAggregation.writeTable(conditionColumns, conditionTable, tmsFilepath)
+    plateAggregation.writeTable(plateColumns, plateTable, platesFilepath)
+    return len(plateResults)
+
+
+def writeErrorLog(errorLogFilepath, errorLog):
+    #save an unexpected error's traceback, with the version it happened in
+    with open(errorLogFilepath, 'w') as errors:
+        errors.write("Version: " + VERSION + "\n")
+        errors.write(errorLog)
+    return
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+This .py file stores the functions used to pool the replicates of technical replicate
+plates, plates run with the same contents map, into one Tm and Tm error per condition.
+
+Each plate is analysed on its own as usual (so outlier wells are still found within each
+plate, from their curves), and only its results (see DsfAnalysis.results) are pooled.
+Whole plates can run hotter or colder than each other, so each plate's Tm offset is
+found first, the median difference between its Tms and the median Tms of every plate.
+A plate's Tm for a condition is an outlier if, once its offset is taken away, it is more
+than PLATE_OUTLIER_TM_THRESHOLD from the median of every plate's Tm (once their offsets
+are taken away), so that with three plates one plate that is out can't pull the others
+out. The pooled Tm and Tm error of a condition are the mean and standard deviation of the
+Tms of its wells that weren't discarded, on every plate where it wasn't an outlier. The
+offsets are only used to find outliers, the pooled Tms are of the wells' own Tms.
+
+"""
+
+import csv
+import numpy as np
+
+import replicateHandling as rh
+
+#largest difference (degrees) between a plate's Tm of a condition and the median of every plate's Tm, once the
+#plates' offsets are taken away, before the plate's Tm is an outlier
+PLATE_OUTLIER_TM_THRESHOLD = 1.5
+#fewest plates with a Tm for a condition before outliers can be found, with fewer it can't be told which plate is out
+MIN_PLATES_FOR_OUTLIERS = 3
+
+
+def conditionsOfPlate(results):
+    """
+    The Tms of every condition on a plate
+
+    Input: the plate's results (see DsfAnalysis.results)
+
+    Output: Returns a dictionary of (cv1, cv2, pH) to a dictionary of the condition's Control, Tm (the
+    mean Tm on the plate), Complex, Wells (the number of replicates), and Tms (of the wells not discarded)
+    """
+    wells = results["Wells"]
+    meanWells = results["Mean Wells"]
+    rowOfWell = dict([(wellName, row) for row, wellName in enumerate(wells["Well"])])
+    conditions = {}
+    for i in range(len(meanWells["Cv1"])):
+        rows = [rowOfWell[wellName] for wellName in meanWells["Replicates"][i]]
+        conditions[(meanWells["Cv1"][i], meanWells["Cv2"][i], meanWells["pH"][i])] = {
+            "Control": meanWells["Control"][i],
+            "Tm": meanWells["Tm"][i],
+            "Complex": meanWells["Complex"][i],
+            "Wells": len(rows),
+            "Tms": [wells["Tm"][row] for row in rows if not wells["Discarded"][row] and wells["Tm"][row] is not None]}
+    return conditions
+
+
+def plateOffsets(plateTms):
+    """
+    How much hotter or colder each plate runs than the others, the median difference between its Tms
+    and the median Tm of each condition over every plate (only conditions with a Tm on two or more plates)
+
+    Input: list of dictionaries (one per plate) of condition to the plate's Tm of it
+
+    Output: Returns a list of each plate's offset, None for plates sharing no Tms with another plate
+    """
+    differences = [[] for tms in plateTms]
+    for condition in set([condition for tms in plateTms for condition in tms]):
+        found = [(i, tms[condition]) for i, tms in enumerate(plateTms) if condition in tms]
+        if len(found) < 2:
+            continue
+        medianTm = np.median([tm for i, tm in found])
+        for i, tm in found:
+            differences[i].append(tm - medianTm)
+    return [float(np.median(plateDifferences)) if len(plateDifferences) > 0 else None for plateDifferences in differences]
+
+
+def aggregatePlates(plateResults, outlierThreshold=PLATE_OUTLIER_TM_THRESHOLD):
+    """
+    Pools the replicates of every condition over technical replicate plates
+
+    Input: list of (plate name, results (see DsfAnalysis.results)) of plates run with the same contents map,
+    and the largest difference of a plate's Tm from the median before it is an outlier
+
+    Output: Returns (condition column names, condition table, plate column names, plate table), each table a
+    dictionary of column name to the list of its values (as DsfAnalysis.wellTable). The conditions are in the
+    order they are first found on the plates, the plates in the order given
+    """
+    plateConditions = [conditionsOfPlate(results) for name, results in plateResults]
+    #every condition, in the order of the contents map
+    conditions = []
+    seen = set()
+    for results in [results for name, results in plateResults]:
+        for key in zip(results["Mean Wells"]["Cv1"], results["Mean Wells"]["Cv2"], results["Mean Wells"]["pH"]):
+            if key not in seen:
+                seen.add(key)
+                conditions.append(key)
+
+    #each plate's Tms, and how far they are from the other plates'
+    plateTms = [dict([(key, condition["Tm"]) for key, condition in found.items() if condition["Tm"] is not None])
+                for found in plateConditions]
+    offsets = plateOffsets(plateTms)
+    correctedTms = [dict([(key, tm - (offset or 0.0)) for key, tm in tms.items()]) for tms, offset in zip(plateTms, offsets)]
+
+    conditionColumns = ["Cv1", "Cv2", "pH", "Control", "Tm", "Tm Error", "Complex", "Plates", "Outlier Plates", "Wells", "Wells Used"]
+    conditionTable = dict([(column, []) for column in conditionColumns])
+    outlierCounts = [0] * len(plateResults)
+    for key in conditions:
+        onPlates = [i for i, found in enumerate(plateConditions) if key in found]
+        withTm = [i for i in onPlates if key in correctedTms[i]]
+        #a plate is only an outlier if enough other plates agree on the Tm
+        outliers = []
+        if len(withTm) >= MIN_PLATES_FOR_OUTLIERS:
+            medianTm = np.median([correctedTms[i][key] for i in withTm])
+            outliers = [i for i in withTm if abs(correctedTms[i][key] - medianTm) > outlierThreshold]
+        for i in outliers:
+            outlierCounts[i] += 1
+        used = [i for i in onPlates if i not in outliers]
+        tms = [tm for i in used for tm in plateConditions[i][key]["Tms"]]
+        tm, tmError = rh.meanSd(tms)
+        conditionTable["Cv1"].append(key[0])
+        conditionTable["Cv2"].append(key[1])
+        conditionTable["pH"].append(key[2])
+        conditionTable["Control"].append(plateConditions[onPlates[0]][key]["Control"])
+        conditionTable["Tm"].append(tm)
+        conditionTable["Tm Error"].append(None if tmError is None else float(tmError))
+        conditionTable["Complex"].append(any([plateConditions[i][key]["Complex"] for i in used]))
+        conditionTable["Plates"].append(len(onPlates))
+        conditionTable["Outlier Plates"].append([plateResults[i][0] for i in outliers])
+        conditionTable["Wells"].append(sum([plateConditions[i][key]["Wells"] for i in onPlates]))
+        conditionTable["Wells Used"].append(len(tms))
+
+    plateColumns = ["Plate", "Wells", "Lysozyme", "No Dye", "No Protein", "Tm Offset", "Outlier Conditions"]
+    plateTable = {"Plate": [name for name, results in plateResults],
+                  "Wells": [results["Plate"]["Wells"] for name, results in plateResults],
+                  "Lysozyme": [results["Plate"]["Controls"]["Lysozyme"] for name, results in plateResults],
+                  "No Dye": [results["Plate"]["Controls"]["No Dye"] for name, results in plateResults],
+                  "No Protein": [results["Plate"]["Controls"]["No Protein"] for name, results in plateResults],
+                  "Tm Offset": offsets,
+                  "Outlier Conditions": outlierCounts}
+    return conditionColumns, conditionTable, plateColumns, plateTable
+
+
+def writeTable(columns, table, filePath):
+    #tab delimited table, one row per entry, lists (e.g. of plates) are written comma separated and empty values blank
+    with open(filePath, 'w') as fp:
+        fWriter = csv.writer(fp, delimiter='\t')
+        fWriter.writerow(columns)
+        for row in zip(*[table[column] for column in columns]):
+            fWriter.writerow(['' if value is None else ', '.join(value) if isinstance(value, list) else value for value in row])
+    return
+
+
+def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
+    root = Tkinter.Tk()
+    root.withdraw()
+    tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+This .py file stores the functions used to lay out plates of any size. Wells are named
+by their row letters and column number (e.g. A1, H12, AF48), rows being lettered A to Z
+then AA, AB, ... as on 1536 well plates. Nothing in the analysis depends on the layout,
+it is only used to draw the wells where they are on the plate.
+
+"""
+
+import re
+
+#(rows, columns) of the standard plate sizes
+PLATE_LAYOUTS = {96: (8, 12), 384: (16, 24), 1536: (32, 48)}
+#plates of other sizes are laid out in rows of this many wells
+DEFAULT_COLUMNS = 12
+
+#row letters followed by the column number, either can be padded (e.g. "A01")
+WELL_NAME_PATTERN = re.compile(r'^\s*([A-Za-z]+)\s*0*([0-9]+)\s*$')
+
+
+def rowName(index):
+    #rows are lettered A to Z, then AA, AB, ... (as on 1536 well plates)
+    name = ''
+    index += 1
+    while index > 0:
+        index, letter = divmod(index - 1, 26)
+        name = chr(ord('A') + letter) + name
+    return name
+
+
+def rowIndex(name):
+    #the index of a row from its letters, the reverse of rowName
+    index = 0
+    for letter in name.upper():
+        index = index * 26 + ord(letter) - ord('A') + 1
+    return index - 1
+
+
+def plateLayout(numWells):
+    #the (rows, columns) of a plate, other sizes are laid out in rows of DEFAULT_COLUMNS wells
+    if numWells in PLATE_LAYOUTS:
+        return PLATE_LAYOUTS[numWells]
+    return (-(-numWells // DEFAULT_COLUMNS), DEFAULT_COLUMNS)
+
+
+def plateWellNames(numWells):
+    #the names of a plate's wells, row by row
+    numRows, numColumns = plateLayout(numWells)
+    return [rowName(row) + str(column + 1) for row in range(numRows) for column in range(numColumns)][:numWells]
+
+
+def wellPosition(wellName):
+    #the (row, column) of a well from its name, counting from 0, None if the name isn't a row and column
+    match = WELL_NAME_PATTERN.match(wellName)
+    if match is None or int(match.group(2)) == 0:
+        return None
+    return (rowIndex(match.group(1)), int(match.group(2)) - 1)
+
+
+def wellPositions(wellNames):
+    """
+    Places every well on a plate, by its name if every well is named by its row and column,
+    otherwise in the order given, row by row (see plateLayout)
+
+    Input: list of well names
+
+    Output: Returns (number of rows, number of columns, list of (row, column) of each well). The plate
+    is the smallest standard plate that holds every well, or just big enough if none do
+    """
+    positions = [wellPosition(wellName) for wellName in wellNames]
+    if len(positions) == 0 or None in positions or len(set(positions)) < len(positions):
+        numRows, numColumns = plateLayout(len(wellNames))
+        return numRows, numColumns, [divmod(i, numColumns) for i in range(len(wellNames))]
+    numRows = max([row for row, column in positions]) + 1
+    numColumns = max([column for row, column in positions]) + 1
+    for layoutRows, layoutColumns in sorted(PLATE_LAYOUTS.values()):
+        if numRows <= layoutRows and numColumns <= layoutColumns:
+            return layoutRows, layoutColumns, positions
+    return numRows, numColumns, positions
+
+
+def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
+    root = Tkinter.Tk()
+    root.withdraw()
+    tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
+    return
+
+
+if __name__ == "__main__":
+    main()
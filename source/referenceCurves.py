@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+This .py file stores the expected (reference) curves of the negative controls, that the
+mean control curves of a plate are compared against. Each reference curve is only read
+from file once per process, and its log is taken once, so that plates in a batch don't
+repeat this work.
+
+The curves shipped with meltdown (data/noDyeControl.csv and data/noProteinControl.csv)
+are used unless a site-specific curve has been registered for the control, e.g. for a
+different instrument or dye.
+
+"""
+
+import os
+import numpy as np
+
+from ContentsMap import NO_DYE, NO_PROTEIN
+from MeltdownException import MeltdownException
+
+#the running location of this file
+RUNNING_LOCATION = os.path.dirname(os.path.realpath(__file__))
+
+#files of the reference curves shipped with meltdown
+DEFAULT_REFERENCE_FILES = {NO_DYE: RUNNING_LOCATION + "/../data/noDyeControl.csv",
+                           NO_PROTEIN: RUNNING_LOCATION + "/../data/noProteinControl.csv"}
+
+#fewest temperatures shared by a plate and a reference curve that they can be compared on
+MIN_SHARED_TEMPERATURES = 2
+
+#reference curves that have been loaded or registered in this process, keyed by control name
+REGISTRY = {}
+
+
+class ReferenceCurve:
+    def __init__(self, temperatures, fluorescence, source=''):
+        #a normalised expected curve of a control, with the log of it kept for the aitchison distance
+        self.temperatures = np.asarray(temperatures, dtype=float)
+        self.fluorescence = np.asarray(fluorescence, dtype=float)
+        self.source = source
+        if self.temperatures.ndim != 1 or self.temperatures.shape != self.fluorescence.shape:
+            raise MeltdownException('Reference curve ' + source + ' must have one fluorescence reading per temperature')
+        if len(self.temperatures) < MIN_SHARED_TEMPERATURES:
+            raise MeltdownException('Reference curve ' + source + ' must have at least ' + str(MIN_SHARED_TEMPERATURES) +
+                                    ' readings, it has ' + str(len(self.temperatures)))
+        if np.any(np.diff(self.temperatures) <= 0):
+            raise MeltdownException('Reference curve ' + source + ' temperatures must be increasing')
+        if not np.all(self.fluorescence > 0):
+            raise MeltdownException('Reference curve ' + source + ' must be positive everywhere, as it is compared on a log scale')
+        self.logFluorescence = np.log(self.fluorescence)
+        return
+
+    def distanceTo(self, curve, temperatures):
+        """
+        Aitchison distance of a normalised curve from this reference curve. If the curve was
+        measured at the reference's temperatures, the reference is used as is, otherwise the
+        reference is interpolated onto the temperatures they share, and both are renormalised
+        over them so neither is penalised for the part of the range the other doesn't cover
+
+        Input: normalised fluorescence readings of the curve and the temperatures they were taken at
+
+        Output: Returns the distance, or None if the curve and reference share too few temperatures to compare
+        """
+        curve = np.asarray(curve, dtype=float)
+        temperatures = np.asarray(temperatures, dtype=float)
+        if np.array_equal(temperatures, self.temperatures):
+            return np.power(np.log(curve) - self.logFluorescence, 2.0).sum() / len(curve)
+        shared = (temperatures >= self.temperatures[0]) & (temperatures <= self.temperatures[-1])
+        if np.count_nonzero(shared) < MIN_SHARED_TEMPERATURES:
+            return None
+        sharedTemperatures = temperatures[shared]
+        expected = np.interp(sharedTemperatures, self.temperatures, self.fluorescence)
+        curve = curve[shared]
+        #both curves are renormalised to an area of 1 over the shared temperatures
+        stepSize = sharedTemperatures[1] - sharedTemperatures[0]
+        expected = expected / (expected.sum() * stepSize)
+        curve = curve / (curve.sum() * stepSize)
+        return np.power(np.log(curve) - np.log(expected), 2.0).sum() / len(curve)
+
+
+def readReferenceCurve(filePath):
+    """
+    Reads a reference curve from a comma separated file of temperature,fluorescence rows
+    (with no header), normalised the same way as the plate's curves
+
+    Output: Returns a ReferenceCurve
+    """
+    try:
+        data = np.loadtxt(filePath, delimiter=',', ndmin=2)
+    except (IOError, ValueError) as e:
+        raise MeltdownException('There was a problem reading the reference curve "' + filePath + '"\n' + str(e))
+    if data.shape[1] != 2:
+        raise MeltdownException('Reference curve "' + filePath + '" must have two columns, temperature and fluorescence')
+    return ReferenceCurve(data[:, 0], data[:, 1], filePath)
+
+
+def registerReferenceCurve(controlName, temperatures, fluorescence):
+    #use a site-specific expected curve for a control, instead of the one shipped with meltdown
+    REGISTRY[controlName.lower()] = ReferenceCurve(temperatures, fluorescence, controlName)
+    return
+
+
+def registerReferenceCurveFile(controlName, filePath):
+    #use a site-specific expected curve read from file, the file is only read if it isn't already the control's reference
+    controlName = controlName.lower()
+    if controlName not in REGISTRY or REGISTRY[controlName].source != filePath:
+        REGISTRY[controlName] = readReferenceCurve(filePath)
+    return
+
+
+def getReferenceCurve(controlName):
+    """
+    Gets the expected curve of a control, reading the one shipped with meltdown the first
+    time it's needed if no other curve has been registered
+
+    Output: Returns a ReferenceCurve
+    """
+    controlName = controlName.lower()
+    if controlName not in REGISTRY:
+        if controlName not in DEFAULT_REFERENCE_FILES:
+            raise MeltdownException('No reference curve has been registered for "' + controlName + '"')
+        REGISTRY[controlName] = readReferenceCurve(DEFAULT_REFERENCE_FILES[controlName])
+    return REGISTRY[controlName]
+
+
+def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
+    root = Tkinter.Tk()
+    root.withdraw()
+    tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -23,7 +23,6 @@ Tm of any curve was calculated as the lowest point on the derivative melt data.
 
 """
 
-import Tkinter, tkMessageBox
 import math
 import numpy as np
 from itertools import combinations
@@ -53,7 +52,8 @@ def meanSd(listOfNumbers):
     #calculate moments, and thus variance and sd
     moment1=etotal/N
     moment2=e2total/N
-    variance = moment2 - math.pow(moment1,2)
+    #rounding can leave the variance of identical numbers a tiny bit below zero, which has no sd
+    variance = max(moment2 - math.pow(moment1,2), 0.0)
     return (moment1, np.sqrt(variance))
 
 
@@ -69,30 +69,50 @@ def aitchisonDistance(list1,list2):
     return sqrsum / min(len(list1), len(list2))
 
 
+def aitchisonDistanceMatrix(logCurves):
+    """
+    Finds the aitchison distance between every pair of a group of curves at once
+    
+    Input: Takes in a 2-D numpy array of curves (one per row) that have already had
+    their logs taken, so that each curve is only logged once however many pairs it is in
+    
+    Output: Returns the symmetric numpy distance matrix, the distance between curves i
+    and j being at [i, j]. The diagonal is 0
+    """
+    #differences between every pair of curves, at every point, by broadcasting the rows against each other
+    differences = logCurves[:, np.newaxis, :] - logCurves[np.newaxis, :, :]
+    return np.square(differences).sum(axis=2) / logCurves.shape[1]
+
+
 def discardBad(wellNamesList,matrix,thresh):
     """using the dist matrix, groups are made of those proteins which are within the threshold
     of each other, and the most tightly packed grouped is returned. If all are unrelated, an 
-    empty group is returned"""
+    empty group is returned. The matrix can be a numpy array or a list of lists, and is
+    not changed"""
+    #copy the matrix so that removing edges doesn't change the caller's one
+    matrix = np.array(matrix, dtype=float).reshape(len(wellNamesList), len(wellNamesList))
     #keys are wells, values are a list of their group members
     wells = {}
     for name in wellNamesList:
         #the groups in which the wells are placed are the indexes of the wells in the input list
         wells[name]=[name]
-    for i in range(len(matrix)):
-        #loop over all the matrix except the diagonal (always 0)
-        for j in [x for x in range(len(matrix[i])) if x!=i]:
-            if matrix[i][j] > thresh:
-                #remove edges that are greater than the threshold
-                matrix[i][j] = -1
-            else:
-                #add the two wells within threshold to each others groupmembers' groups (including own)
-                for wlj in wells[wellNamesList[j]]:
-                    if wellNamesList[i] not in wells[wlj]:
-                        wells[wlj].append(wellNamesList[i])
-                for wli in wells[wellNamesList[i]]:
-                    if wellNamesList[j] not in wells[wli]:
-                        wells[wli].append(wellNamesList[j])
-    #finding the beet group
+    #all the matrix except the diagonal (always 0)
+    offDiagonal = ~np.eye(len(matrix), dtype=bool)
+    #edges within threshold (distances that could not be calculated, i.e. nan, are never within it)
+    withinThreshold = (matrix <= thresh) & offDiagonal
+    #remove edges that are greater than the threshold
+    matrix[~withinThreshold & offDiagonal] = -1
+    #loop over the edges within threshold, in the same row by row order as the matrix
+    for i, j in zip(*np.nonzero(withinThreshold)):
+        #add the two wells within threshold to each others groupmembers' groups (including own)
+        for wlj in wells[wellNamesList[j]]:
+            if wellNamesList[i] not in wells[wlj]:
+                wells[wlj].append(wellNamesList[i])
+        for wli in wells[wellNamesList[i]]:
+            if wellNamesList[j] not in wells[wli]:
+                wells[wli].append(wellNamesList[j])
+    #finding the beet group, position of each well name in the matrix
+    positions = dict((name, i) for i, name in enumerate(wellNamesList))
     maxi=-1
     choose=""
     for key in wells.keys():
@@ -109,13 +129,13 @@ def discardBad(wellNamesList,matrix,thresh):
             largestValMaxkey = -1
             for pair in combinations(wells[key],2):
                 #finds largest pair comparison value in current group
-                if matrix[wellNamesList.index(pair[0])][wellNamesList.index(pair[1])] > largestValKey:
-                    largestValKey = matrix[wellNamesList.index(pair[0])][wellNamesList.index(pair[1])]
+                if matrix[positions[pair[0]], positions[pair[1]]] > largestValKey:
+                    largestValKey = matrix[positions[pair[0]], positions[pair[1]]]
                     choose = key
             for pair2 in combinations(wells[maxkey],2):
                 #find largest pair comparison value in previous equal size group
-                if matrix[wellNamesList.index(pair2[0])][wellNamesList.index(pair2[1])] > largestValMaxkey:
-                    largestValMaxkey = matrix[wellNamesList.index(pair2[0])][wellNamesList.index(pair2[1])]
+                if matrix[positions[pair2[0]], positions[pair2[1]]] > largestValMaxkey:
+                    largestValMaxkey = matrix[positions[pair2[0]], positions[pair2[1]]]
                     choose = maxkey
             #choose group with the smaller largest value
             if largestValKey > largestValMaxkey:
@@ -137,6 +157,8 @@ def discardBad(wellNamesList,matrix,thresh):
 
 
 def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
     root = Tkinter.Tk()
     root.withdraw()
     tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
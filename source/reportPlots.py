@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+This .py file stores the functions used to draw the curve graphs of the report.
+
+A graph is described by a CurvePlot (the curves, their colours and line styles), so
+graphs can be drawn in other processes. Each process draws every graph on the same
+figure, updating its lines rather than creating a new figure each time, and the
+pixels are handed straight to the report rather than being compressed to png and
+read back in.
+
+Big plates also get a plate map, every well's Tm drawn where the well is on the plate,
+as one image however many wells there are.
+
+"""
+
+import copy
+import multiprocessing
+import numpy as np
+from PIL import Image
+import matplotlib
+#graphs are only ever saved as images, never shown, so use the non interactive backend (also safe in worker processes)
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.ticker import AutoLocator
+from matplotlib import cm as colourMaps
+from matplotlib.colors import to_rgba
+
+import plateFormats
+
+#size (inches) and resolution of the curve graphs
+CURVE_FIGURE_SIZE = (5,4)
+CURVE_DPI = 140
+
+#line styles of the curves
+NORMAL_LINESTYLE = "-"
+#complex curves are dashed
+COMPLEX_LINESTYLE = "--"
+#discarded curves are dotted
+DISCARDED_LINESTYLE = ":"
+
+#position of the axes in a vector graph, as fractions of the graph's size (the same as matplotlib's defaults)
+VECTOR_AXES_BOUNDS = (0.125, 0.11, 0.9, 0.88)
+#fraction of the data range added either side of the x axis of a vector graph, and the y axis if it isn't fixed
+VECTOR_AXES_MARGIN = 0.05
+#line width (points) of the curves, and the dash patterns of the line styles, in vector graphs
+VECTOR_LINE_WIDTH = 0.9
+VECTOR_DASHES = {NORMAL_LINESTYLE: [], COMPLEX_LINESTYLE: [3.5, 1.5], DISCARDED_LINESTYLE: [0.9, 1.5]}
+VECTOR_FONT_SIZE = 6.5
+VECTOR_TICK_LENGTH = 2.5
+#curves are decimated to keep at most this many points per point (1/72 inch) of graph width
+VECTOR_POINTS_PER_WIDTH = 1
+
+#size (inches) and resolution of the plate map, the colour map of its Tms, and the colours of the wells without a Tm
+PLATE_MAP_FIGURE_SIZE = (10, 7.4)
+PLATE_MAP_DPI = 150
+PLATE_MAP_COLOUR_MAP = 'viridis'
+PLATE_MAP_NO_TM_COLOUR = 'LightGray'
+PLATE_MAP_DISCARDED_COLOUR = 'DimGray'
+#rows and columns of the plate map are labelled every this many, so that at most this many labels are on each axis
+PLATE_MAP_MAX_LABELS = 24
+
+#the figure that curve graphs are drawn on, created the first time it's needed in each process
+CURVE_FIGURE = None
+
+
+class CurvePlot:
+    def __init__(self, temperatures, yLimits=None):
+        #the curves of one graph, all measured at the same temperatures
+        self.temperatures = temperatures
+        #(min, max) of the y axis, None to fit the curves
+        self.yLimits = yLimits
+        self.curves = []
+        self.colours = []
+        self.linestyles = []
+        return
+
+    def addCurve(self, fluorescence, colour, linestyle=NORMAL_LINESTYLE):
+        self.curves.append(fluorescence)
+        self.colours.append(colour)
+        self.linestyles.append(linestyle)
+        return
+
+
+def wellLinestyle(well):
+    #the line style a well's curve is drawn with
+    if well.isDiscarded:
+        return DISCARDED_LINESTYLE
+    elif well.isComplex:
+        return COMPLEX_LINESTYLE
+    return NORMAL_LINESTYLE
+
+
+def figureImage(figure):
+    """
+    Draws a figure that has an agg canvas, at the figure's resolution
+
+    Output: Returns the drawn figure as an RGB PIL image
+    """
+    canvas = figure.canvas
+    canvas.draw()
+    width, height = canvas.get_width_height()
+    image = Image.frombuffer('RGBA', (width, height), canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+    return image.convert('RGB')
+
+
+def curveFigure():
+    global CURVE_FIGURE
+    if CURVE_FIGURE is None:
+        CURVE_FIGURE = Figure(figsize=CURVE_FIGURE_SIZE, dpi=CURVE_DPI)
+        FigureCanvasAgg(CURVE_FIGURE)
+        axes = CURVE_FIGURE.add_subplot(111)
+        #hide y axis, as RFU units are arbitrary
+        axes.get_yaxis().set_visible(False)
+    return CURVE_FIGURE
+
+
+def renderCurvePlot(curvePlot):
+    """
+    Draws a curve graph on this process's curve figure, reusing the lines of the previous graph
+
+    Output: Returns (width, height, RGB pixel string) of the graph, which can be sent between processes
+    """
+    figure = curveFigure()
+    axes = figure.axes[0]
+    lines = axes.get_lines()
+    for i, (fluorescence, colour, linestyle) in enumerate(zip(curvePlot.curves, curvePlot.colours, curvePlot.linestyles)):
+        if i < len(lines):
+            lines[i].set_data(curvePlot.temperatures, fluorescence)
+            lines[i].set_color(colour)
+            lines[i].set_linestyle(linestyle)
+            lines[i].set_visible(True)
+        else:
+            axes.plot(curvePlot.temperatures, fluorescence, color=colour, linestyle=linestyle)
+    #lines left over from graphs with more curves are hidden
+    for line in lines[len(curvePlot.curves):]:
+        line.set_visible(False)
+
+    #fit the axes to the curves being shown
+    axes.set_autoscale_on(True)
+    axes.relim(visible_only=True)
+    axes.autoscale_view()
+    #a graph with no curves has the axes of a new figure
+    if len(curvePlot.curves) == 0:
+        axes.set_xlim(0, 1)
+        axes.set_ylim(0, 1)
+    if curvePlot.yLimits is not None:
+        axes.set_ylim(curvePlot.yLimits)
+    image = figureImage(figure)
+    return (image.size[0], image.size[1], image.tobytes())
+
+
+def renderCurvePlots(curvePlots, workers=1):
+    """
+    Draws curve graphs, in a pool of worker processes if more than one worker is given
+    (0 uses every core). Processes that are themselves pool workers (e.g. in a batch run)
+    always draw the graphs one after another, as they can't start processes of their own
+
+    Output: Returns the list of RGB PIL images, in the order of the curve plots
+    """
+    if workers <= 0:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(curvePlots))
+    if workers > 1 and not multiprocessing.current_process().daemon:
+        pool = multiprocessing.Pool(workers)
+        try:
+            #large chunks, so each worker draws many graphs on the same figure
+            rendered = pool.map(renderCurvePlot, curvePlots, chunksize=int(np.ceil(len(curvePlots) / float(workers))))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        rendered = [renderCurvePlot(curvePlot) for curvePlot in curvePlots]
+    return [Image.frombytes('RGB', (width, height), pixels) for width, height, pixels in rendered]
+
+
+def plateMapFigure(wellNames, tms, discarded, complexWells):
+    """
+    Draws every well's Tm where the well is on the plate (see plateFormats.wellPositions). Wells that
+    were discarded, or have no Tm, are drawn in grey, complex wells are marked with a dot, and places
+    on the plate without a well are left blank
+
+    Input: the well names, and arrays of each well's Tm (nan if it has none), whether it was discarded,
+    and whether it is complex, in the order of the well names
+
+    Output: Returns the figure (with an agg canvas, see figureImage)
+    """
+    numRows, numColumns, positions = plateFormats.wellPositions(wellNames)
+    rows = np.array([row for row, column in positions], dtype=int)
+    columns = np.array([column for row, column in positions], dtype=int)
+    tmGrid = np.empty((numRows, numColumns))
+    tmGrid.fill(np.nan)
+    tmGrid[rows, columns] = tms
+    #the grey wells are drawn first, with the Tms over them
+    greyGrid = np.zeros((numRows, numColumns, 4))
+    greyGrid[rows, columns] = to_rgba(PLATE_MAP_NO_TM_COLOUR)
+    greyGrid[rows[discarded], columns[discarded]] = to_rgba(PLATE_MAP_DISCARDED_COLOUR)
+
+    figure = Figure(figsize=PLATE_MAP_FIGURE_SIZE, dpi=PLATE_MAP_DPI)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot(111)
+    axes.imshow(greyGrid, interpolation='nearest', aspect='equal')
+    #a copy of the colour map, so the shared one is left as it is
+    colourMap = copy.copy(colourMaps.get_cmap(PLATE_MAP_COLOUR_MAP))
+    colourMap.set_bad(alpha=0)
+    image = axes.imshow(np.ma.masked_invalid(tmGrid), cmap=colourMap, interpolation='nearest', aspect='equal')
+    complexAndFound = complexWells & ~np.isnan(tms)
+    axes.plot(columns[complexAndFound], rows[complexAndFound], marker='.', color='black', linestyle='None',
+              markersize=max(1, 120.0 / max(numRows, numColumns)))
+    figure.colorbar(image, ax=axes, shrink=0.8, label='Tm')
+
+    #label the rows by letter and the columns by number, as on the plate
+    rowStep = -(-numRows // PLATE_MAP_MAX_LABELS)
+    columnStep = -(-numColumns // PLATE_MAP_MAX_LABELS)
+    axes.set_yticks(range(0, numRows, rowStep))
+    axes.set_yticklabels([plateFormats.rowName(row) for row in range(0, numRows, rowStep)], fontsize='small')
+    axes.set_xticks(range(0, numColumns, columnStep))
+    axes.set_xticklabels([str(column + 1) for column in range(0, numColumns, columnStep)], fontsize='small')
+    axes.xaxis.tick_top()
+    axes.set_xlim(-0.5, numColumns - 0.5)
+    axes.set_ylim(numRows - 0.5, -0.5)
+    return figure
+
+
+def decimateCurve(xs, ys, numBuckets):
+    """
+    Reduces the points of a curve, for drawing it at a given width, without changing how it looks.
+    The x range is split into buckets, and only the first, last, lowest and highest points of each
+    bucket are kept (so peaks and steps narrower than a bucket are still drawn)
+
+    Input: x (increasing) and y values of the curve, and the number of buckets (e.g. the width in pixels)
+
+    Output: Returns the (x values, y values) of the points that are kept, in order
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    if len(xs) <= 4 * numBuckets or xs[-1] == xs[0]:
+        return xs, ys
+    buckets = np.minimum(((xs - xs[0]) / (xs[-1] - xs[0]) * numBuckets).astype(int), numBuckets - 1)
+    #the points sorted by lowest y within each bucket, the buckets being contiguous as x is increasing
+    order = np.lexsort((ys, buckets))
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(xs)] - 1
+    kept = np.unique(np.concatenate([starts, ends, order[starts], order[ends]]))
+    return xs[kept], ys[kept]
+
+
+def drawCurvePlot(pdf, curvePlot, x, y, width, height):
+    """
+    Draws a curve graph onto a reportlab canvas as vector graphics (lines rather than an image),
+    laid out like the matplotlib graphs. Curves are decimated to the resolution they are drawn at
+
+    Input: the canvas, the CurvePlot, and the position and size (points) of the graph on the page
+    """
+    #the area of the axes on the page
+    left = x + VECTOR_AXES_BOUNDS[0] * width
+    bottom = y + VECTOR_AXES_BOUNDS[1] * height
+    axesWidth = (VECTOR_AXES_BOUNDS[2] - VECTOR_AXES_BOUNDS[0]) * width
+    axesHeight = (VECTOR_AXES_BOUNDS[3] - VECTOR_AXES_BOUNDS[1]) * height
+
+    #the data limits of the axes, with the same margins as matplotlib, a graph with no curves has limits (0, 1)
+    if len(curvePlot.curves) > 0:
+        xMin, xMax = np.min(curvePlot.temperatures), np.max(curvePlot.temperatures)
+        xMin, xMax = xMin - (xMax - xMin) * VECTOR_AXES_MARGIN, xMax + (xMax - xMin) * VECTOR_AXES_MARGIN
+        yMin, yMax = np.min(curvePlot.curves), np.max(curvePlot.curves)
+        yMin, yMax = yMin - (yMax - yMin) * VECTOR_AXES_MARGIN, yMax + (yMax - yMin) * VECTOR_AXES_MARGIN
+    else:
+        xMin, xMax, yMin, yMax = 0.0, 1.0, 0.0, 1.0
+    if curvePlot.yLimits is not None:
+        yMin, yMax = curvePlot.yLimits
+    if xMax == xMin:
+        xMin, xMax = xMin - 1, xMax + 1
+    if yMax == yMin:
+        yMin, yMax = yMin - 1, yMax + 1
+    xScale = axesWidth / (xMax - xMin)
+    yScale = axesHeight / (yMax - yMin)
+
+    pdf.saveState()
+    #the curves, clipped to the axes
+    pdf.saveState()
+    clip = pdf.beginPath()
+    clip.rect(left, bottom, axesWidth, axesHeight)
+    pdf.clipPath(clip, stroke=0, fill=0)
+    pdf.setLineWidth(VECTOR_LINE_WIDTH)
+    pdf.setLineJoin(1)
+    numBuckets = max(1, int(axesWidth * VECTOR_POINTS_PER_WIDTH))
+    for fluorescence, colour, linestyle in zip(curvePlot.curves, curvePlot.colours, curvePlot.linestyles):
+        xs, ys = decimateCurve(curvePlot.temperatures, fluorescence, numBuckets)
+        xs = left + (xs - xMin) * xScale
+        ys = bottom + (ys - yMin) * yScale
+        pdf.setStrokeColor(colour)
+        pdf.setDash(VECTOR_DASHES[linestyle])
+        line = pdf.beginPath()
+        line.moveTo(xs[0], ys[0])
+        for px, py in zip(xs[1:], ys[1:]):
+            line.lineTo(px, py)
+        pdf.drawPath(line, stroke=1, fill=0)
+    pdf.restoreState()
+
+    #the frame of the axes and the x axis ticks (the y axis is hidden, as RFU units are arbitrary)
+    pdf.setStrokeColor("black")
+    pdf.setFillColor("black")
+    pdf.setLineWidth(0.5)
+    pdf.setDash([])
+    pdf.rect(left, bottom, axesWidth, axesHeight, stroke=1, fill=0)
+    pdf.setFont("Helvetica", VECTOR_FONT_SIZE)
+    for tick in AutoLocator().tick_values(xMin, xMax):
+        if tick < xMin or tick > xMax:
+            continue
+        px = left + (tick - xMin) * xScale
+        pdf.line(px, bottom, px, bottom - VECTOR_TICK_LENGTH)
+        pdf.drawCentredString(px, bottom - VECTOR_TICK_LENGTH - VECTOR_FONT_SIZE, '%g' % tick)
+    pdf.restoreState()
+    return
+
+
+def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
+    root = Tkinter.Tk()
+    root.withdraw()
+    tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+This .py file stores the functions used to keep the results of every analysed plate in
+one SQLite database, so that screens can be compared across runs without reading every
+run's output files again.
+
+Each plate analysed in a batch is added to the database (nothing is ever replaced, so
+analysing a file again adds it again), with its control outcomes and thresholds, the Tm,
+error and replicates of every condition (mean well), and the Tm and discard reasons of
+every well. A plate is added in a single transaction, so the database never holds part
+of a plate.
+
+The protein name of a plate is the first word of its file name (as for DeleteInputFiles),
+and its run date is the date the results file was last modified.
+
+"""
+
+import os
+import json
+import time
+import sqlite3
+
+from MeltdownException import MeltdownException
+import dsfReader
+
+#changed whenever the tables change, a database made by a different version is not added to
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plates (
+    id INTEGER PRIMARY KEY,
+    fileName TEXT NOT NULL,
+    filePath TEXT NOT NULL,
+    proteinName TEXT,
+    runDate TEXT,
+    analysedAt TEXT NOT NULL,
+    meltdownVersion TEXT,
+    wells INTEGER,
+    lysozymeControl TEXT,
+    noDyeControl TEXT,
+    noProteinControl TEXT,
+    tmRefinement TEXT,
+    thresholds TEXT
+);
+CREATE TABLE IF NOT EXISTS conditions (
+    plateId INTEGER NOT NULL REFERENCES plates(id),
+    cv1 TEXT,
+    cv2 TEXT,
+    ph REAL,
+    isControl INTEGER,
+    tm REAL,
+    tmError REAL,
+    isComplex INTEGER,
+    replicates TEXT,
+    replicatesNotDiscarded INTEGER
+);
+CREATE TABLE IF NOT EXISTS wells (
+    plateId INTEGER NOT NULL REFERENCES plates(id),
+    well TEXT NOT NULL,
+    cv1 TEXT,
+    cv2 TEXT,
+    ph REAL,
+    isControl INTEGER,
+    tm REAL,
+    isOutlier INTEGER,
+    isSaturated INTEGER,
+    isMonotonic INTEGER,
+    isInTheNoise INTEGER,
+    isComplex INTEGER,
+    isDiscarded INTEGER
+);
+CREATE INDEX IF NOT EXISTS platesByProtein ON plates (proteinName);
+CREATE INDEX IF NOT EXISTS platesByRunDate ON plates (runDate);
+CREATE INDEX IF NOT EXISTS conditionsByCondition ON conditions (cv1, cv2, ph);
+CREATE INDEX IF NOT EXISTS conditionsByPlate ON conditions (plateId);
+CREATE INDEX IF NOT EXISTS wellsByPlate ON wells (plateId);
+"""
+
+
+def openDatabase(databaseFilePath):
+    """
+    Opens the results database, creating it if it doesn't exist
+
+    Output: Returns the sqlite3 connection
+    """
+    try:
+        connection = sqlite3.connect(databaseFilePath)
+        #contents maps and file names are read as bytestrings, which may not be ascii (e.g. a buffer in µM)
+        connection.text_factory = str
+        version = connection.execute('PRAGMA user_version').fetchone()[0]
+        if version == 0:
+            connection.executescript(SCHEMA)
+            connection.execute('PRAGMA user_version = ' + str(SCHEMA_VERSION))
+            connection.commit()
+        elif version != SCHEMA_VERSION:
+            connection.close()
+            raise MeltdownException('The results database "' + databaseFilePath + '" was made by a different version of meltdown')
+    except sqlite3.Error as e:
+        raise MeltdownException('There was a problem opening the results database "' + databaseFilePath + '"\n' + str(e))
+    return connection
+
+
+def proteinName(dataFilePath):
+    #the protein name is assumed to be the first word of the file name
+    words = os.path.basename(dataFilePath).split()
+    if len(words) == 0:
+        return None
+    return words[0]
+
+
+def addPlate(connection, dataFilePath, results):
+    """
+    Adds the results of a plate to the database, in one transaction
+
+    Input: the database connection, the plate's results file, and the plate's results (see DsfAnalysis.results)
+
+    Output: Returns the id of the plate in the database
+    """
+    dataFilePath = dsfReader.sourceFilePath(dataFilePath)
+    plate = results["Plate"]
+    wells = results["Wells"]
+    meanWells = results["Mean Wells"]
+    try:
+        runDate = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(os.path.getmtime(dataFilePath)))
+    except OSError:
+        runDate = None
+    try:
+        with connection:
+            cursor = connection.execute('INSERT INTO plates (fileName, filePath, proteinName, runDate, analysedAt, meltdownVersion, '
+                                        'wells, lysozymeControl, noDyeControl, noProteinControl, tmRefinement, thresholds) '
+                                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                        (os.path.basename(dataFilePath), os.path.abspath(dataFilePath), proteinName(dataFilePath),
+                                         runDate, time.strftime('%Y-%m-%d %H:%M:%S'), plate["Meltdown Version"], plate["Wells"],
+                                         plate["Controls"]["Lysozyme"], plate["Controls"]["No Dye"], plate["Controls"]["No Protein"],
+                                         plate["Tm Refinement"], json.dumps(plate["Thresholds"], sort_keys=True)))
+            plateId = cursor.lastrowid
+            connection.executemany('INSERT INTO conditions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   zip([plateId] * len(meanWells["Cv1"]), meanWells["Cv1"], meanWells["Cv2"], meanWells["pH"],
+                                       meanWells["Control"], meanWells["Tm"], meanWells["Tm Error"], meanWells["Complex"],
+                                       [','.join(replicates) for replicates in meanWells["Replicates"]],
+                                       meanWells["Replicates Not Discarded"]))
+            connection.executemany('INSERT INTO wells VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   zip([plateId] * len(wells["Well"]), wells["Well"], wells["Cv1"], wells["Cv2"], wells["pH"],
+                                       wells["Control"], wells["Tm"], wells["Outlier"], wells["Saturated"], wells["Monotonic"],
+                                       wells["In The Noise"], wells["Complex"], wells["Discarded"]))
+    except sqlite3.Error as e:
+        raise MeltdownException('There was a problem adding the results to the results database\n' + str(e))
+    return plateId
+
+
+def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
+    root = Tkinter.Tk()
+    root.withdraw()
+    tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+This .py file stores the functions used to measure runs of meltdown, so that when a batch
+slows down the stage or plate responsible can be found. Every analysis times its stages
+(reading the data, each analysis stage, the mean wells, the parts of the report and each
+output) in wall clock and processor seconds, which only costs a few clock reads per stage.
+
+The metrics of a plate are its stages' timings and counters of the work done on each of
+its wells, the metrics of a batch are the timings of every plate summed up by stage, with
+the slowest plate of each stage. Both are written as json. A stage run inside another
+(e.g. the mean wells made for the report) counts towards both.
+
+"""
+
+import os
+import sys
+import time
+import json
+
+#changed whenever the layout of the metrics json changes
+METRICS_FORMAT_VERSION = 1
+
+#names of the stages that are timed, besides the plate's analysis stages (see DsfPlate.STAGES)
+CONTENTS_MAP = 'contentsMap'
+READ_DATA = 'readData'
+NEGATIVE_CONTROLS = 'negativeControls'
+MEAN_WELLS = 'meanWells'
+NORMALISED_DATA = 'normalisedData'
+TM_DATA = 'tmData'
+WELL_STATUS_DATA = 'wellStatusData'
+RESULTS_JSON = 'resultsJson'
+REPORT = 'report'
+#parts of the report, the rest of the report's time is spent laying out its pages
+REPORT_SUMMARY_GRAPH = 'reportSummaryGraph'
+REPORT_PLATE_MAP = 'reportPlateMap'
+REPORT_CURVE_GRAPHS = 'reportCurveGraphs'
+REPORT_SAVE = 'reportSave'
+
+
+def cpuSeconds():
+    #processor seconds (user and system) used by this process so far
+    times = os.times()
+    return times[0] + times[1]
+
+
+def peakMemory():
+    #the peak resident memory of this process so far in MB, None where it can't be found (windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #linux gives kilobytes, mac os bytes
+    if sys.platform == 'darwin':
+        return peak / 1048576.0
+    return peak / 1024.0
+
+
+class StageTimer:
+    def __init__(self):
+        #the stages in the order they were first run, and the calls, wall clock and processor seconds of each,
+        #a stage that is run more than once has its times added up
+        self.stageNames = []
+        self.calls = {}
+        self.seconds = {}
+        self.cpuSeconds = {}
+        #the process's peak memory when each stage last finished
+        self.peakMemory = {}
+        #(wall clock, processor) times the stages that are running were started at
+        self.__started = {}
+        return
+
+    def start(self, stage):
+        self.__started[stage] = (time.time(), cpuSeconds())
+        return
+
+    def stop(self, stage):
+        startTime, startCpuTime = self.__started.pop(stage)
+        if stage not in self.calls:
+            self.stageNames.append(stage)
+            self.calls[stage] = 0
+            self.seconds[stage] = 0.0
+            self.cpuSeconds[stage] = 0.0
+        self.calls[stage] += 1
+        self.seconds[stage] += time.time() - startTime
+        self.cpuSeconds[stage] += cpuSeconds() - startCpuTime
+        self.peakMemory[stage] = peakMemory()
+        return
+
+    def time(self, stage, function, *args):
+        #runs a stage, recording how long it took, and returns what it returned
+        #a stage that fails is still recorded, so the metrics show where the analysis stopped
+        self.start(stage)
+        try:
+            value = function(*args)
+        finally:
+            self.stop(stage)
+        return value
+
+    def stages(self):
+        #the timings of every stage, in the order they were first run
+        return [{"Stage": stage,
+                 "Calls": self.calls[stage],
+                 "Seconds": self.seconds[stage],
+                 "Cpu Seconds": self.cpuSeconds[stage],
+                 "Peak Memory MB": self.peakMemory[stage]} for stage in self.stageNames]
+
+
+def plateMetrics(experiment, dataFilePath, seconds, version, profileFilePath=None):
+    """
+    The metrics of a plate's analysis
+
+    Input: the DsfAnalysis, the plate's results file, the seconds the whole run of the plate took,
+    the version of meltdown, and the file the run's profile was saved to (if it was profiled)
+
+    Output: Returns a dictionary of the plate, its stages' timings, and the counters of each well
+    """
+    metrics = {"Metrics Format Version": METRICS_FORMAT_VERSION,
+               "Meltdown Version": version,
+               "File": os.path.basename(dataFilePath),
+               "Seconds": seconds,
+               "Stages": experiment.timer.stages(),
+               "Profile": profileFilePath}
+    if experiment.plate is not None:
+        metrics["Wells"] = len(experiment.plate.wellNames)
+        metrics["Temperatures"] = len(experiment.plate.temperatures)
+        metrics["Well Counters"] = dict([(counter, dict(zip(experiment.plate.wellNames, [int(value) for value in values])))
+                                         for counter, values in experiment.plate.wellCounters().items()])
+    return metrics
+
+
+def writeMetrics(metrics, filePath):
+    with open(filePath, 'w') as fp:
+        json.dump(metrics, fp, indent=1, sort_keys=True)
+    return
+
+
+def batchMetrics(results, totalSeconds, version):
+    """
+    The metrics of a batch, each plate's time and slowest stage (slowest plate first), and each
+    stage's time over every plate, with the plate it was slowest on
+
+    Input: the FileResults of the batch (see meltdownRunner), the seconds the batch took, and the version of meltdown
+
+    Output: Returns a dictionary of the batch's metrics
+    """
+    plates = []
+    stageNames = []
+    stagesByName = {}
+    for result in results:
+        slowestStage = None
+        for stage in result.stages:
+            name = stage["Stage"]
+            if name not in stagesByName:
+                stageNames.append(name)
+                stagesByName[name] = {"Stage": name, "Plates": 0, "Seconds": 0.0, "Cpu Seconds": 0.0,
+                                      "Slowest Seconds": 0.0, "Slowest File": None}
+            batchStage = stagesByName[name]
+            batchStage["Plates"] += 1
+            batchStage["Seconds"] += stage["Seconds"]
+            batchStage["Cpu Seconds"] += stage["Cpu Seconds"]
+            if batchStage["Slowest File"] is None or stage["Seconds"] > batchStage["Slowest Seconds"]:
+                batchStage["Slowest Seconds"] = stage["Seconds"]
+                batchStage["Slowest File"] = os.path.basename(result.filePath)
+            if slowestStage is None or stage["Seconds"] > slowestStage["Seconds"]:
+                slowestStage = stage
+        plates.append({"File": os.path.basename(result.filePath),
+                       "Succeeded": result.succeeded,
+                       "Seconds": result.seconds,
+                       "Slowest Stage": None if slowestStage is None else slowestStage["Stage"]})
+    stages = [stagesByName[name] for name in stageNames]
+    for stage in stages:
+        stage["Mean Seconds"] = stage["Seconds"] / stage["Plates"]
+    return {"Metrics Format Version": METRICS_FORMAT_VERSION,
+            "Meltdown Version": version,
+            "Files": len(results),
+            "Failed": len([result for result in results if not result.succeeded]),
+            "Seconds": totalSeconds,
+            "Plates": sorted(plates, key=lambda plate: -plate["Seconds"]),
+            "Stages": stages}
+
+
+def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
+    root = Tkinter.Tk()
+    root.withdraw()
+    tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+This .py file stores the functions used to make synthetic DSF plates, a results file
+and a matching contents map, for benchmarking meltdown on plates of any size without
+needing real screens (see meltdownBenchmark).
+
+Every plate has lysozyme, no dye, no protein and protein as supplied controls, then
+conditions made from buffers, pHs and salts, each condition having REPLICATES wells.
+Most wells melt as a sigmoid (with the slow fall of the dye after it), with some of
+every kind of well meltdown has to deal with mixed in: saturated, monotonic, noisy
+and biphasic curves, and replicates that melt well away from the rest of their group.
+The no dye and no protein wells follow their reference curves. Plates are made from a
+seed, so the same plate is made every time.
+
+"""
+
+import numpy as np
+
+from ContentsMap import LYSOZYME, NO_DYE, PROTEIN_AS_SUPPLIED, NO_PROTEIN
+import referenceCurves as rc
+import dsfReader
+from plateFormats import plateWellNames
+
+#temperature range of the plates (the same as the qPCR machine's exports)
+START_TEMPERATURE = 20.0
+END_TEMPERATURE = 100.0
+
+#number of wells of each condition
+REPLICATES = 3
+
+#the conditions are every combination of these, in order, until the plate is full
+BUFFERS = ['Citrate', 'Acetate', 'MES', 'Phosphate', 'HEPES', 'Tris', 'Bicine', 'CHES']
+PH_VALUES = [4.0, 4.5, 5.0, 5.5, 6.0, 6.5, 7.0, 7.5, 8.0, 8.5, 9.0, 9.5]
+SALTS = ['', '50mM NaCl', '200mM NaCl', '500mM NaCl']
+
+#the kinds of curve on the plates
+NORMAL = 'normal'
+SATURATED = 'saturated'
+MONOTONIC = 'monotonic'
+NOISY = 'noisy'
+BIPHASIC = 'biphasic'
+OUTLIER = 'outlier'
+#fraction of the conditions whose wells are of each kind, the rest are normal. Outliers are single wells of
+#normal conditions, there is at most one per condition
+KIND_FRACTIONS = {SATURATED: 0.04, MONOTONIC: 0.04, NOISY: 0.04, BIPHASIC: 0.04, OUTLIER: 0.04}
+
+#range of the Tms of the conditions, how far the replicates' Tms are spread, and how far outliers are from their replicates
+TM_RANGE = (40.0, 75.0)
+REPLICATE_TM_SD = 0.3
+OUTLIER_TM_SHIFT = (12.0, 20.0)
+#range of how sharp the conditions' melts are (degrees)
+MELT_WIDTH_RANGE = (1.0, 3.0)
+#range of the lowest fluorescence of a curve, and the noise on every reading (as a fraction of it)
+BASE_FLUORESCENCE_RANGE = (1000.0, 5000.0)
+READING_NOISE = 0.0005
+#range of the mean fluorescence of the no dye and no protein wells, which is much lower than the protein's
+NEGATIVE_CONTROL_FLUORESCENCE_RANGE = (300.0, 800.0)
+#the noisy wells are weak melts (e.g. with little protein left in solution), this is their fluorescence as a fraction
+#of a normal well's, and the noise on them
+NOISY_WELL_FLUORESCENCE = 0.05
+NOISY_WELL_NOISE = 0.01
+#mean Tm of the lysozyme controls
+LYSOZYME_TM = 70.9
+
+
+def conditions(numConditions):
+    """
+    The contents of a plate's conditions, the four controls first
+
+    Output: Returns a list of (condition variable 1, condition variable 2, pH, control) tuples
+    """
+    allConditions = [(control.title(), '', '', 1) for control in [LYSOZYME, NO_DYE, NO_PROTEIN, PROTEIN_AS_SUPPLIED]]
+    #conditions beyond every combination reuse the buffers, numbered
+    combinations = [(buffer, salt, ph) for buffer in BUFFERS for ph in PH_VALUES for salt in SALTS]
+    i = 0
+    while len(allConditions) < numConditions:
+        buffer, salt, ph = combinations[i % len(combinations)]
+        if i >= len(combinations):
+            buffer += ' ' + str(i // len(combinations) + 1)
+        allConditions.append((buffer, salt, ph, ''))
+        i += 1
+    return allConditions[:numConditions]
+
+
+class SyntheticPlate:
+    def __init__(self, wellNames, temperatures):
+        #a generated plate, its curves are held as a (wells, temperatures) array like DsfPlate's
+        self.wellNames = wellNames
+        self.temperatures = temperatures
+        self.fluorescence = np.zeros((len(wellNames), len(temperatures)))
+        #the (condition variable 1, condition variable 2, pH, control) of each well
+        self.contents = []
+        #the kind of curve each well was given
+        self.kinds = []
+        return
+
+
+def meltCurve(temperatures, tm, base, width):
+    #fluorescence rising as the protein unfolds around the tm, while the dye slowly fades
+    return base * (1 + 3 / (1 + np.exp(-(temperatures - tm) / width))) * np.exp(-(temperatures - START_TEMPERATURE) / 60.0)
+
+
+def wellCurve(kind, temperatures, tm, width, rng):
+    #the raw fluorescence of a well of the given kind, melting at tm over about width degrees
+    base = rng.uniform(*BASE_FLUORESCENCE_RANGE)
+    curve = meltCurve(temperatures, tm, base, width)
+    if kind == MONOTONIC:
+        curve = base * np.exp(-(temperatures - START_TEMPERATURE) / 30.0)
+    elif kind == NOISY:
+        base = base * NOISY_WELL_FLUORESCENCE
+        curve = meltCurve(temperatures, tm, base, width) + rng.normal(0, base * NOISY_WELL_NOISE, len(temperatures))
+    elif kind == BIPHASIC:
+        #a second domain unfolding after the first
+        curve = curve + base * 2 / (1 + np.exp(-(temperatures - tm - 15) / 1.5))
+    curve = np.abs(curve + rng.normal(0, base * READING_NOISE, len(temperatures))) + 1
+    if kind == SATURATED:
+        #the readings are capped by the detector, giving a long flat top
+        curve = np.minimum(curve, np.percentile(curve, 60))
+    return curve
+
+
+def referenceCurve(controlName, temperatures, rng):
+    #a control well following its reference curve, resampled onto the plate's temperatures
+    reference = rc.getReferenceCurve(controlName)
+    curve = np.interp(temperatures, reference.temperatures, reference.fluorescence)
+    curve = curve / curve.mean() * rng.uniform(*NEGATIVE_CONTROL_FLUORESCENCE_RANGE)
+    return curve * (1 + rng.normal(0, READING_NOISE, len(temperatures)))
+
+
+def generatePlate(numWells=96, temperatureStep=0.5, seed=0, kindFractions=KIND_FRACTIONS):
+    """
+    Makes a synthetic plate
+
+    Input: the number of wells, the step between temperatures, the seed of the random numbers,
+    and the fraction of the condition wells of each kind of curve (see KIND_FRACTIONS)
+
+    Output: Returns a SyntheticPlate
+    """
+    rng = np.random.RandomState(seed)
+    temperatures = np.arange(START_TEMPERATURE, END_TEMPERATURE + temperatureStep / 2.0, temperatureStep)
+    plate = SyntheticPlate(plateWellNames(numWells), temperatures)
+    #wells left over after the last full set of replicates join the last condition
+    numConditions = max(1, numWells // REPLICATES)
+    conditionKinds = [kind for kind in sorted(kindFractions) if kind != OUTLIER]
+    conditionFractions = np.cumsum([kindFractions[kind] for kind in conditionKinds])
+    index = 0
+    for conditionIndex, contents in enumerate(conditions(numConditions)):
+        numReplicates = REPLICATES if conditionIndex < numConditions - 1 else numWells - index
+        isControl = contents[3] != ''
+        #every replicate of a condition has the same kind of curve (e.g. the protein aggregates in the condition's buffer),
+        #only the conditions' wells are given other kinds, so the controls are usable
+        kind = NORMAL
+        draw = rng.uniform()
+        if not isControl and draw < conditionFractions[-1]:
+            kind = conditionKinds[np.searchsorted(conditionFractions, draw, side='right')]
+        #one replicate of a condition may melt well away from the others
+        outlier = -1
+        if not isControl and kind == NORMAL and numReplicates >= 3 and rng.uniform() < kindFractions.get(OUTLIER, 0) * numReplicates:
+            outlier = rng.randint(numReplicates)
+        tm = LYSOZYME_TM if contents[0].lower() == LYSOZYME else rng.uniform(*TM_RANGE)
+        width = rng.uniform(*MELT_WIDTH_RANGE)
+        for replicate in range(numReplicates):
+            if contents[0].lower() in (NO_DYE, NO_PROTEIN):
+                curve = referenceCurve(contents[0].lower(), temperatures, rng)
+            elif replicate == outlier:
+                curve = wellCurve(NORMAL, temperatures, tm + rng.choice([-1, 1]) * rng.uniform(*OUTLIER_TM_SHIFT), width, rng)
+            else:
+                curve = wellCurve(kind, temperatures, tm + rng.normal(0, REPLICATE_TM_SD), width, rng)
+            plate.fluorescence[index] = curve
+            plate.contents.append(contents)
+            plate.kinds.append(OUTLIER if replicate == outlier else kind)
+            index += 1
+    return plate
+
+
+def writeDsfFile(filePath, plate):
+    #the plate's curves as a DSF results file, laid out as the qPCR machine exports them
+    with open(filePath, 'w') as fp:
+        fp.write(dsfReader.TEMPERATURE_COLUMN + '\t' + '\t'.join(plate.wellNames) + '\n')
+        for temperature, readings in zip(plate.temperatures, plate.fluorescence.T):
+            fp.write(repr(temperature) + '\t' + '\t'.join([repr(reading) for reading in readings]) + '\n')
+    return
+
+
+def writeContentsMap(filePath, plate):
+    #the plate's contents as a tab delimited contents map
+    with open(filePath, 'w') as fp:
+        fp.write('Well\tCondition Variable 1\tCondition Variable 2\tpH\td(pH)/dT\tControl\n')
+        for wellName, (cv1, cv2, ph, control) in zip(plate.wellNames, plate.contents):
+            fp.write('\t'.join([wellName, cv1, cv2, str(ph), '', str(control)]) + '\n')
+    return
+
+
+def writePlate(dataFilePath, contentsMapFilePath, numWells=96, temperatureStep=0.5, seed=0, kindFractions=KIND_FRACTIONS):
+    """
+    Makes a synthetic plate and writes its results file and contents map
+
+    Output: Returns the SyntheticPlate
+    """
+    plate = generatePlate(numWells, temperatureStep, seed, kindFractions)
+    writeDsfFile(dataFilePath, plate)
+    writeContentsMap(contentsMapFilePath, plate)
+    return plate
+
+
+def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
+    root = Tkinter.Tk()
+    root.withdraw()
+    tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
+    return
+
+
+if __name__ == "__main__":
+    main()
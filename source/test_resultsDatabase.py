@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+Checks of the results database (see resultsDatabase), run with
+python -m unittest test_resultsDatabase from the source folder.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from DsfAnalysis import DsfAnalysis
+import resultsDatabase
+import syntheticPlates
+
+#condition variables that aren't ascii, as a contents map saved as utf-8 has them
+NON_ASCII_CV1 = 'Sel \xc3\xa9tude'
+NON_ASCII_CV2 = '50 \xc2\xb5M NaCl'
+
+
+class ResultsDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        return
+
+    def test_nonAsciiContentsMap(self):
+        plate = syntheticPlates.generatePlate(numWells=96, seed=2)
+        #the last condition's wells are given non ascii condition variables
+        last = plate.contents[-1]
+        numLastWells = plate.contents.count(last)
+        plate.contents = [(NON_ASCII_CV1, NON_ASCII_CV2, ph, control) if (cv1, cv2, ph, control) == last
+                          else (cv1, cv2, ph, control) for cv1, cv2, ph, control in plate.contents]
+        dataFilePath = os.path.join(self.directory, 'prot\xc3\xa9ine plate.txt')
+        contentsMapFilePath = os.path.join(self.directory, 'contents.txt')
+        syntheticPlates.writeDsfFile(dataFilePath, plate)
+        syntheticPlates.writeContentsMap(contentsMapFilePath, plate)
+
+        experiment = DsfAnalysis(os.path.basename(dataFilePath))
+        experiment.loadCurves(dataFilePath, contentsMapFilePath)
+        experiment.analyseWells()
+        connection = resultsDatabase.openDatabase(os.path.join(self.directory, 'results.db'))
+        plateId = resultsDatabase.addPlate(connection, dataFilePath, experiment.results('test'))
+
+        self.assertEqual(connection.execute('SELECT proteinName FROM plates WHERE id = ?', (plateId,)).fetchone()[0],
+                         'prot\xc3\xa9ine')
+        self.assertEqual(connection.execute('SELECT COUNT(*) FROM conditions WHERE plateId = ? AND cv1 = ? AND cv2 = ?',
+                                            (plateId, NON_ASCII_CV1, NON_ASCII_CV2)).fetchone()[0], 1)
+        self.assertEqual(connection.execute('SELECT COUNT(*) FROM wells WHERE plateId = ? AND cv1 = ?',
+                                            (plateId, NON_ASCII_CV1)).fetchone()[0], numLastWells)
+        connection.close()
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
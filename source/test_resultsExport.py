@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+Checks of the results json (see DsfAnalysis.produceResultsJson), run with
+python -m unittest test_resultsExport from the source folder.
+
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from DsfAnalysis import DsfAnalysis
+import replicateHandling as rh
+import syntheticPlates
+
+
+class ResultsJsonTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        return
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        return
+
+    def test_identicalReplicateTmsHaveNoError(self):
+        #the variance of identical numbers can come out a tiny bit below zero, which must not give a nan sd
+        self.assertEqual(rh.meanSd([53.08] * 3)[1], 0.0)
+        return
+
+    def test_replicatesSharingOneTm(self):
+        #every replicate of a condition is given the same curve, so they all have the same tm
+        plate = syntheticPlates.generatePlate(numWells=96, seed=1, kindFractions={syntheticPlates.NORMAL: 0.0})
+        first = {}
+        for index, contents in enumerate(plate.contents):
+            plate.fluorescence[index] = plate.fluorescence[first.setdefault(contents, index)]
+        dataFilePath = os.path.join(self.directory, 'plate.txt')
+        contentsMapFilePath = os.path.join(self.directory, 'contents.txt')
+        syntheticPlates.writeDsfFile(dataFilePath, plate)
+        syntheticPlates.writeContentsMap(contentsMapFilePath, plate)
+
+        experiment = DsfAnalysis('plate.txt')
+        experiment.loadCurves(dataFilePath, contentsMapFilePath)
+        experiment.analyseWells()
+        resultsFilePath = os.path.join(self.directory, 'plate-results.json')
+        experiment.produceResultsJson(resultsFilePath, 'test')
+        with open(resultsFilePath) as fp:
+            results = json.load(fp)
+
+        meanWells = results["Mean Wells"]
+        tmErrors = [(tm, tmError) for tm, tmError in zip(meanWells["Tm"], meanWells["Tm Error"]) if tm is not None]
+        self.assertTrue(tmErrors)
+        for tm, tmError in tmErrors:
+            self.assertAlmostEqual(tmError, 0.0, places=4)
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Synopsis:
+This .py file stores the functions used to see how the analysis of a set of plates
+changes with its thresholds, e.g. when tuning them for a new instrument. A grid of
+threshold settings is evaluated on every plate, and a table of the outcome of each
+setting on each plate (wells discarded by reason, Tms found, mean Tm error, controls)
+is returned, rather than editing the constants and rerunning meltdown for each one.
+
+Each plate is only read and analysed once, the grid's settings are then applied to
+it one after another, so only the analysis stages using the thresholds that changed
+are redone (see DsfPlate.THRESHOLD_STAGES). Plates are swept in parallel.
+
+"""
+
+import os
+import csv
+import itertools
+import multiprocessing
+import traceback
+import numpy as np
+
+from DsfAnalysis import DsfAnalysis
+from DsfPlate import STAGES, THRESHOLD_STAGES
+from DsfWell import MONOTONIC, COMPLEX, OUTLIER, IN_THE_NOISE, SATURATED, DISCARDED
+from ContentsMap import NO_DYE, NO_PROTEIN
+import curveClassification as cc
+import referenceCurves as rc
+import dsfReader
+from MeltdownException import MeltdownException
+
+#columns of the outcome of a setting on a plate, after the plate's file and the thresholds of the setting
+OUTCOME_COLUMNS = ['Wells', 'Outliers', 'Saturated', 'Monotonic', 'In The Noise', 'Discarded', 'Complex',
+                   'Tms Found', 'Mean Tm Error', 'Lysozyme Control', 'No Dye Control', 'No Protein Control']
+
+
+def thresholdGrid(**thresholdValues):
+    """
+    Makes every combination of the given threshold values, ordered so that the thresholds of the
+    earliest analysis stages change least often (so the fewest stages are rerun between settings)
+
+    Input: lists of values, keyed by the names of the thresholds (see DsfPlate.THRESHOLD_STAGES)
+    e.g. thresholdGrid(SIMILARITY_THRESHOLD=[0.005, 0.01], SIGN_CHANGE_THRESH=[0.001, 0.002])
+
+    Output: Returns a list of dictionaries of threshold name to value
+    """
+    for name in thresholdValues:
+        if name not in THRESHOLD_STAGES:
+            raise MeltdownException('Unknown threshold "' + name + '", thresholds are: ' + ', '.join(sorted(THRESHOLD_STAGES.keys())))
+    names = sorted(thresholdValues.keys(), key=lambda name: (STAGES.index(THRESHOLD_STAGES[name]), name))
+    return [dict(zip(names, values)) for values in itertools.product(*[thresholdValues[name] for name in names])]
+
+
+def plateOutcome(experiment):
+    #the outcome of an analysis, as a dictionary keyed by OUTCOME_COLUMNS
+    plate = experiment.plate
+    tmErrors = [meanWell.tmError for meanWell in experiment.meanWells if meanWell.tmError is not None]
+    return {'Wells': len(plate.wellNames),
+            'Outliers': int(plate.flagged(OUTLIER).sum()),
+            'Saturated': int(plate.flagged(SATURATED).sum()),
+            'Monotonic': int(plate.flagged(MONOTONIC).sum()),
+            'In The Noise': int(plate.flagged(IN_THE_NOISE).sum()),
+            'Discarded': int(plate.flagged(DISCARDED).sum()),
+            'Complex': int((plate.flagged(COMPLEX) & plate.notFlagged(DISCARDED)).sum()),
+            'Tms Found': int((~np.isnan(plate.tms) & plate.notFlagged(DISCARDED)).sum()),
+            'Mean Tm Error': np.mean(tmErrors) if len(tmErrors) > 0 else None,
+            'Lysozyme Control': experiment.controlsHash['lysozyme'],
+            'No Dye Control': experiment.controlsHash['no dye'],
+            'No Protein Control': experiment.controlsHash['no protein']}
+
+
+class SweepResult:
+    def __init__(self, filePath):
+        #the outcomes of every setting of a sweep on one results file
+        self.filePath = filePath
+        self.succeeded = False
+        #one dictionary per setting, of the setting's thresholds and its outcome (see OUTCOME_COLUMNS)
+        self.rows = []
+        #error message if the plate couldn't be analysed, and the full traceback if the error was unexpected
+        self.message = ''
+        self.errorLog = ''
+        return
+
+
+def sweepFile(rfuFilepath, contentsMapFilepath, grid, settings):
+    """
+    Analyses one results file with every setting of a threshold grid. This can be run in a
+    worker process, so all errors are caught and returned rather than raised
+
+    Input: the results file and contents map, the list of settings (see thresholdGrid), and the
+    analysis options (TmRefinement, TmDecimalPlaces, CacheParsedData and the reference curves,
+    as read by meltdownRunner.readSettings)
+
+    Output: Returns a SweepResult
+    """
+    result = SweepResult(rfuFilepath)
+    try:
+        if settings.get('NoDyeReferenceCurve'):
+            rc.registerReferenceCurveFile(NO_DYE, settings['NoDyeReferenceCurve'])
+        if settings.get('NoProteinReferenceCurve'):
+            rc.registerReferenceCurveFile(NO_PROTEIN, settings['NoProteinReferenceCurve'])
+        experiment = DsfAnalysis(os.path.basename(dsfReader.sourceFilePath(rfuFilepath)),
+                                 settings.get('TmRefinement', cc.TM_REFINEMENT),
+                                 settings.get('TmDecimalPlaces', cc.TM_DECIMAL_PLACES))
+        experiment.loadCurves(rfuFilepath, contentsMapFilepath, settings.get('CacheParsedData', False))
+        for thresholds in grid:
+            experiment.setThresholds(**thresholds)
+            #only the stages using thresholds that changed since the last setting are rerun
+            experiment.analyseCurves()
+            row = {'File': os.path.basename(dsfReader.sourceFilePath(rfuFilepath))}
+            row.update(experiment.plate.thresholds)
+            row.update(plateOutcome(experiment))
+            result.rows.append(row)
+        result.succeeded = True
+    except MeltdownException as e:
+        result.message = e.message
+    except Exception as e:
+        result.message = 'Unexpected error: ' + (str(e) or type(e).__name__)
+        result.errorLog = traceback.format_exc()
+    return result
+
+
+def sweepFileTask(args):
+    #pool workers only pass a single argument
+    return sweepFile(*args)
+
+
+def sweepThresholds(allFilePaths, contentsMapFilepath, grid, settings={}, workers=1):
+    """
+    Analyses every results file with every setting of a threshold grid, the files being swept
+    in a pool of worker processes if more than one worker is given (0 uses every core)
+
+    Output: Returns the list of SweepResults, in the order of the files
+    """
+    if workers <= 0:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(allFilePaths))
+    tasks = [(rfuFilepath, contentsMapFilepath, grid, settings) for rfuFilepath in allFilePaths]
+    if workers > 1:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(sweepFileTask, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [sweepFileTask(task) for task in tasks]
+    return results
+
+
+def writeSweepTable(results, filePath):
+    #tab delimited table of every setting's outcome on every file, files that failed are listed at the end
+    thresholdNames = sorted(THRESHOLD_STAGES.keys(), key=lambda name: (STAGES.index(THRESHOLD_STAGES[name]), name))
+    columns = ['File'] + thresholdNames + OUTCOME_COLUMNS
+    with open(filePath, 'w') as fp:
+        fWriter = csv.writer(fp, delimiter='\t')
+        fWriter.writerow(columns)
+        for result in results:
+            for row in result.rows:
+                fWriter.writerow(['' if row[column] is None else row[column] for column in columns])
+        for result in results:
+            if not result.succeeded:
+                fWriter.writerow([os.path.basename(result.filePath), 'Failed: ' + result.message.replace('\n', ' ')])
+    return
+
+
+def main():
+    #only import tkinter when run directly, so that meltdown can be used without a display
+    import Tkinter, tkMessageBox
+    root = Tkinter.Tk()
+    root.withdraw()
+    tkMessageBox.showwarning("Inncorrect Usage", "Please read the instructions on how to run Meltdown")
+    return
+
+
+if __name__ == "__main__":
+    main()